@@ -7,7 +7,7 @@ from twitter.common import app, log
 from util import account_stage_key
 
 from aws_iam import get_authenticator
-from aws_organizations import get_account_tag, get_accounts
+from aws_organizations import get_account_tag, get_accounts, load_account_metadata
 from botocore.exceptions import ClientError
 from dataset_stagestore import Stagestore
 from server_config import (
@@ -23,6 +23,12 @@ app.add_option(
   "--aws-secret-access-key", default=None, dest="secret_key", help="AWS API secret access key."
 )
 app.add_option("--aws-token", default=None, dest="token", help="AWS API token.")
+app.add_option(
+  "--disk-cache-dir",
+  default=None,
+  dest="disk_cache_dir",
+  help="Directory of the on-disk caches shared across runs.",
+)
 app.add_option("--env", default="prod", help="DAL target env (staging or prod).")
 app.add_option(
   "--load-env-creds",
@@ -37,6 +43,7 @@ def main(args, options):
   ServerState({}, options.__dict__)
   aws_org_auth = get_authenticator(AWS_ORGANIZATION_ACCOUNT_ID)
   accounts = get_accounts(aws_org_auth)
+  account_metadata = load_account_metadata(aws_org_auth)
   stage_store = Stagestore(get_authenticator(DYNAMO_STAGES_TABLE_ACCOUNT_ID))
   status = defaultdict(
     lambda: {
@@ -60,7 +67,7 @@ def main(args, options):
     if status[account_id]["ACCESS_STATUS"] == "ACTIVE":
       try:
         default_project = get_account_tag(
-          aws_org_auth, account_id, AWS_ORGANIZATION_ACCOUNT_KITE_TAG
+          aws_org_auth, account_id, AWS_ORGANIZATION_ACCOUNT_KITE_TAG, account_metadata
         )
         status[account_id]["DEFAULT_KITE_PROJECT"] = default_project
       except ClientError as exception:
@@ -1,3 +1,5 @@
+from urllib.parse import urlparse
+
 from errors import AwsInvalidArn
 
 
@@ -62,3 +64,34 @@ class S3Arn(Arn):
     super().__init__('arn:aws:s3:::' + bucket_name)
     self.account_id = account_id
     self.region = region
+
+
+def sqs_queue_arn(url: str) -> Arn:
+  """
+  Derive the ARN of an SQS queue from its URL without calling `GetQueueAttributes`. Queue URLs
+  use the `https://sqs.{region}.amazonaws.com/{account_id}/{name}` format or the legacy
+  `https://{region}.queue.amazonaws.com/{account_id}/{name}` format.
+  """
+  parsed = urlparse(url)
+  host = parsed.hostname or ''
+  path = parsed.path.strip('/').split('/')
+  if len(path) != 2 or not all(path):
+    raise AwsInvalidArn(url)
+
+  if host.startswith('sqs.'):
+    region = host.split('.')[1]
+  elif host == 'queue.amazonaws.com':
+    region = 'us-east-1'
+  elif host.endswith('.queue.amazonaws.com'):
+    region = host.split('.')[0]
+  else:
+    raise AwsInvalidArn(url)
+
+  partition = 'aws'
+  if host.endswith('.cn'):
+    partition = 'aws-cn'
+  elif region.startswith('us-gov-'):
+    partition = 'aws-us-gov'
+
+  account_id, name = path
+  return Arn(':'.join(['arn', partition, 'sqs', region, account_id, name]))
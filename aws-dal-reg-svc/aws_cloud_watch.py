@@ -14,15 +14,23 @@ class CloudWatchReporter(Observable):
   def __init__(self, authenticator: AwsAuthenticator, namespace: str):
     self.client = authenticator.new_client("cloudwatch", AWS_CLOUD_WATCH_REGION)
     self.namespace = namespace
+    self.reported = {}
     self._metrics_submitted = self.metrics.register(AtomicGauge("metrics_submitted"))
+    self._metrics_unchanged = self.metrics.register(AtomicGauge("metrics_unchanged"))
     self._put_errors = self.metrics.register(AtomicGauge("put_errors"))
 
   def process(self, stats: Dict[str, int]):
+    # only metrics that changed since they were last submitted are sent
     for metric, value in stats.items():
+      if self.reported.get(metric) == value:
+        self._metrics_unchanged.increment()
+        continue
+
       account_id, name = parse_metric(metric)
-      self.put(account_id, name, value)
+      if self.put(account_id, name, value):
+        self.reported[metric] = value
 
-  def put(self, account_id: str, metric: str, value: int):
+  def put(self, account_id: str, metric: str, value: int) -> bool:
     try:
       self.client.put_metric_data(
         Namespace=self.namespace,
@@ -36,9 +44,11 @@ class CloudWatchReporter(Observable):
         ],
       )
       self._metrics_submitted.increment()
+      return True
     except ClientError as ex:
       log.error(f"unable to submit cloudwatch metric: {metric}. ex={ex}")
       self._put_errors.increment()
+      return False
 
 
 class CloudWatchStatsQuery:
@@ -0,0 +1,98 @@
+import concurrent.futures
+from threading import Event, Thread
+from typing import Iterator, List, Optional
+
+from twitter.common import log
+from twitter.common.metrics import AtomicGauge, Observable
+
+from aws_iam import AwsAuthenticator, get_authenticator
+from botocore.exceptions import ClientError
+from server_config import (
+  CREDENTIAL_BROKER_CONCURRENCY,
+  CREDENTIAL_REFRESH_INTVL,
+  FUTURE_TIMEOUTS,
+)
+
+
+class CredentialBroker(Observable):
+  """
+  Assumes the PDP role of every account concurrently, under the `sts` rate limit, and hands out
+  authenticators as soon as their credentials resolve. Accounts denying access resolve to `None`
+  and accounts that time out are skipped without delaying other accounts. Resolved credentials
+  are refreshed by a background thread before they expire so pipeline threads don't block on STS.
+  """
+
+  def __init__(self, accounts: List[str], concurrency: int = CREDENTIAL_BROKER_CONCURRENCY):
+    self.accounts = accounts
+    self.executor = concurrent.futures.ThreadPoolExecutor(
+      max_workers=concurrency, thread_name_prefix="credential-broker"
+    )
+    self.futures = {}
+    self.refresher = Thread(target=self.refresh_loop, name="credential-refresher", daemon=True)
+    self.shutdown_event = Event()
+    self._accounts_authenticated = self.metrics.register(AtomicGauge("accounts_authenticated"))
+    self._accounts_denied = self.metrics.register(AtomicGauge("accounts_denied"))
+    self._accounts_timed_out = self.metrics.register(AtomicGauge("accounts_timed_out"))
+    self._refresh_errors = self.metrics.register(AtomicGauge("refresh_errors"))
+    self._refreshes = self.metrics.register(AtomicGauge("refreshes"))
+
+  def authenticate(self, account_id: str) -> Optional[AwsAuthenticator]:
+    try:
+      auth = get_authenticator(account_id)
+    except ClientError as ex:
+      if ex.response["Error"]["Code"] in ("AccessDenied", "AccessDeniedException"):
+        log.error(f"Unable to authenticate to AWS account: {account_id}. ex={ex}")
+        self._accounts_denied.increment()
+        return None
+      raise ex
+
+    self._accounts_authenticated.increment()
+    return auth
+
+  def future(self, account_id: str) -> concurrent.futures.Future:
+    return self.futures[account_id]
+
+  def get(self, account_id: str) -> Optional[AwsAuthenticator]:
+    return self.futures[account_id].result(timeout=FUTURE_TIMEOUTS["scanner"])
+
+  def ready(self, timeout: float = FUTURE_TIMEOUTS["scanner"]) -> Iterator[str]:
+    """
+    Yield account IDs in the order their credentials resolve. Accounts whose credentials have not
+    resolved within `timeout` are skipped.
+    """
+    future_accounts = {future: account_id for account_id, future in self.futures.items()}
+    pending = set(future_accounts.keys())
+    try:
+      for future in concurrent.futures.as_completed(future_accounts.keys(), timeout=timeout):
+        pending.discard(future)
+        yield future_accounts[future]
+    except concurrent.futures.TimeoutError:
+      accounts = sorted(future_accounts[f] for f in pending)
+      log.error(f"Timed out authenticating to AWS accounts, skipping: {accounts}")
+      self._accounts_timed_out.add(len(accounts))
+
+  def refresh(self, auth: AwsAuthenticator):
+    # credentials within botocore's advisory refresh window are refreshed when read, reading them
+    # here moves the AssumeRole call off the pipeline threads.
+    if auth.session_creds.refresh_needed():
+      try:
+        auth.session_creds.get_frozen_credentials()
+        self._refreshes.increment()
+      except Exception as ex:
+        self._refresh_errors.increment()
+        log.error(f"Unable to refresh credentials of AWS account: {auth.account_id}. ex={ex}")
+
+  def refresh_loop(self):
+    while not self.shutdown_event.wait(CREDENTIAL_REFRESH_INTVL):
+      for future in list(self.futures.values()):
+        if future.done() and not future.exception() and future.result():
+          self.refresh(future.result())
+
+  def shutdown(self):
+    self.shutdown_event.set()
+    self.executor.shutdown(wait=False)
+
+  def start(self):
+    for account_id in self.accounts:
+      self.futures[account_id] = self.executor.submit(self.authenticate, account_id)
+    self.refresher.start()
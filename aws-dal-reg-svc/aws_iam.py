@@ -1,26 +1,36 @@
 import concurrent.futures
+import json
 from os import environ
-from time import sleep, time
-from typing import Dict, List, Optional, Set
+from copy import copy
+from random import random
+from threading import local, Lock
+from time import time
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Set, Tuple
+import zlib
 
 from twitter.common import log
-from twitter.common.metrics import AtomicGauge
+from twitter.common.metrics import AtomicGauge, Observable
 from twitter.common.metrics.metrics import Metrics
-from util import get_tss_json, jitter_ttl, rate_limit
+from util import account_stage_key, GaugeHistogram, get_tss_json, jitter_ttl
 
 from aws_arn import Arn
+from aws_iam_policy import IamPolicyEvaluator, UnsupportedPolicyElement
 from aws_resource import Resource, resources_by_service
 import boto3
 from boto3.session import Session
 from botocore.config import Config
 from botocore.credentials import RefreshableCredentials
 from botocore.exceptions import ClientError, ConnectionClosedError
+from botocore.loaders import Loader
 from botocore.parsers import ResponseParserError
 from botocore.session import get_session
 from datastore import Datastore
 from errors import AwsEnvCredRequired, AwsInvalidIamEntityType, AwsRegionRequired
+from rate_limiter import is_throttling_error, RateLimiter
+from retry_scheduler import RetryScheduler
 from server_config import (
   AWS_CLIENT_CONNECT_TIMEOUT,
+  AWS_CLIENT_MAX_POOL_CONNECTIONS,
   AWS_CLIENT_READ_TIMEOUT,
   AWS_CLIENT_RETRY_CONF,
   DYNAMO_ACCESS_CACHE_ACCOUNT_TTL,
@@ -28,18 +38,82 @@ from server_config import (
   DYNAMO_DEFAULT_ACCESS_CACHE_TTL,
   FUTURE_TIMEOUTS,
   GLOBAL_API_REGION,
-  IAM_ACCESS_SIML_RATE_LIMIT,
   IAM_API_DELAYED_RETRIES,
-  IAM_API_RETRY_DELAY_INTERVAL,
   IAM_MAX_API_FUTURES,
+  IAM_POLICY_EVAL_SPOT_CHECK_RATIO,
+  IAM_SIML_HISTOGRAM_BOUNDS,
+  IAM_SIML_MAX_ITEMS,
   PDP_ROLE_ARN_PATTERN,
+  RESOURCE_ACCESS_LEVELS,
   RESOURCE_ACCESS_POLICY_ACTIONS,
   SUPPORTED_IAM_ENTITIES,
   SVC_NAME,
 )
+from server_progress import ProgressTracker
 from server_state import ServerState
 
 
+class LoaderSearchPaths(list):
+  # boto3 sessions append their resource model path to the botocore session's loader
+  # every time they are created, which would grow the search paths of a shared loader.
+  def append(self, path: str):
+    if path not in self:
+      super().append(path)
+
+
+class AwsClientCache:
+  """
+  Process-wide cache of boto3 clients and resources keyed by account, role, service, region and
+  client configuration. Clients are thread safe and shared by all threads, which also shares
+  their connection pools. Resources are not thread safe and are cached per thread. All sessions
+  share one botocore data loader so service models are only loaded once.
+  """
+
+  _INSTANCE = None
+
+  def __new__(cls):
+    if not cls._INSTANCE:
+      cls._INSTANCE = object.__new__(cls)
+      cls._INSTANCE.clients = {}
+      cls._INSTANCE.loader = Loader(extra_search_paths=LoaderSearchPaths())
+      cls._INSTANCE.local = local()
+      cls._INSTANCE.lock = Lock()
+      cls._INSTANCE.metrics = {}
+      for m in ("client_hit", "clients_created", "resource_hit", "resources_created", "sts_calls"):
+        cls._INSTANCE.metrics[m] = AtomicGauge(f"aws_{m}")
+
+    return cls._INSTANCE
+
+  def register_metrics(cls, metrics: Metrics):
+    for _, gauge in cls._INSTANCE.metrics.items():
+      metrics.register(gauge)
+
+  def client(self, key: Tuple, factory: Callable[[], Any]) -> Any:
+    client = self.clients.get(key)
+    if client:
+      self.metrics["client_hit"].increment()
+      return client
+
+    with self.lock:
+      if key not in self.clients:
+        self.clients[key] = factory()
+        self.metrics["clients_created"].increment()
+      return self.clients[key]
+
+  def resource(self, key: Tuple, factory: Callable[[], Any]) -> Any:
+    if not hasattr(self.local, "resources"):
+      self.local.resources = {}
+
+    resource = self.local.resources.get(key)
+    if resource:
+      self.metrics["resource_hit"].increment()
+      return resource
+
+    self.local.resources[key] = factory()
+    self.metrics["resources_created"].increment()
+    return self.local.resources[key]
+
+
 class AwsAuthenticator:
   def __init__(
     self,
@@ -59,6 +133,7 @@ class AwsAuthenticator:
     )
 
   def assume_role(self) -> Dict[str, str]:
+    AwsClientCache().metrics["sts_calls"].increment()
     sts = boto3.client(
       "sts",
       aws_access_key_id=self.access_key,
@@ -67,12 +142,16 @@ class AwsAuthenticator:
       config=self.client_config(GLOBAL_API_REGION),
     )
 
-    role_arn_pattern = (
-      self.alt_role_arn_pattern if self.alt_role_arn_pattern else PDP_ROLE_ARN_PATTERN
-    )
-    resp = sts.assume_role(
-      RoleArn=role_arn_pattern.format(self.account_id), RoleSessionName=f"{SVC_NAME}-{time()}"
-    )["Credentials"]
+    RateLimiter().acquire("sts")
+    try:
+      resp = sts.assume_role(RoleArn=self.role_arn(), RoleSessionName=f"{SVC_NAME}-{time()}")[
+        "Credentials"
+      ]
+      RateLimiter().succeeded("sts")
+    except ClientError as ex:
+      if is_throttling_error(ex):
+        RateLimiter().throttled("sts")
+      raise ex
     credentials = {
       "access_key": resp["AccessKeyId"],
       "secret_key": resp["SecretAccessKey"],
@@ -82,9 +161,24 @@ class AwsAuthenticator:
 
     return credentials
 
+  def cache_key(self, obj_type: str, service: str, region: str) -> Tuple:
+    endpoint = None
+    if obj_type == "resource" and service == "dynamodb":
+      endpoint = ServerState().options.get("local_dynamodb_endpoint")
+    return (
+      self.access_key,
+      self.role_arn(),
+      obj_type,
+      service,
+      region,
+      ServerState().options.get("envoy_proxy_url"),
+      endpoint,
+    )
+
   def client_config(self, region: str = None):
     args = {
       "connect_timeout": AWS_CLIENT_CONNECT_TIMEOUT,
+      "max_pool_connections": AWS_CLIENT_MAX_POOL_CONNECTIONS,
       "read_timeout": AWS_CLIENT_READ_TIMEOUT,
       "region_name": region,
       "retries": AWS_CLIENT_RETRY_CONF,
@@ -96,11 +190,14 @@ class AwsAuthenticator:
     return Config(**args)
 
   def clone(self):
-    return type(self)(self.account_id, self.access_key, self.secret_access_key, self.token)
+    # clones share the assumed role credentials, which are refreshed on expiry, and the cached
+    # clients instead of assuming the role again.
+    return copy(self)
 
   def _new(self, obj_type: str, service: str = None, region: str = None):
     core_session = get_session()
     core_session._credentials = self.session_creds
+    core_session.register_component("data_loader", AwsClientCache().loader)
     if obj_type == "session" and region:
       core_session.set_config_variable("region", region)
     elif obj_type in ("client", "resource") and not region:
@@ -119,14 +216,28 @@ class AwsAuthenticator:
       return boto_session
 
   def new_client(self, service: str, region: str):
-    return self._new("client", service, region)
+    if not region:
+      raise AwsRegionRequired("client")
+    return AwsClientCache().client(
+      self.cache_key("client", service, region), lambda: self._new("client", service, region)
+    )
 
   def new_resource(self, service: str, region: str):
-    return self._new("resource", service, region)
+    if not region:
+      raise AwsRegionRequired("resource")
+    return AwsClientCache().resource(
+      self.cache_key("resource", service, region), lambda: self._new("resource", service, region)
+    )
 
   def new_session(self, region: str = None) -> Session:
     return self._new("session", None, region)
 
+  def role_arn(self) -> str:
+    role_arn_pattern = (
+      self.alt_role_arn_pattern if self.alt_role_arn_pattern else PDP_ROLE_ARN_PATTERN
+    )
+    return role_arn_pattern.format(self.account_id)
+
 
 class IamEntityPolicy:
   def __init__(self, entity_arn: Arn, policy: Dict[str, str]):
@@ -134,13 +245,16 @@ class IamEntityPolicy:
     self.policy_name = policy["PolicyName"]
     self.policy_type = policy["PolicyType"]
     self.policy_arn = policy.get("PolicyArn")
+    # inline policies granting access to users may be defined on one of the user's groups.
+    self.entity_type = policy.get("EntityType", entity_arn.resource_type).lower()
+    self.entity_name = policy.get("EntityName", entity_arn.resource.split("/")[-1])
 
   def document(self, client) -> str:
     if self.policy_type == "MANAGED":
       return get_managed_policy_document(client, self.policy_arn)
     else:
       return get_inline_policy_document(
-        client, self.entity_arn.resource_type, self.entity_arn.resource, self.policy_name
+        client, self.entity_type, self.entity_name, self.policy_name
       )
 
   def __str__(self) -> str:
@@ -197,51 +311,317 @@ class IamAccessCacheMetrics:
 
 
 class IamAccessCache(Datastore):
+  """
+  Per-resource cache of observed IAM accesses. Records store the accesses of a resource as a
+  zlib compressed JSON document holding the account-relative ARN of every entity and a parallel
+  list of access level bitmasks. Records written in the legacy `accesses` list format are still
+  read until they expire.
+  """
+
   def __init__(self, auth: AwsAuthenticator):
     self.account_id = auth.account_id
+    self.entity_prefix = f"arn:aws:iam::{auth.account_id}:"
     super().__init__(auth, DYNAMO_ACCESS_CACHE_TABLE_NAME)
 
-  def add(self, resource: Resource, accesses: List[IamObservedAccess]):
-    key = resource.arn.arn
-    if not self.exists(key):
-      ttl = DYNAMO_ACCESS_CACHE_ACCOUNT_TTL.get(self.account_id, DYNAMO_DEFAULT_ACCESS_CACHE_TTL)
-      val = {
-        "accesses": [a.__dict__ for a in accesses],
-        "expire": int(time() + jitter_ttl(ttl)),
-      }
-      self.put(key, val)
-      IamAccessCacheMetrics().metrics["add"].increment()
-
   def add_batch(self, accesses: Dict[Resource, List[IamObservedAccess]]):
+    """
+    Write the accesses of every resource without an unexpired record using `BatchWriteItem`.
+    """
+    if len(accesses) == 0:
+      return
+
+    now = time()
+    records = self.batch_get([r.arn.arn for r in accesses.keys()])
+    ttl = DYNAMO_ACCESS_CACHE_ACCOUNT_TTL.get(self.account_id, DYNAMO_DEFAULT_ACCESS_CACHE_TTL)
+    items = []
     for resource, resource_accesses in accesses.items():
-      self.add(resource, resource_accesses)
-
-  def fetch(self, resource: Resource) -> Optional[List[IamObservedAccess]]:
-    record = self.get(resource.arn.arn)
-    IamAccessCacheMetrics().metrics["get"].increment()
-    if record and "accesses" in record.keys():
-      if int(record["expire"]) > time():
-        IamAccessCacheMetrics().metrics["hit"].increment()
-        accesses = []
-        for access in record["accesses"]:
-          accesses.append(
-            IamObservedAccess(access["entity_arn"], access["resource_arn"], set(access["levels"]))
-          )
+      record = records.get(resource.arn.arn)
+      if record and int(record["expire"]) > now:
+        continue
+      items.append(
+        {
+          "ID": resource.arn.arn,
+          "accesses_z": self.encode(resource_accesses),
+          "expire": int(now + jitter_ttl(ttl)),
+        }
+      )
 
-        IamAccessCacheMetrics().metrics["accesses_fetched"].add(len(accesses))
-        return accesses
-    else:
-      IamAccessCacheMetrics().metrics["miss"].increment()
+    self.batch_put(items)
+    IamAccessCacheMetrics().metrics["add"].add(len(items))
+
+  def decode(self, record: Dict[str, Any]) -> List[IamObservedAccess]:
+    if "accesses_z" not in record.keys():
+      return [
+        IamObservedAccess(a["entity_arn"], a["resource_arn"], frozenset(a["levels"]))
+        for a in record["accesses"]
+      ]
+
+    value = record["accesses_z"]
+    # boto3 returns binary attributes wrapped in `Binary`
+    value = json.loads(zlib.decompress(getattr(value, "value", value)))
+    return [
+      IamObservedAccess(
+        entity if entity.startswith("arn:") else self.entity_prefix + entity,
+        record["ID"],
+        mask_access_levels(mask),
+      )
+      for entity, mask in zip(value["entities"], value["levels"])
+    ]
+
+  def encode(self, accesses: List[IamObservedAccess]) -> bytes:
+    prefix_len = len(self.entity_prefix)
+    entities = [
+      a.entity_arn[prefix_len:] if a.entity_arn.startswith(self.entity_prefix) else a.entity_arn
+      for a in accesses
+    ]
+    levels = [access_levels_mask(a.levels) for a in accesses]
+    value = json.dumps({"entities": entities, "levels": levels}, separators=(",", ":"))
+    return zlib.compress(value.encode())
+
+  def fetch_batch(self, resources: List[Resource]) -> Dict[Resource, List[IamObservedAccess]]:
+    """
+    Return the cached accesses of `resources` using `BatchGetItem`. Resources without an
+    unexpired record are omitted from the returned map.
+    """
+    now = time()
+    records = self.batch_get([r.arn.arn for r in resources])
+    IamAccessCacheMetrics().metrics["get"].add(len(resources))
+
+    accesses = {}
+    for resource in resources:
+      record = records.get(resource.arn.arn)
+      if (
+        not record
+        or ("accesses" not in record.keys() and "accesses_z" not in record.keys())
+        or int(record["expire"]) <= now
+      ):
+        IamAccessCacheMetrics().metrics["miss"].increment()
+        continue
 
+      IamAccessCacheMetrics().metrics["hit"].increment()
+      accesses[resource] = self.decode(record)
+      IamAccessCacheMetrics().metrics["accesses_fetched"].add(len(accesses[resource]))
+
+    return accesses
+
+
+class IamPolicyEvaluatorStore(Observable):
+  """
+  Per-account store of compiled IAM policy evaluators. Policy documents are read from the
+  account's `IamGraph` and compiled once per entity for every resource batch evaluated during the
+  access simulation stage. Entities the graph cannot fully describe are simulated: the graph does
+  not hold permission boundaries and `ListPoliciesGrantingServiceAccess` omits deny-only policies.
+  """
+
+  def __init__(self, svcs: List[str], graph=None):
+    self.svcs = svcs
+    self.graph = graph
+    self.evaluators = {}
+    self.lock = Lock()
+    self._evaluations = self.metrics.register(AtomicGauge("evaluations"))
+    self._fallbacks = self.metrics.register(AtomicGauge("fallbacks"))
+    self._mismatches = self.metrics.register(AtomicGauge("mismatches"))
+    self._spot_checks = self.metrics.register(AtomicGauge("spot_checks"))
+
+  def evaluator(self, entity_arn: Arn) -> Optional[IamPolicyEvaluator]:
+    with self.lock:
+      if entity_arn.arn in self.evaluators.keys():
+        return self.evaluators[entity_arn.arn]
+
+    evaluator = None
+    try:
+      documents = self.graph.documents(entity_arn.arn) if self.graph else None
+      if documents is None:
+        raise UnsupportedPolicyElement("entity", "not in IAM graph")
+      boundary = self.graph.boundary(entity_arn.arn)
+      if boundary:
+        raise UnsupportedPolicyElement("PermissionsBoundary", boundary)
+      evaluator = IamPolicyEvaluator(entity_arn.arn, documents)
+    except UnsupportedPolicyElement as ex:
+      log.info(
+        f"policy evaluation unsupported, using access simulation. entity={entity_arn.arn} element={ex.element} value={ex.value}"
+      )
+
+    with self.lock:
+      self.evaluators[entity_arn.arn] = evaluator
+    return evaluator
 
-def actions_access_levels(svc: str, actions: List[str]) -> Set[str]:
-  access_levels = set()
-  for access_level, ref_actions in RESOURCE_ACCESS_POLICY_ACTIONS[svc].items():
+  def evaluate(
+    self,
+    entity_arn: Arn,
+    actions: List[str],
+    resource_arns: List[str],
+    simulate: Callable[[], Dict[str, List[str]]],
+  ) -> Dict[str, List[str]]:
+    evaluator = self.evaluator(entity_arn)
+    if not evaluator:
+      self._fallbacks.increment()
+      return simulate()
+
+    allowed_actions = evaluator.allowed_actions(actions, resource_arns)
+    self._evaluations.increment()
+    if IAM_POLICY_EVAL_SPOT_CHECK_RATIO > random():
+      self._spot_checks.increment()
+      simulated = simulate()
+      if normalized_allowed_actions(simulated) != normalized_allowed_actions(allowed_actions):
+        self._mismatches.increment()
+        log.warn(
+          f"policy evaluation mismatch. entity={entity_arn.arn} evaluated={allowed_actions} simulated={simulated}"
+        )
+        return simulated
+
+    return allowed_actions
+
+
+class IamEntityPrefilter(Observable):
+  """
+  Per-account map of the services each IAM entity has policies granting access to. Entities are
+  only simulated against resources of their candidate services. Services are resolved once per
+  entity, from the account's `IamGraph` when one is provided and otherwise with one
+  `ListPoliciesGrantingServiceAccess` call covering every service namespace.
+  """
+
+  def __init__(self, svcs: List[str], graph=None):
+    self.svcs = [svc for svc in svcs if len(SERVICE_ACCESS_ACTIONS[svc].eval_actions) > 0]
+    self.graph = graph
+    self.entity_services = {}
+    self.lock = Lock()
+    self._candidates = {
+      svc: self.metrics.register(AtomicGauge(f"{svc}_candidate_entities")) for svc in self.svcs
+    }
+    self._errors = self.metrics.register(AtomicGauge("errors"))
+
+  def services(self, client, entity_arn: Arn) -> FrozenSet[str]:
+    with self.lock:
+      if entity_arn.arn in self.entity_services.keys():
+        return self.entity_services[entity_arn.arn]
+
+    if self.graph and self.graph.documents(entity_arn.arn) is not None:
+      services = frozenset(
+        svc
+        for svc in self.svcs
+        if self.graph.grants_access(entity_arn.arn, SERVICE_ACCESS_ACTIONS[svc].eval_actions)
+      )
+    else:
+      try:
+        services = frozenset(get_entity_access_services(client, self.svcs, entity_arn.arn))
+      except ClientError as ex:
+        if ex.response["Error"]["Code"] == "NoSuchEntity":
+          services = frozenset()
+        else:
+          # entities are simulated against every service until a lookup succeeds
+          log.warn(f"unable to list services accessible by entity: {entity_arn.arn}. err={ex}")
+          self._errors.increment()
+          return frozenset(self.svcs)
+
+    with self.lock:
+      if entity_arn.arn not in self.entity_services.keys():
+        self.entity_services[entity_arn.arn] = services
+        for svc in services:
+          self._candidates[svc].increment()
+    return services
+
+
+def normalized_allowed_actions(allowed_actions: Dict[str, List[str]]) -> Dict[str, Set[str]]:
+  return {r: set(a) for r, a in allowed_actions.items() if len(a) > 0}
+
+
+class ServiceAccessActions:
+  """
+  Lookup tables compiled from a `RESOURCE_ACCESS_POLICY_ACTIONS` service entry. Access levels
+  are encoded as bitmasks using the bit positions defined by `RESOURCE_ACCESS_LEVELS`.
+  """
+
+  def __init__(self, level_actions: Dict[str, List[str]]):
+    self.action_masks = {}
+    eval_actions = []
+    for level, actions in level_actions.items():
+      for action in actions:
+        if action not in self.action_masks.keys():
+          self.action_masks[action] = 0
+          eval_actions.append(action)
+        self.action_masks[action] |= access_level_bit(level)
+    self.action_levels = {a: mask_access_levels(m) for a, m in self.action_masks.items()}
+    self.eval_actions = tuple(eval_actions)
+
+  def mask(self, actions: List[str]) -> int:
+    mask = 0
     for action in actions:
-      if action in ref_actions:
-        access_levels.add(access_level)
+      mask |= self.action_masks.get(action, 0)
+    return mask
+
+
+def access_level_bit(level: str) -> int:
+  return 1 << RESOURCE_ACCESS_LEVELS.index(level)
+
+
+def access_levels_mask(levels: Set[str]) -> int:
+  mask = 0
+  for level in levels:
+    mask |= access_level_bit(level)
+  return mask
+
+
+def mask_access_levels(mask: int) -> FrozenSet[str]:
+  return ACCESS_LEVEL_SETS[mask]
+
 
-  return access_levels
+# every combination of access levels is precomputed so simulation results
+# can be mapped to `IamObservedAccess.levels` without building new sets.
+ACCESS_LEVEL_SETS = [
+  frozenset(l for i, l in enumerate(RESOURCE_ACCESS_LEVELS) if mask & (1 << i))
+  for mask in range(1 << len(RESOURCE_ACCESS_LEVELS))
+]
+
+SERVICE_ACCESS_ACTIONS = {
+  svc: ServiceAccessActions(level_actions)
+  for svc, level_actions in RESOURCE_ACCESS_POLICY_ACTIONS.items()
+}
+
+
+def actions_access_levels(svc: str, actions: List[str]) -> FrozenSet[str]:
+  return mask_access_levels(SERVICE_ACCESS_ACTIONS[svc].mask(actions))
+
+
+class IamSimulationBatchSizer:
+  """
+  Process-wide sizing of the resource sub-batches sent to `SimulatePrincipalPolicy`. Sub-batches
+  hold the most resources whose evaluations of the service's actions fit one `IAM_SIML_MAX_ITEMS`
+  page, the pages and evaluations of every call are published as histograms.
+  """
+
+  _INSTANCE = None
+
+  def __new__(cls):
+    if not cls._INSTANCE:
+      cls._INSTANCE = object.__new__(cls)
+      cls._INSTANCE.evaluations = GaugeHistogram(
+        "access_simulation_evaluations_per_call", IAM_SIML_HISTOGRAM_BOUNDS["evaluations"]
+      )
+      cls._INSTANCE.pages = GaugeHistogram(
+        "access_simulation_pages_per_call", IAM_SIML_HISTOGRAM_BOUNDS["pages"]
+      )
+      cls._INSTANCE.truncated = AtomicGauge("access_simulation_truncated_calls")
+
+    return cls._INSTANCE
+
+  def batches(self, svc: str, resource_arns: List[str]) -> List[List[str]]:
+    size = self.size(svc)
+    return [resource_arns[i : i + size] for i in range(0, len(resource_arns), size)]
+
+  def observe(self, pages: int, evaluations: int):
+    self.evaluations.observe(evaluations)
+    self.pages.observe(pages)
+    if pages > 1:
+      self.truncated.increment()
+
+  def register_metrics(self, metrics: Metrics):
+    self.evaluations.register(metrics)
+    self.pages.register(metrics)
+    metrics.register(self.truncated)
+
+  def size(self, svc: str) -> int:
+    return max(1, IAM_SIML_MAX_ITEMS // len(SERVICE_ACCESS_ACTIONS[svc].eval_actions))
 
 
 def entity_batch_resource_accesses(
@@ -252,15 +632,19 @@ def entity_batch_resource_accesses(
   simulation_gauge: AtomicGauge,
   simulation_error_gauge: AtomicGauge,
   simulation_eval_gauge: AtomicGauge,
+  svc: str = None,
 ) -> Dict[str, List[str]]:
+  account_id = Arn(entity_arn).account_id
   allowed_actions = {}
-  attempts = 0
+  evaluations = 0
   marker = None
+  pages = 0
   resp = None
   args = {
-    "ActionNames": actions,
+    "ActionNames": list(actions),
     "PolicySourceArn": entity_arn,
-    "MaxItems": 200,
+    # sub-batches are sized so every evaluation result fits one page
+    "MaxItems": IAM_SIML_MAX_ITEMS,
     "ResourceArns": resource_arns,
   }
 
@@ -269,10 +653,10 @@ def entity_batch_resource_accesses(
       args["Marker"] = marker
 
     try:
-      start_time = time()
       if ServerState().options.get("disable_access_simulation"):
         resp = {"EvaluationResults": []}
       else:
+        RateLimiter().acquire("iam_simulation", account_id)
         try:
           resp = client.simulate_principal_policy(**args)
         except ClientError as ex:
@@ -281,35 +665,34 @@ def entity_batch_resource_accesses(
             return {}
           else:
             raise ex
-        rate_limit(IAM_ACCESS_SIML_RATE_LIMIT, start_time)
+        RateLimiter().succeeded("iam_simulation", account_id)
       simulation_gauge.increment()
     except (ClientError, ConnectionClosedError, ResponseParserError) as ex:
       if isinstance(ex, ClientError):
-        if ex.response["Error"]["Code"] != "Throttling":
+        if not is_throttling_error(ex):
           raise ex
+        RateLimiter().throttled("iam_simulation", account_id)
 
-      attempts += 1
       simulation_error_gauge.increment()
-      err_msg = "access simulation request failed: attempt={} args={} ex={}"
+      err_msg = "access simulation request failed: args={} ex={}"
       if isinstance(ex, ResponseParserError):
         # log exception class name only as ResponseParserError exceptions contains the response
         # body which generates an extreme amount of logging
-        log.error(err_msg.format(attempts, args, ex.__class__.__name__))
+        log.error(err_msg.format(args, ex.__class__.__name__))
       else:
-        log.error(err_msg.format(attempts, args, ex))
+        log.error(err_msg.format(args, ex))
 
-      if IAM_API_DELAYED_RETRIES >= attempts:
-        sleep(IAM_API_RETRY_DELAY_INTERVAL)
-        resp = None
-        continue
-      else:
-        raise ex
+      # the entity's resource batch is retried by the `RetryScheduler` so the calling worker
+      # can simulate other entities during the backoff.
+      raise ex
 
     if resp.get("IsTruncated"):
       marker = resp["Marker"]
     else:
       marker = None
 
+    pages += 1
+    evaluations += len(resp["EvaluationResults"])
     for result in resp["EvaluationResults"]:
       simulation_eval_gauge.increment()
       if result["EvalDecision"] == "allowed":
@@ -317,9 +700,15 @@ def entity_batch_resource_accesses(
           allowed_actions[result["EvalResourceName"]] = []
         allowed_actions[result["EvalResourceName"]].append(result["EvalActionName"])
 
+  if svc and not ServerState().options.get("disable_access_simulation"):
+    IamSimulationBatchSizer().observe(pages, evaluations)
   return allowed_actions
 
 
+def is_retryable_simulation_error(ex: Exception) -> bool:
+  return is_throttling_error(ex) or isinstance(ex, (ConnectionClosedError, ResponseParserError))
+
+
 def get_authenticator(account_id: str, alt_role_arn_pattern: str = None) -> AwsAuthenticator:
   token = None
   if ServerState().options.get("load_env_creds"):
@@ -347,6 +736,7 @@ def get_entity_batched_resource_accesses(
   simulation_gauge: AtomicGauge,
   simulation_error_gauge: AtomicGauge,
   simulation_eval_gauge: AtomicGauge,
+  evaluator_store: IamPolicyEvaluatorStore = None,
 ) -> Dict[Resource, List[IamObservedAccess]]:
   resource_access = {}
   resource_arn_to_resource = {}
@@ -355,19 +745,35 @@ def get_entity_batched_resource_accesses(
     resource_arn_to_resource[resource.arn.arn] = resource
 
   for resource_svc, resources in resources_by_service(src_resources).items():
-    eval_actions = []
-    for level, actions in RESOURCE_ACCESS_POLICY_ACTIONS[resource_svc].items():
-      eval_actions = eval_actions + actions
+    eval_actions = SERVICE_ACCESS_ACTIONS[resource_svc].eval_actions
+    if len(eval_actions) == 0:
+      continue
+
+    resource_arns = [r.arn.arn for r in resources]
+
+    def simulate():
+      allowed = {}
+      for batch_arns in IamSimulationBatchSizer().batches(resource_svc, resource_arns):
+        allowed.update(
+          entity_batch_resource_accesses(
+            client,
+            eval_actions,
+            entity_arn.arn,
+            batch_arns,
+            simulation_gauge,
+            simulation_error_gauge,
+            simulation_eval_gauge,
+            resource_svc,
+          )
+        )
+      return allowed
 
-    for resource_arn, allowed_actions in entity_batch_resource_accesses(
-      client,
-      eval_actions,
-      entity_arn.arn,
-      [r.arn.arn for r in resources],
-      simulation_gauge,
-      simulation_error_gauge,
-      simulation_eval_gauge,
-    ).items():
+    if evaluator_store:
+      allowed = evaluator_store.evaluate(entity_arn, eval_actions, resource_arns, simulate)
+    else:
+      allowed = simulate()
+
+    for resource_arn, allowed_actions in allowed.items():
       access_levels = actions_access_levels(resource_svc, allowed_actions)
       access = IamObservedAccess(entity_arn.arn, resource_arn, access_levels)
 
@@ -378,55 +784,117 @@ def get_entity_batched_resource_accesses(
   return resource_access
 
 
-def get_all_entity_batched_resource_accesses(
-  resources: List[Resource],
+def entity_batched_resource_accesses(
   auth: AwsAuthenticator,
-  iam_entities: Dict[str, List[IamEntity]],
+  entity: IamEntity,
+  resources: List[Resource],
   gauges: Dict[str, AtomicGauge],
+  evaluator_store: IamPolicyEvaluatorStore = None,
+  prefilter: IamEntityPrefilter = None,
 ) -> Dict[Resource, List[IamObservedAccess]]:
-  cache = IamAccessCache(auth.clone())
+  client = auth.new_client("iam", region=GLOBAL_API_REGION)
+  try:
+    if prefilter:
+      svcs = prefilter.services(client, entity.arn)
+      candidates = [r for r in resources if r.arn.service in svcs]
+      # pruned resources are not counted as `resource_access_processed`
+      gauges["resource_access_pruned"].add(len(resources) - len(candidates))
+      if len(candidates) == 0:
+        return {}
+      resources = candidates
+
+    return get_entity_batched_resource_accesses(
+      client,
+      entity.arn,
+      resources,
+      gauges["access_simulation"],
+      gauges["access_simulation_errors"],
+      gauges["access_simulation_evaluations"],
+      evaluator_store,
+    )
+  finally:
+    # throttled attempts also advance the stage, the retry scheduler bounds their number
+    ProgressTracker().advance(account_stage_key(auth.account_id, "access_simulation"))
+
+
+def partition_cached_accesses(
+  cache: IamAccessCache, resources: List[Resource]
+) -> Tuple[Dict[Resource, List[IamObservedAccess]], Dict[Resource, List[IamObservedAccess]]]:
+  """
+  Split `resources` into the accesses found in the access cache and an empty access map for the
+  resources that require access simulation.
+  """
   cached_accesses = {}
   processed_accesses = {}
+  fetched = {}
+  if not ServerState().options.get("disable_access_cache"):
+    fetched = cache.fetch_batch(list(resources))
   for resource in resources:
-    if not ServerState().options.get("disable_access_cache"):
-      res = cache.fetch(resource)
-      if res and len(res) > 0:
-        cached_accesses[resource] = res
-        continue
+    res = fetched.get(resource)
+    if res and len(res) > 0:
+      cached_accesses[resource] = res
+      continue
     processed_accesses[resource] = []
 
+  return cached_accesses, processed_accesses
+
+
+def merge_entity_accesses(
+  processed_accesses: Dict[Resource, List[IamObservedAccess]],
+  entity_accesses: Dict[Resource, List[IamObservedAccess]],
+  gauges: Dict[str, AtomicGauge],
+):
+  for resource, resource_accesses in entity_accesses.items():
+    gauges["resource_access_processed"].increment()
+    gauges["observed_resource_accesses"].add(len(resource_accesses))
+    processed_accesses[resource] = processed_accesses[resource] + resource_accesses
+
+
+def get_all_entity_batched_resource_accesses(
+  resources: List[Resource],
+  auth: AwsAuthenticator,
+  iam_entities: Dict[str, List[IamEntity]],
+  gauges: Dict[str, AtomicGauge],
+  evaluator_store: IamPolicyEvaluatorStore = None,
+  prefilter: IamEntityPrefilter = None,
+) -> Optional[Dict[Resource, List[IamObservedAccess]]]:
+  cache = IamAccessCache(auth.clone())
+  cached_accesses, processed_accesses = partition_cached_accesses(cache, resources)
+
   futures = []
   workers = IAM_MAX_API_FUTURES
   with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as ex:
     for _, entities in iam_entities.items():
       for entity in entities:
         futures.append(
-          ex.submit(
-            get_entity_batched_resource_accesses,
-            auth.clone().new_client("iam", region=GLOBAL_API_REGION),
-            entity.arn,
+          RetryScheduler().submit(
+            ex,
+            is_retryable_simulation_error,
+            IAM_API_DELAYED_RETRIES,
+            gauges["access_simulation_work_ms"],
+            gauges["access_simulation_retry_wait_ms"],
+            entity_batched_resource_accesses,
+            auth,
+            entity,
             processed_accesses.keys(),
-            gauges["access_simulation"],
-            gauges["access_simulation_errors"],
-            gauges["access_simulation_evaluations"],
+            gauges,
+            evaluator_store,
+            prefilter,
           )
         )
 
     for future in concurrent.futures.as_completed(futures, timeout=FUTURE_TIMEOUTS["processor"]):
 
       try:
-        for resource, resource_accesses in future.result().items():
-          gauges["resource_access_processed"].increment()
-          gauges["observed_resource_accesses"].add(len(resource_accesses))
-          processed_accesses[resource] = processed_accesses[resource] + resource_accesses
+        merge_entity_accesses(processed_accesses, future.result(), gauges)
       except ResponseParserError:
         log.error("access simulation failed for resource batch due API response parsing errors.")
         # All `get_entity_batched_resource_accesses` futures executed by this method
         # must complete successfully in order to have a complete list of IAM entities
         # that have access to the input resources. In the event that a future exhausts
-        # retries for IAM API calls and fails due to response parsing errors return an
-        # empty map to effectively skip processing for the input resource batch.
-        return {}
+        # retries for IAM API calls and fails due to response parsing errors return `None`
+        # to skip processing for the input resource batch.
+        return None
 
   # populate access cache
   if not ServerState().options.get("disable_access_cache"):
@@ -486,6 +954,32 @@ def get_entity_access_policies(client, svcs: List[str], arn: str) -> List[Dict[s
   return policies
 
 
+def get_entity_access_services(client, svcs: List[str], arn: str) -> Set[str]:
+  services = set()
+  marker = None
+  resp = None
+  opts = {
+    "Arn": arn,
+    "ServiceNamespaces": svcs,
+  }
+
+  while marker or resp is None:
+    if marker:
+      opts["Marker"] = marker
+
+    resp = client.list_policies_granting_service_access(**opts)
+    if resp.get("IsTruncated"):
+      marker = resp["Marker"]
+    else:
+      marker = None
+
+    for namespace in resp["PoliciesGrantingServiceAccess"]:
+      if len(namespace["Policies"]) > 0:
+        services.add(namespace["ServiceNamespace"])
+
+  return services
+
+
 def get_all_access_entities(client, entity_type: str, gauge: AtomicGauge) -> List[IamEntity]:
   entities = []
   for resp in client.get_paginator(f"list_{entity_type}s").paginate():
@@ -0,0 +1,186 @@
+import concurrent.futures
+from typing import Any, Dict, List, Optional, Tuple
+
+from twitter.common import log
+from twitter.common.metrics import AtomicGauge, Observable
+from util import disk_cache_path, read_json_cache, write_json_cache
+
+from aws_arn import Arn
+from aws_iam import AwsAuthenticator, IamEntity, SERVICE_ACCESS_ACTIONS
+from aws_iam_policy import IamPolicyEvaluator, UnsupportedPolicyElement
+from botocore.exceptions import ClientError
+from server_config import (
+  FUTURE_TIMEOUTS,
+  GLOBAL_API_REGION,
+  IAM_GRAPH_CACHE_TTL,
+  IAM_MAX_API_FUTURES,
+  SUPPORTED_IAM_ENTITIES,
+)
+from server_state import ServerState
+
+
+# `GetAccountAuthorizationDetails` entity list keys, policy list keys and entity types
+AUTHORIZATION_DETAILS = (
+  ("GroupDetailList", "GroupPolicyList", "group"),
+  ("RoleDetailList", "RolePolicyList", "role"),
+  ("UserDetailList", "UserPolicyList", "user"),
+)
+
+
+class IamGraph(Observable):
+  """
+  Per-account graph of IAM entities, their identity-based policy documents and permissions
+  boundaries, cached on disk between runs. Entities and inline policies are listed with one
+  paginated `GetAccountAuthorizationDetails` call. Managed policy documents are only fetched when
+  the policy's `DefaultVersionId` differs from the cached version.
+  """
+
+  def __init__(self, auth: AwsAuthenticator):
+    self.auth = auth
+    self.path = disk_cache_path(f"iam_graph_{auth.account_id}.json")
+    self.entities = {}
+    self.groups = {}
+    self.policies = {}
+    self._entities = self.metrics.register(AtomicGauge("entities"))
+    self._entities_without_access = self.metrics.register(AtomicGauge("entities_without_access"))
+    self._policies_fetched = self.metrics.register(AtomicGauge("policies_fetched"))
+    self._policies_reused = self.metrics.register(AtomicGauge("policies_reused"))
+
+  def boundary(self, entity_arn: str) -> Optional[str]:
+    """
+    Return the ARN of the permissions boundary of an entity, `None` if it has none.
+    """
+    entity = self.entities.get(entity_arn)
+    return entity.get("boundary") if entity else None
+
+  def documents(self, entity_arn: str) -> Optional[List[Any]]:
+    """
+    Return the inline and managed policy documents of an entity including the documents of a
+    user's groups, `None` if the entity is not in the graph.
+    """
+    entity = self.entities.get(entity_arn)
+    if entity is None:
+      return None
+
+    entities = [entity]
+    if entity["type"] == "user":
+      entities += [self.entities[self.groups[g]] for g in entity["groups"] if g in self.groups]
+
+    documents = []
+    for e in entities:
+      documents += e["documents"]
+      documents += [self.policies[p]["document"] for p in e["policies"] if p in self.policies]
+    return documents
+
+  def entity_map(
+    self, svcs: List[str], gauges: Dict[str, AtomicGauge]
+  ) -> Dict[str, List[IamEntity]]:
+    """
+    Return the entities of the graph by type, skipping entities without an allow statement for
+    any of the actions simulated for `svcs`.
+    """
+    actions = [a for svc in svcs for a in SERVICE_ACCESS_ACTIONS[svc].eval_actions]
+    entities = {entity_type: [] for entity_type in SUPPORTED_IAM_ENTITIES}
+    for arn, entity in self.entities.items():
+      if entity["type"] not in entities.keys():
+        continue
+      gauges[entity["type"]].increment()
+      if ServerState().options.get("log_resource_observations"):
+        log.info(f"Observed IAM entity: {arn}.")
+
+      if not self.grants_access(arn, actions):
+        self._entities_without_access.increment()
+        continue
+      entities[entity["type"]].append(IamEntity(Arn(arn)))
+
+    return entities
+
+  def fetch_entities(self, client) -> Dict[str, Dict[str, Any]]:
+    entities = {}
+    paginator = client.get_paginator("get_account_authorization_details")
+    for resp in paginator.paginate(Filter=["Group", "Role", "User"]):
+      for details_key, policies_key, entity_type in AUTHORIZATION_DETAILS:
+        for entity in resp.get(details_key, []):
+          entities[entity["Arn"]] = {
+            "boundary": entity.get("PermissionsBoundary", {}).get("PermissionsBoundaryArn"),
+            "documents": [p["PolicyDocument"] for p in entity.get(policies_key, [])],
+            "groups": entity.get("GroupList", []),
+            "name": entity[f"{entity_type.capitalize()}Name"],
+            "policies": [p["PolicyArn"] for p in entity.get("AttachedManagedPolicies", [])],
+            "type": entity_type,
+          }
+
+    return entities
+
+  def fetch_policies(
+    self, client, policies: List[Tuple[str, Optional[str]]]
+  ) -> Dict[str, Dict[str, Any]]:
+    fetched = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=IAM_MAX_API_FUTURES) as ex:
+      future_to_arn = {
+        ex.submit(self.fetch_policy, client, policy_arn, version): policy_arn
+        for policy_arn, version in policies
+      }
+      for future in concurrent.futures.as_completed(
+        future_to_arn.keys(), timeout=FUTURE_TIMEOUTS["scanner"]
+      ):
+        try:
+          fetched[future_to_arn[future]] = future.result()
+        except ClientError as err:
+          # policies deleted since the entities were listed no longer grant access
+          if err.response["Error"]["Code"] != "NoSuchEntity":
+            raise err
+
+    return fetched
+
+  def fetch_policy(self, client, policy_arn: str, version: Optional[str]) -> Dict[str, Any]:
+    if not version:
+      version = client.get_policy(PolicyArn=policy_arn)["Policy"]["DefaultVersionId"]
+    resp = client.get_policy_version(PolicyArn=policy_arn, VersionId=version)
+    self._policies_fetched.increment()
+    return {"document": resp["PolicyVersion"]["Document"], "version": version}
+
+  def fetch_policy_versions(self, client) -> Dict[str, str]:
+    versions = {}
+    for resp in client.get_paginator("list_policies").paginate(OnlyAttached=True):
+      for policy in resp.get("Policies", []):
+        versions[policy["Arn"]] = policy["DefaultVersionId"]
+
+    return versions
+
+  def grants_access(self, entity_arn: str, actions: List[str]) -> bool:
+    try:
+      evaluator = IamPolicyEvaluator(entity_arn, self.documents(entity_arn) or [])
+    except (UnsupportedPolicyElement, ValueError):
+      # statements that cannot be compiled are assumed to grant access
+      return True
+
+    # conditions are ignored, an entity is skipped only if no allow statement matches an action
+    return any(s.allow and any(s.matches_action(a) for a in actions) for s in evaluator.statements)
+
+  def load(self):
+    cached = read_json_cache(self.path, IAM_GRAPH_CACHE_TTL) or {}
+    cached_policies = cached.get("policies", {})
+    client = self.auth.new_client("iam", region=GLOBAL_API_REGION)
+
+    self.entities = self.fetch_entities(client)
+    self.groups = {e["name"]: arn for arn, e in self.entities.items() if e["type"] == "group"}
+    self._entities.add(len(self.entities))
+    versions = self.fetch_policy_versions(client)
+
+    self.policies = {}
+    stale = []
+    for policy_arn in {p for e in self.entities.values() for p in e["policies"]}:
+      version = versions.get(policy_arn)
+      policy = cached_policies.get(policy_arn)
+      if version and policy and policy["version"] == version:
+        self.policies[policy_arn] = policy
+        self._policies_reused.increment()
+      else:
+        stale.append((policy_arn, version))
+
+    self.policies.update(self.fetch_policies(client, stale))
+    log.info(
+      f"Loaded IAM graph. account: {self.auth.account_id} entities: {len(self.entities)} policies: {len(self.policies)} fetched: {len(stale)}"
+    )
+    write_json_cache(self.path, {"entities": self.entities, "policies": self.policies})
@@ -0,0 +1,147 @@
+import json
+import re
+from typing import Any, Dict, List, Pattern, Union
+from urllib.parse import unquote
+
+
+class UnsupportedPolicyElement(Exception):
+  def __init__(self, element: str, value: Any):
+    self.element = element
+    self.value = value
+
+
+def as_list(value: Union[str, List[str], None]) -> List[str]:
+  if value is None:
+    return []
+  elif isinstance(value, str):
+    return [value]
+  return list(value)
+
+
+def compile_pattern(value: str, ignore_case: bool = False) -> Pattern:
+  # IAM only supports the `*` and `?` wildcards in action and resource values.
+  if "${" in value:
+    # policy variables are resolved from the request context which is not
+    # available during local evaluation.
+    raise UnsupportedPolicyElement("policy variable", value)
+
+  pattern = re.escape(value).replace(r"\*", ".*").replace(r"\?", ".")
+  return re.compile(f"^{pattern}$", re.IGNORECASE if ignore_case else 0)
+
+
+# negated condition operators match requests whose context does not contain the condition key
+NEGATED_OPERATORS = frozenset(
+  (
+    "ArnNotEquals",
+    "ArnNotLike",
+    "DateNotEquals",
+    "NumericNotEquals",
+    "StringNotEquals",
+    "StringNotEqualsIgnoreCase",
+    "StringNotLike",
+  )
+)
+
+
+def missing_context_condition(operator: str, values: Union[str, List[str]]) -> bool:
+  """
+  Evaluate a condition operator against a request context that does not contain the
+  condition key. This mirrors `SimulatePrincipalPolicy` calls made without `ContextEntries`.
+  """
+  if operator.startswith("ForAllValues:"):
+    return True
+  elif operator.startswith("ForAnyValue:"):
+    return False
+  elif operator == "Null":
+    return any(str(v).lower() == "true" for v in as_list(values))
+  elif operator.endswith("IfExists"):
+    return True
+  return operator in NEGATED_OPERATORS
+
+
+def parse_policy_document(document: Union[str, Dict[str, Any]]) -> Dict[str, Any]:
+  # boto3 decodes policy documents, documents loaded from other sources may still be
+  # URL encoded JSON strings.
+  if isinstance(document, str):
+    return json.loads(unquote(document))
+  return document
+
+
+class IamPolicyStatement:
+  def __init__(self, statement: Dict[str, Any]):
+    self.allow = statement.get("Effect") == "Allow"
+
+    self.not_action = "NotAction" in statement
+    self.actions = [
+      compile_pattern(a, True)
+      for a in as_list(statement.get("NotAction" if self.not_action else "Action"))
+    ]
+
+    self.not_resource = "NotResource" in statement
+    self.resources = [
+      compile_pattern(r)
+      for r in as_list(statement.get("NotResource" if self.not_resource else "Resource"))
+    ]
+
+    self.condition = True
+    for operator, clauses in statement.get("Condition", {}).items():
+      for _, values in clauses.items():
+        if not missing_context_condition(operator, values):
+          self.condition = False
+
+  def matches_action(self, action: str) -> bool:
+    matched = any(p.match(action) for p in self.actions)
+    return not matched if self.not_action else matched
+
+  def matches_resource(self, resource_arn: str) -> bool:
+    matched = any(p.match(resource_arn) for p in self.resources)
+    return not matched if self.not_resource else matched
+
+  def applies(self, action: str, resource_arn: str) -> bool:
+    return self.condition and self.matches_action(action) and self.matches_resource(resource_arn)
+
+
+class IamPolicyEvaluator:
+  """
+  Evaluates the identity-based policies attached to an IAM entity in-process. Resource based
+  policies and SCPs are not evaluated which matches the behavior of `SimulatePrincipalPolicy`
+  when no resource policy is provided. Permissions boundaries are evaluated by the simulation
+  but not here, callers must simulate entities that have one.
+  """
+
+  def __init__(self, entity_arn: str, documents: List[Union[str, Dict[str, Any]]]):
+    self.entity_arn = entity_arn
+    self.statements = []
+    for document in documents:
+      statements = parse_policy_document(document).get("Statement", [])
+      if isinstance(statements, dict):
+        statements = [statements]
+      for statement in statements:
+        self.statements.append(IamPolicyStatement(statement))
+
+  def is_allowed(self, action: str, resource_arn: str) -> bool:
+    allowed = False
+    for statement in self.statements:
+      if statement.applies(action, resource_arn):
+        if not statement.allow:
+          return False  # explicit deny
+        allowed = True
+
+    return allowed
+
+  def allowed_actions(self, actions: List[str], resource_arns: List[str]) -> Dict[str, List[str]]:
+    # statements that cannot apply to any of the evaluated actions are
+    # dropped before iterating resources.
+    statements = [s for s in self.statements if any(s.matches_action(a) for a in actions)]
+    evaluator = IamPolicyEvaluator(self.entity_arn, [])
+    evaluator.statements = statements
+
+    allowed_actions = {}
+    for resource_arn in resource_arns:
+      for action in actions:
+        if evaluator.is_allowed(action, resource_arn):
+          if resource_arn not in allowed_actions.keys():
+            allowed_actions[resource_arn] = []
+          allowed_actions[resource_arn].append(action)
+
+    return allowed_actions
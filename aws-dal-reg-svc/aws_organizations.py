@@ -1,13 +1,52 @@
-from typing import Dict, List, Optional, Union
+import concurrent.futures
+from threading import Lock
+from typing import Any, Callable, Dict, Iterator, List, Optional, Union
 
-from util import response_tags, tag_value
+from twitter.common import log
+from util import disk_cache_path, read_json_cache, response_tags, tag_value, write_json_cache
 
 from aws_iam import AwsAuthenticator
 from botocore.exceptions import ClientError
-from server_config import GLOBAL_API_REGION
+from rate_limiter import is_throttling_error, RateLimiter
+from server_config import (
+  ACCOUNT_METADATA_CACHE_TTL,
+  FUTURE_TIMEOUTS,
+  GLOBAL_API_REGION,
+  ORGANIZATIONS_TAG_CONCURRENCY,
+)
 from server_state import ServerState
 
 
+ACCOUNT_METADATA = {}
+ACCOUNT_METADATA_LOCK = Lock()
+
+
+def organizations_request(method: Callable, *args, **kwargs) -> Any:
+  """
+  Call an Organizations API `method` under the shared Organizations rate limit.
+  """
+  RateLimiter().acquire("organizations")
+  try:
+    resp = method(*args, **kwargs)
+  except ClientError as ex:
+    if is_throttling_error(ex):
+      RateLimiter().throttled("organizations")
+    raise ex
+
+  RateLimiter().succeeded("organizations")
+  return resp
+
+
+def paginate(client, method: str, **kwargs) -> Iterator[Dict[str, Any]]:
+  pages = iter(client.get_paginator(method).paginate(**kwargs))
+  while True:
+    # each page is requested from the API when the paginator is advanced
+    resp = organizations_request(next, pages, None)
+    if resp is None:
+      return
+    yield resp
+
+
 def get_accounts(auth: AwsAuthenticator, exclude_ous: bool = True) -> List[str]:
   process_account = ServerState().options.get("process_account")
   if process_account:
@@ -16,7 +55,29 @@ def get_accounts(auth: AwsAuthenticator, exclude_ous: bool = True) -> List[str]:
     return list_org_accounts(auth)
 
 
-def get_account_tag(auth: AwsAuthenticator, account_id: str, tag: str) -> Optional[str]:
+def get_active_accounts(auth: AwsAuthenticator, refresh: bool = False) -> List[str]:
+  process_account = ServerState().options.get("process_account")
+  if process_account:
+    return [process_account]
+  else:
+    return [
+      account_id
+      for account_id, account in load_account_metadata(auth, refresh).items()
+      if account["Status"] == "ACTIVE"
+    ]
+
+
+def get_account_tag(
+  auth: AwsAuthenticator,
+  account_id: str,
+  tag: str,
+  accounts: Optional[Dict[str, Dict[str, Any]]] = None,
+) -> Optional[str]:
+  # prefer the bulk account metadata, accounts missing from it are looked up individually
+  account = (accounts or {}).get(account_id)
+  if account and "TagsError" not in account:
+    return tag_value(account["Tags"], tag)
+
   try:
     return tag_value(response_tags(get_account_tags(auth, account_id)), tag)
   except ClientError as ex:
@@ -28,13 +89,68 @@ def get_account_tags(
   auth: AwsAuthenticator, account_id: str
 ) -> Dict[str, Union[List[Dict[str, str]], str]]:
   client = auth.new_client("organizations", region=GLOBAL_API_REGION)
-  return client.list_tags_for_resource(ResourceId=account_id)
+  return organizations_request(client.list_tags_for_resource, ResourceId=account_id)
+
+
+def load_account_metadata(
+  auth: AwsAuthenticator, refresh: bool = False
+) -> Dict[str, Dict[str, Any]]:
+  """
+  Return the name, status and tags of every organization account keyed by account ID. Account
+  tags are fetched concurrently under the shared Organizations rate limit. Metadata is cached in
+  memory and on disk for `ACCOUNT_METADATA_CACHE_TTL` seconds so other binaries and later runs
+  reuse it. Accounts whose tags could not be fetched have a `TagsError` code and prevent the
+  metadata from being written to disk.
+  """
+  path = disk_cache_path(f"account_metadata_{auth.account_id}.json")
+  with ACCOUNT_METADATA_LOCK:
+    if not refresh:
+      accounts = ACCOUNT_METADATA.get(path) or read_json_cache(path, ACCOUNT_METADATA_CACHE_TTL)
+      if accounts is not None:
+        ACCOUNT_METADATA[path] = accounts
+        return accounts
+
+    accounts = {}
+    client = auth.new_client("organizations", region=GLOBAL_API_REGION)
+    for resp in paginate(client, "list_accounts"):
+      for account in resp.get("Accounts", []):
+        accounts[account["Id"]] = {
+          "Name": account.get("Name"),
+          "Status": account["Status"],
+          "Tags": [],
+        }
+
+    errors = 0
+    with concurrent.futures.ThreadPoolExecutor(max_workers=ORGANIZATIONS_TAG_CONCURRENCY) as ex:
+      future_to_account = {
+        ex.submit(get_account_tags, auth, account_id): account_id
+        for account_id, account in accounts.items()
+        if account["Status"] == "ACTIVE"
+      }
+      for future in concurrent.futures.as_completed(
+        future_to_account.keys(), timeout=FUTURE_TIMEOUTS["scanner"]
+      ):
+        account_id = future_to_account[future]
+        try:
+          accounts[account_id]["Tags"] = response_tags(future.result())
+        except ClientError as err:
+          code = err.response["Error"]["Code"]
+          if code not in ("InvalidInputException", "TargetNotFoundException"):
+            log.error(f"Unable to fetch tags of account: {account_id}. err={err}")
+            accounts[account_id]["TagsError"] = code
+            errors += 1
+
+    log.info(f"Loaded metadata of {len(accounts)} organization accounts ({errors} tag errors).")
+    if errors == 0:
+      write_json_cache(path, accounts)
+    ACCOUNT_METADATA[path] = accounts
+    return accounts
 
 
 def list_org_accounts(auth: AwsAuthenticator) -> List[str]:
   accounts = []
   client = auth.new_client("organizations", region=GLOBAL_API_REGION)
-  for resp in client.get_paginator("list_accounts").paginate():
+  for resp in paginate(client, "list_accounts"):
     if "Accounts" in resp.keys():
       for account in resp["Accounts"]:
         if account["Status"] == "ACTIVE":
@@ -46,7 +162,7 @@ def list_org_accounts(auth: AwsAuthenticator) -> List[str]:
 def list_ou_accounts(auth: AwsAuthenticator, ou: str) -> List[str]:
   accounts = []
   client = auth.new_client("organizations", region=GLOBAL_API_REGION)
-  for resp in client.get_paginator("list_children").paginate(ParentId=ou, ChildType="ACCOUNT"):
+  for resp in paginate(client, "list_children", ParentId=ou, ChildType="ACCOUNT"):
     if "Children" in resp.keys():
       for child in resp["Children"]:
         if child["Type"] == "ACCOUNT":
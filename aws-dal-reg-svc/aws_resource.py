@@ -1,7 +1,8 @@
 from datetime import datetime
-from typing import Dict, List, Union
+import json
+from typing import Any, Dict, List, Union
 
-from aws_arn import Arn
+from aws_arn import Arn, S3Arn
 from errors import UnknownResourceStatus
 from server_config import RESOURCE_STATUSES
 
@@ -17,6 +18,7 @@ class Resource:
   ):
     if not status or status not in RESOURCE_STATUSES.get(arn.service):
       raise UnknownResourceStatus(arn.service, status)
+    self.name = name
     self.arn = arn
     self.creation_date = creation_date
     self.status = status
@@ -31,12 +33,50 @@ class Resource:
         return "INACTIVE"
     return "ACTIVE"
 
+  def to_json(self) -> str:
+    return json.dumps(
+      {
+        "name": self.name,
+        "arn": self.arn.arn,
+        "account_id": self.arn.account_id,
+        "region": self.arn.region,
+        "creation_date": self.creation_date,
+        "status": self.status,
+        "properties": self.properties,
+      },
+      default=encode_datetime,
+      sort_keys=True,
+    )
+
+  @classmethod
+  def from_json(cls, value: str) -> "Resource":
+    resource = json.loads(value, object_hook=decode_datetime)
+    arn = Arn(resource["arn"])
+    if arn.service == "s3":
+      # S3 ARNs don't include the account ID and region
+      arn = S3Arn(arn.resource, resource["account_id"], resource["region"])
+    return cls(
+      resource["name"], arn, resource["creation_date"], resource["status"], resource["properties"]
+    )
+
   def __str__(self) -> str:
     return "{}(arn={}, created={}, status={}, properties={})".format(
       self.__class__.__name__, self.arn.arn, self.creation_date, self.status, self.properties
     )
 
 
+def encode_datetime(value: Any) -> Dict[str, str]:
+  if isinstance(value, datetime):
+    return {"__datetime__": value.isoformat()}
+  raise TypeError(f"{value.__class__.__name__} is not JSON serializable")
+
+
+def decode_datetime(value: Dict[str, Any]) -> Any:
+  if "__datetime__" in value:
+    return datetime.fromisoformat(value["__datetime__"])
+  return value
+
+
 def resources_by_service(src_resources: List[Resource]) -> Dict[str, List[Resource]]:
   resources = {}
   for resource in src_resources:
@@ -0,0 +1,164 @@
+import concurrent.futures
+from threading import Lock
+from time import monotonic
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from twitter.common.metrics import AtomicGauge, Observable
+from twitter.common.metrics.metrics import Metrics
+from util import disk_cache_path, GaugeHistogram, read_json_cache, write_json_cache
+
+from aws_iam import AwsAuthenticator
+from botocore.exceptions import ClientError
+from server_config import FUTURE_TIMEOUTS, S3_API_LATENCY_BOUNDS, S3_BUCKET_REGION_CACHE_TTL
+
+
+# S3 APIs called to list and describe buckets, latencies are published per API
+S3_ENRICHMENT_APIS = (
+  "get_bucket_encryption",
+  "get_bucket_lifecycle_configuration",
+  "get_bucket_location",
+  "get_bucket_tagging",
+  "list_buckets",
+)
+
+# error codes of requests sent to a region other than the bucket's region
+S3_REGION_ERROR_CODES = (
+  "AuthorizationHeaderMalformed",
+  "IllegalLocationConstraintException",
+  "PermanentRedirect",
+)
+
+
+def location_region(location: Optional[str]) -> str:
+  # S3 buckets that return a `null` `LocationConstraint` value are located in `us-east-1`
+  # as-per the docs and AWS support (Account ID: 673964658973, Support Case ID: 8246504281)
+  # https://docs.aws.amazon.com/AmazonS3/latest/API/API_GetBucketLocation.html#API_GetBucketLocation_ResponseSyntax
+  if location is None:
+    return "us-east-1"
+  elif location == "EU":
+    return "eu-west-1"
+  return location
+
+
+class S3ApiLatency:
+  """
+  Process-wide latency histograms of S3 API calls in milliseconds, one per API.
+  """
+
+  _INSTANCE = None
+
+  def __new__(cls):
+    if not cls._INSTANCE:
+      cls._INSTANCE = object.__new__(cls)
+      cls._INSTANCE.histograms = {
+        api: GaugeHistogram(f"s3_{api}_latency_ms", S3_API_LATENCY_BOUNDS)
+        for api in S3_ENRICHMENT_APIS
+      }
+
+    return cls._INSTANCE
+
+  def call(self, api: str, fn: Callable, **kwargs) -> Any:
+    start = monotonic()
+    try:
+      return fn(**kwargs)
+    finally:
+      self.histograms[api].observe(int((monotonic() - start) * 1000))
+
+  def register_metrics(cls, metrics: Metrics):
+    for histogram in cls._INSTANCE.histograms.values():
+      histogram.register(metrics)
+
+
+class S3EnrichmentEngine(Observable):
+  """
+  Concurrent lookups of the buckets of an account. Bucket regions are resolved once and cached
+  on disk between runs, lookups use the client of the bucket's region and are returned as each
+  bucket completes rather than in listing order.
+  """
+
+  def __init__(self, auth: AwsAuthenticator, list_region: str, concurrency: int):
+    self.auth = auth
+    self.cached = {}
+    self.concurrency = concurrency
+    self.list_region = list_region
+    self.lock = Lock()
+    self.path = disk_cache_path(f"s3_bucket_regions_{auth.account_id}.json")
+    self.regions = {}
+    self._region_cache_hits = self.metrics.register(AtomicGauge("bucket_region_cache_hits"))
+    self._region_cache_misses = self.metrics.register(AtomicGauge("bucket_region_cache_misses"))
+    self._region_cache_stale = self.metrics.register(AtomicGauge("bucket_region_cache_stale"))
+
+  def bucket_call(self, name: str, fn: Callable[[Any, str], Any]) -> Any:
+    """
+    Call `fn` with the client of the region of bucket `name` and the region. Calls failing
+    because a cached region is stale are retried once in the bucket's current region.
+    """
+    region, cached = self.region(name)
+    try:
+      return fn(self.auth.new_client("s3", region), region)
+    except ClientError as ex:
+      if not cached or ex.response["Error"]["Code"] not in S3_REGION_ERROR_CODES:
+        raise ex
+
+    self._region_cache_stale.increment()
+    region, _ = self.region(name, refresh=True)
+    return fn(self.auth.new_client("s3", region), region)
+
+  def call(self, client, api: str, **kwargs) -> Dict[str, Any]:
+    return S3ApiLatency().call(api, getattr(client, api), **kwargs)
+
+  def enrich(
+    self, buckets: List[Dict[str, Any]], fn: Callable[[Dict[str, Any]], Any]
+  ) -> Iterator[Tuple[Dict[str, Any], concurrent.futures.Future]]:
+    """
+    Apply `fn` to the listing entries of `buckets` on a bounded pool and yield every entry with
+    its future as it completes. Buckets with a cached region are submitted grouped by region so
+    the calls of a region reuse its client connections.
+    """
+    self.cached = read_json_cache(self.path, S3_BUCKET_REGION_CACHE_TTL) or {}
+    ordered = sorted(
+      buckets, key=lambda b: (b["Name"] not in self.cached, self.cached.get(b["Name"], ""))
+    )
+    try:
+      with concurrent.futures.ThreadPoolExecutor(
+        max_workers=self.concurrency, thread_name_prefix="s3-enrich"
+      ) as executor:
+        future_to_bucket = {executor.submit(fn, bucket): bucket for bucket in ordered}
+        try:
+          for future in concurrent.futures.as_completed(
+            future_to_bucket.keys(), timeout=FUTURE_TIMEOUTS["scanner"]
+          ):
+            yield future_to_bucket[future], future
+        finally:
+          for future in future_to_bucket.keys():
+            future.cancel()
+    finally:
+      self.save([b["Name"] for b in buckets])
+
+  def list_buckets(self) -> List[Dict[str, Any]]:
+    client = self.auth.new_client("s3", self.list_region)
+    return self.call(client, "list_buckets").get("Buckets", [])
+
+  def region(self, name: str, refresh: bool = False) -> Tuple[str, bool]:
+    """
+    Return the region of bucket `name` and whether it was read from the cache.
+    """
+    if not refresh and name in self.cached:
+      self._region_cache_hits.increment()
+      return self.cached[name], True
+
+    self._region_cache_misses.increment()
+    client = self.auth.new_client("s3", self.list_region)
+    resp = self.call(
+      client, "get_bucket_location", Bucket=name, ExpectedBucketOwner=self.auth.account_id
+    )
+    region = location_region(resp.get("LocationConstraint"))
+    with self.lock:
+      self.regions[name] = region
+    return region, False
+
+  def save(self, names: List[str]):
+    # regions of buckets that are no longer listed are dropped from the cache
+    with self.lock:
+      regions = {**self.cached, **self.regions}
+    write_json_cache(self.path, {n: regions[n] for n in names if n in regions})
@@ -1,54 +1,215 @@
 import concurrent.futures
 from datetime import datetime
 import math
-from typing import Any, Dict, Optional
+from threading import local, Lock
+from typing import Any, Callable, Dict, List, Optional, Set
 
 from twitter.common import log
 from twitter.common.metrics import AtomicGauge, Observable
-from util import CompletionQueue, copy_completion_queue, response_tags
-
-from aws_arn import Arn, S3Arn
+from util import (
+  account_stage_key,
+  BoundedCompletionQueue,
+  CompletionQueue,
+  copy_completion_queue,
+  response_tags,
+  ScanCheckpoint,
+)
+
+from aws_arn import Arn, S3Arn, sqs_queue_arn
 from aws_iam import AwsAuthenticator
 from aws_resource import Resource
+from aws_s3 import S3EnrichmentEngine
+from aws_tagging import TagPrefetcher
 from botocore.exceptions import ClientError
+from dataset_inventory import Inventorystore, listing_hash
 from dataset_metastore import Metastore
+from dataset_stagestore import Stagestore
 from errors import AwsMissingTTL, MisconfiguredResourceScanner
-from server_config import AWS_EXCLUDED_REGIONS, FUTURE_TIMEOUTS, RESOURCE_SCANNER_REQUIRED_ATTRS
+from server_config import (
+  AWS_EXCLUDED_REGIONS,
+  FUTURE_TIMEOUTS,
+  RESOURCE_SCANNER_REQUIRED_ATTRS,
+  SCANNER_ENRICHMENT_CONCURRENCY,
+  SCANNER_REGION_CONCURRENCY,
+)
+from server_progress import ProgressTracker
 from server_state import ServerState
 
 
 class ResourceScanner(Observable):
   _EXEMPT_SCANNER_ATTRS = []
+  # listing entry key of the resource name for APIs that list resource descriptions
+  nested_key = None
+  # resource type filter used to prefetch tags with the resource groups tagging API
+  tag_resource_type = None
 
   def __init__(self, account_id: str, authenticator: AwsAuthenticator, snk: CompletionQueue):
     self.account_id = account_id
     self.authenticator = authenticator
+    self.completed_units = set()
     self.counter = 0
-    self.metastore = Metastore(authenticator)
+    self.enrichment = None
+    self.lock = Lock()
     self.snk = snk
+    self.tag_prefetcher = TagPrefetcher(authenticator, self.tag_resource_type or self.service)
+    self._stores = local()
+    self._inventory_changed = self.metrics.register(AtomicGauge("inventory_changed"))
+    self._inventory_errors = self.metrics.register(AtomicGauge("inventory_errors"))
+    self._inventory_hits = self.metrics.register(AtomicGauge("inventory_hits"))
+    self._inventory_new = self.metrics.register(AtomicGauge("inventory_new"))
+    self._inventory_unchanged = self.metrics.register(AtomicGauge("inventory_unchanged"))
     self._list_resources_errors = self.metrics.register(AtomicGauge("list_resources_errors"))
     self._metastore_set_observed_errors = self.metrics.register(
       AtomicGauge("metastore_set_observed_errors")
     )
     self._process_resource_errors = self.metrics.register(AtomicGauge("process_resource_errors"))
     self._process_retention_errors = self.metrics.register(AtomicGauge("process_retention_errors"))
+    self._regions_resumed = self.metrics.register(AtomicGauge("regions_resumed"))
     self._regions_scanned = self.metrics.register(AtomicGauge("regions_scanned"))
+    self._tag_prefetch_hits = self.metrics.register(AtomicGauge("tag_prefetch_hits"))
+    self._tag_prefetch_misses = self.metrics.register(AtomicGauge("tag_prefetch_misses"))
+
+  @property
+  def inventory(self) -> Optional[Inventorystore]:
+    # boto3 resources are not thread safe, every region scan thread uses its own datastores.
+    if not hasattr(self._stores, "inventory"):
+      self._stores.inventory = (
+        Inventorystore(self.authenticator) if Inventorystore.enabled() else None
+      )
+    return self._stores.inventory
+
+  @property
+  def metastore(self) -> Metastore:
+    if not hasattr(self._stores, "metastore"):
+      self._stores.metastore = Metastore(self.authenticator)
+    return self._stores.metastore
+
+  def checkpoint(self, region: str):
+    # the marker follows every resource emitted for the region, see `ScanCheckpoint`
+    if Stagestore.checkpoints_enabled():
+      self.snk.put(ScanCheckpoint(self.account_id, self.scan_unit(region)))
+
+  def concurrency(self, limits: Dict[str, int]) -> int:
+    return limits.get(self.service, limits["default"])
+
+  def emit(self, resource: Resource):
+    self.snk.put(resource)
+    ProgressTracker().advance(account_stage_key(self.account_id, "scan"))
+    with self.lock:
+      self.counter += 1
 
   def handler(self, client, region: str, resource_name: str) -> Resource:
     raise NotImplementedError
 
+  def load_checkpoint(self) -> Set[str]:
+    """
+    Return the scan units of the scanner's service completed by an interrupted run.
+    """
+    if not Stagestore.checkpoints_enabled():
+      return set()
+
+    try:
+      units = ServerState().stage_store.checkpoint(self.account_id)
+    except Exception as ex:
+      log.error(f"unable to load {self.service} scan checkpoint in {self.log_sfx()}. err={ex}")
+      return set()
+    return {unit for unit in units if unit.startswith(f"{self.service}/")}
+
   def log_sfx(self, region: str = None) -> str:
     sfx = ""
     if region:
       sfx = f" region: {region}"
     return f"acct: {self.account_id}{sfx}"
 
+  def entry_name(self, entry: Any) -> str:
+    return entry[self.nested_key] if self.nested_key else entry
+
+  def inventory_snapshot(self, region: str, entries: List[Any]) -> Dict[str, Dict[str, Any]]:
+    if not self.inventory:
+      return {}
+
+    try:
+      return self.inventory.snapshot(
+        [
+          self.inventory.key(self.account_id, self.service, region, self.entry_name(entry))
+          for entry in entries
+        ]
+      )
+    except Exception as ex:
+      self._inventory_errors.increment()
+      log.error(
+        f"unable to load {self.service} inventory snapshot in {self.log_sfx(region)}. err={ex}"
+      )
+      return {}
+
+  def observe(
+    self,
+    inventory: Optional[Inventorystore],
+    client,
+    region: str,
+    entry: Any,
+    snapshot: Dict[str, Dict[str, Any]],
+    updates: List[Dict[str, Any]],
+    handler: Callable[..., Resource] = None,
+  ) -> Resource:
+    """
+    Return the resource for a listing entry. The snapshot resource is used when the entry is
+    unchanged, otherwise the resource is described by `handler` and its inventory record is
+    appended to `updates`. Runs on the enrichment pool so `inventory` is passed by the scanning
+    thread and only used to build records.
+    """
+    handler = handler or self.handler
+    if not inventory:
+      return handler(client, region, entry)
+
+    key = inventory.key(self.account_id, self.service, region, self.entry_name(entry))
+    entry_hash = listing_hash(entry)
+    record = snapshot.get(key)
+    resource = inventory.snapshot_resource(record, entry_hash)
+    if resource:
+      if ServerState().options.get("log_resource_observations"):
+        log.info(f"Observed resource: {resource.arn.arn} in {self.log_sfx(region)} (inventory).")
+      self._inventory_hits.increment()
+      return resource
+
+    resource = handler(client, region, entry)
+    update = inventory.record(key, entry_hash, resource)
+    if not record:
+      self._inventory_new.increment()
+    elif record.get("payload_hash") != update["payload_hash"]:
+      self._inventory_changed.increment()
+    else:
+      self._inventory_unchanged.increment()
+    updates.append(update)
+    return resource
+
+  def observe_all(
+    self,
+    client,
+    region: str,
+    entries: List[Any],
+    updates: List[Dict[str, Any]],
+    handler: Callable[..., Resource] = None,
+  ) -> List[concurrent.futures.Future]:
+    """
+    Submit the listing entries of a response page to the enrichment pool. Futures are returned in
+    listing order.
+    """
+    snapshot = self.inventory_snapshot(region, entries)
+    return [
+      self.enrichment.submit(
+        self.observe, self.inventory, client, region, entry, snapshot, updates, handler
+      )
+      for entry in entries
+    ]
+
   def process_response(self, client, region: str, resp: Dict[str, Any]):
-    for name in resp[self.entities_key]:
+    updates = []
+    futures = self.observe_all(client, region, resp[self.entities_key], updates)
+    for name, future in zip(resp[self.entities_key], futures):
       try:
-        resource = self.handler(client, region, name)
-        self.snk.put(resource)
-        self.counter += 1
+        resource = future.result(timeout=FUTURE_TIMEOUTS["scanner"])
+        self.emit(resource)
 
         try:
           self.metastore.set_observed(self.metastore.key(resource.arn))
@@ -65,16 +226,59 @@ class ResourceScanner(Observable):
         log.error(
           f"unable to process {self.service} resource {name} in {self.log_sfx(region)}. err={ex}"
         )
+        for future in futures:
+          future.cancel()
         raise ex
 
+    self.update_inventory(region, updates)
+
+  def resource_tags(
+    self, region: str, arn: str, list_tags: Callable[[], List[Dict[str, str]]]
+  ) -> List[Dict[str, str]]:
+    """
+    Return the tags of a resource from the prefetched tags of its region. `list_tags` is only
+    called for resources missing from the tagging API response.
+    """
+    if ServerState().options.get("disable_tag_queries"):
+      return []
+
+    tags = self.tag_prefetcher.tags(region).get(arn)
+    if tags is not None:
+      self._tag_prefetch_hits.increment()
+      return tags
+
+    self._tag_prefetch_misses.increment()
+    return list_tags()
+
   def scan(self):
+    # regions are scanned concurrently and listed resources are described on a separate pool
+    # shared by all regions. resources are emitted in listing order within a response page,
+    # the sink is only completed once every region has been scanned.
     try:
       self.validate()
+      self.completed_units = self.load_checkpoint()
+      self.start_enrichment()
       session = self.authenticator.new_session()
-      for region in session.get_available_regions(self.service):
-        self.scan_region(region)
-        self._regions_scanned.increment()
+      with concurrent.futures.ThreadPoolExecutor(
+        max_workers=self.concurrency(SCANNER_REGION_CONCURRENCY),
+        thread_name_prefix=f"{self.service}-scan",
+      ) as executor:
+        futures = [
+          executor.submit(self.scan_region, region)
+          for region in session.get_available_regions(self.service)
+        ]
+        try:
+          for future in concurrent.futures.as_completed(
+            futures, timeout=FUTURE_TIMEOUTS["scanner"]
+          ):
+            _ = future.result()
+            self._regions_scanned.increment()
+        except Exception as ex:
+          for future in futures:
+            future.cancel()
+          raise ex
     finally:
+      self.stop_enrichment()
       log.info(
         "{} scan complete ({} resources). {}".format(
           self.__class__.__name__, self.counter, self.log_sfx()
@@ -89,6 +293,10 @@ class ResourceScanner(Observable):
         f"skipping {self.service} resource scanning in opt-in region: {self.log_sfx(region)}."
       )
       return
+    elif self.scan_unit(region) in self.completed_units:
+      log.info(f"skipping {self.service} resources registered by the last run in {self.log_sfx(region)}.")
+      self._regions_resumed.increment()
+      return
     else:
       log.info(f"scanning {self.service} resources in {self.log_sfx(region)}.")
 
@@ -97,10 +305,37 @@ class ResourceScanner(Observable):
       for resp in client.get_paginator(self.scan_method).paginate():
         if self.entities_key in resp.keys():
           self.process_response(client, region, resp)
+      self.checkpoint(region)
     except ClientError as ex:
       log.error(f"unable to list {self.service} resources in {self.log_sfx(region)}. err={ex}")
       self._list_resources_errors.increment()
 
+  def scan_unit(self, region: str) -> str:
+    return f"{self.service}/{region}"
+
+  def start_enrichment(self):
+    self.enrichment = concurrent.futures.ThreadPoolExecutor(
+      max_workers=self.concurrency(SCANNER_ENRICHMENT_CONCURRENCY),
+      thread_name_prefix=f"{self.service}-enrich",
+    )
+
+  def stop_enrichment(self):
+    if self.enrichment:
+      self.enrichment.shutdown(wait=True)
+      self.enrichment = None
+
+  def update_inventory(self, region: str, updates: List[Dict[str, Any]]):
+    if not updates:
+      return
+
+    try:
+      self.inventory.batch_put(updates)
+    except Exception as ex:
+      self._inventory_errors.increment()
+      log.error(
+        f"unable to update {self.service} inventory snapshot in {self.log_sfx(region)}. err={ex}"
+      )
+
   def validate(self):
     for attr in RESOURCE_SCANNER_REQUIRED_ATTRS:
       if attr not in self._EXEMPT_SCANNER_ATTRS:
@@ -114,7 +349,9 @@ class ElastiCacheSnapshotScanner(ResourceScanner):
     self.entities_key = "Snapshots"
     self.scan_method = "describe_snapshots"
     self.service = "elasticache"
-    super().__init__(account_id, authenticator, CompletionQueue())
+    self.tag_resource_type = "elasticache:snapshot"
+    self.nested_key = "SnapshotName"
+    super().__init__(account_id, authenticator, BoundedCompletionQueue("scanner_queue"))
     self._observed_elasticache_snapshots = self.metrics.register(
       AtomicGauge("observed_elasticache_snapshots")
     )
@@ -125,9 +362,9 @@ class ElastiCacheSnapshotScanner(ResourceScanner):
     engine_type = snapshot["Engine"]
     engine_version = snapshot["EngineVersion"]
 
-    tags = []
-    if not ServerState().options.get("disable_tag_queries"):
-      tags = response_tags(client.list_tags_for_resource(ResourceName=arn))
+    tags = self.resource_tags(
+      region, arn, lambda: response_tags(client.list_tags_for_resource(ResourceName=arn))
+    )
 
     if ServerState().options.get("log_resource_observations"):
       log.info(f"Observed resource: {arn} in {self.log_sfx(region)}.")
@@ -153,7 +390,9 @@ class ElastiCacheClusterScanner(ResourceScanner):
     self.entities_key = "CacheClusters"
     self.scan_method = "describe_cache_clusters"
     self.service = "elasticache"
-    super().__init__(account_id, authenticator, CompletionQueue())
+    self.tag_resource_type = "elasticache:cluster"
+    self.nested_key = "CacheClusterId"
+    super().__init__(account_id, authenticator, BoundedCompletionQueue("scanner_queue"))
     self._observed_elasticache_clusters = self.metrics.register(
       AtomicGauge("observed_elasticache_clusters")
     )
@@ -167,9 +406,9 @@ class ElastiCacheClusterScanner(ResourceScanner):
     transit_encryption = cluster["TransitEncryptionEnabled"]
     engine_version = cluster["EngineVersion"]
 
-    tags = []
-    if not ServerState().options.get("disable_tag_queries"):
-      tags = response_tags(client.list_tags_for_resource(ResourceName=arn))
+    tags = self.resource_tags(
+      region, arn, lambda: response_tags(client.list_tags_for_resource(ResourceName=arn))
+    )
 
     if ServerState().options.get("log_resource_observations"):
       log.info(f"Observed resource: {arn} in {self.log_sfx(region)}.")
@@ -197,7 +436,8 @@ class DAXScanner(ResourceScanner):
     self.entities_key = "Clusters"
     self.scan_method = "describe_clusters"
     self.service = "dax"
-    super().__init__(account_id, authenticator, CompletionQueue())
+    self.nested_key = "ClusterName"
+    super().__init__(account_id, authenticator, BoundedCompletionQueue("scanner_queue"))
     self._observed_clusters = self.metrics.register(AtomicGauge("observed_clusters"))
 
   def retention(self, client, cluster_name: str, region: str, parameter_group_name: str) -> dict:
@@ -243,9 +483,9 @@ class DAXScanner(ResourceScanner):
       elif cluster["SSEDescription"]["Status"] == "DISABLED":
         encryption_status = "Disabled"
 
-    tags = []
-    if not ServerState().options.get("disable_tag_queries"):
-      tags = response_tags(client.list_tags(ResourceName=arn))
+    tags = self.resource_tags(
+      region, arn, lambda: response_tags(client.list_tags(ResourceName=arn))
+    )
     properties = {
       "EncryptionStatus": encryption_status,
       "Tags": tags,
@@ -275,7 +515,8 @@ class DynamoDbScanner(ResourceScanner):
     self.entities_key = "TableNames"
     self.scan_method = "list_tables"
     self.service = "dynamodb"
-    super().__init__(account_id, authenticator, CompletionQueue())
+    self.tag_resource_type = "dynamodb:table"
+    super().__init__(account_id, authenticator, BoundedCompletionQueue("scanner_queue"))
     self._observed_tables = self.metrics.register(AtomicGauge("observed_tables"))
 
   def retention_enabled(self, client, name: str, region: str) -> Optional[Dict[str, str]]:
@@ -298,9 +539,9 @@ class DynamoDbScanner(ResourceScanner):
     table = client.describe_table(TableName=resource_name)["Table"]
     arn = table["TableArn"]
     name = table["TableName"]
-    tags = []
-    if not ServerState().options.get("disable_tag_queries"):
-      tags = response_tags(client.list_tags_of_resource(ResourceArn=arn))
+    tags = self.resource_tags(
+      region, arn, lambda: response_tags(client.list_tags_of_resource(ResourceArn=arn))
+    )
 
     if ServerState().options.get("log_resource_observations"):
       log.info(f"Observed resource: {arn} in {self.log_sfx(region)}.")
@@ -327,7 +568,8 @@ class KinesisScanner(ResourceScanner):
     self.entities_key = "StreamNames"
     self.scan_method = "list_streams"
     self.service = "kinesis"
-    super().__init__(account_id, authenticator, CompletionQueue())
+    self.tag_resource_type = "kinesis:stream"
+    super().__init__(account_id, authenticator, BoundedCompletionQueue("scanner_queue"))
     self._observed_streams = self.metrics.register(AtomicGauge("observed_streams"))
 
   def encryption_status(self, encryption_type: str) -> Dict[str, str]:
@@ -339,9 +581,9 @@ class KinesisScanner(ResourceScanner):
   def handler(self, client, region: str, resource_name: str) -> Resource:
     stream = client.describe_stream_summary(StreamName=resource_name)["StreamDescriptionSummary"]
     arn = stream["StreamARN"]
-    tags = []
-    if not ServerState().options.get("disable_tag_queries"):
-      tags = response_tags(client.list_tags_for_stream(StreamName=resource_name))
+    tags = self.resource_tags(
+      region, arn, lambda: response_tags(client.list_tags_for_stream(StreamName=resource_name))
+    )
 
     if ServerState().options.get("log_resource_observations"):
       log.info(f"Observed resource: {arn} in {self.log_sfx(region)}.")
@@ -369,12 +611,17 @@ class S3Scanner(ResourceScanner):
     self._EXEMPT_SCANNER_ATTRS = ["scan_method"]
     self.entities_key = "Buckets"
     self.service = "s3"
-    super().__init__(account_id, authenticator, CompletionQueue())
+    self.nested_key = "Name"
+    super().__init__(account_id, authenticator, BoundedCompletionQueue("scanner_queue"))
+    self.engine = S3EnrichmentEngine(
+      authenticator, self._SCAN_REGION, self.concurrency(SCANNER_ENRICHMENT_CONCURRENCY)
+    )
+    self.metrics.register_observable("enrichment", self.engine)
     self._observed_buckets = self.metrics.register(AtomicGauge("observed_buckets"))
 
   def encryption_status(self, client, name: str) -> Dict[str, str]:
     try:
-      resp = client.get_bucket_encryption(Bucket=name)
+      resp = self.engine.call(client, "get_bucket_encryption", Bucket=name)
       if "ServerSideEncryptionConfiguration" in resp.keys():
         if "Rules" in resp["ServerSideEncryptionConfiguration"].keys():
           for rule in resp["ServerSideEncryptionConfiguration"]["Rules"]:
@@ -396,7 +643,7 @@ class S3Scanner(ResourceScanner):
 
   def retention(self, client, name: str, region: str) -> Optional[int]:
     try:
-      resp = client.get_bucket_lifecycle_configuration(Bucket=name)
+      resp = self.engine.call(client, "get_bucket_lifecycle_configuration", Bucket=name)
       if "Rules" in resp.keys():
         for rule in resp["Rules"]:
           if "Status" in rule.keys() and rule["Status"] == "Enabled":
@@ -423,41 +670,51 @@ class S3Scanner(ResourceScanner):
         f"unable to list {self.service} lifecycle rules for {name} in {self.log_sfx(region)}. err={ex}"
       )
 
+  def bucket_handler(self, _client, _region: str, entity: Dict[str, Any]) -> Resource:
+    return self.engine.bucket_call(
+      entity["Name"], lambda client, region: self.handler(client, region, entity)
+    )
+
   def scan(self):
     # The S3 API doesn't support regional resource listing or pagination requiring
-    # the parent class scan method to be overridden.
+    # the parent class scan method to be overridden. Buckets are described by the
+    # enrichment engine with clients of their regions and emitted as they complete.
     try:
       self.validate()
-      client = self.authenticator.new_client(self.service, self._SCAN_REGION)
-      resp = client.list_buckets()
-      if self.entities_key in resp.keys():
-        for entity in resp[self.entities_key]:
-          # the S3 ListBuckets response data-structure differs from the expected behaivor
-          # within the parent scanner class.
-          name = entity["Name"]
-
-          try:
-            region = client.get_bucket_location(Bucket=name)["LocationConstraint"]
-            # S3 buckets that return a `null` `LocationConstraint` value are located in `us-east-1`
-            # as-per the docs and AWS support (Account ID: 673964658973, Support Case ID: 8246504281)
-            # https://docs.aws.amazon.com/AmazonS3/latest/API/API_GetBucketLocation.html#API_GetBucketLocation_ResponseSyntax
-            if region is None:
-              region = "us-east-1"
-            elif region == "EU":
-              region = "eu-west-1"
-
-            resource = self.handler(client, region, entity)
-            self.snk.put(resource)
-            self.counter += 1
-          except ClientError as ex:
-            if ex.response["Error"]["Code"] != "NoSuchBucket":
-              self._process_resource_errors.increment()
-              log.error(
-                f"unable to process {self.service} resource {name} in {self.log_sfx(self._SCAN_REGION)}. err={ex}"
-              )
-            continue
+      if self.scan_unit(self._SCAN_REGION) in self.load_checkpoint():
+        log.info(f"skipping {self.service} resources registered by the last run in {self.log_sfx()}.")
+        self._regions_resumed.increment()
+        return
+
+      buckets = self.engine.list_buckets()
+      # buckets are listed globally so inventory records are keyed by the scan region
+      inventory = self.inventory
+      snapshot = self.inventory_snapshot(self._SCAN_REGION, buckets)
+      updates = []
+
+      def observe(entity: Dict[str, Any]) -> Resource:
+        return self.observe(
+          inventory, None, self._SCAN_REGION, entity, snapshot, updates, self.bucket_handler
+        )
+
+      for entity, future in self.engine.enrich(buckets, observe):
+        # the S3 ListBuckets response data-structure differs from the expected behaivor
+        # within the parent scanner class.
+        name = entity["Name"]
 
-        self._regions_scanned.increment()
+        try:
+          self.emit(future.result())
+        except ClientError as ex:
+          if ex.response["Error"]["Code"] != "NoSuchBucket":
+            self._process_resource_errors.increment()
+            log.error(
+              f"unable to process {self.service} resource {name} in {self.log_sfx(self._SCAN_REGION)}. err={ex}"
+            )
+          continue
+
+      self.update_inventory(self._SCAN_REGION, updates)
+      self.checkpoint(self._SCAN_REGION)
+      self._regions_scanned.increment()
     except ClientError as ex:
       log.error(
         f"unable to list {self.service} resources in {self.log_sfx(self._SCAN_REGION)}. err={ex}"
@@ -471,17 +728,18 @@ class S3Scanner(ResourceScanner):
       )
       self.snk.set_completed()
 
+  def bucket_tags(self, client, name: str) -> List[Dict[str, str]]:
+    try:
+      return response_tags(self.engine.call(client, "get_bucket_tagging", Bucket=name), "TagSet")
+    except ClientError as ex:
+      if ex.response["Error"]["Code"] != "NoSuchTagSet":
+        raise ex
+      return []
+
   def handler(self, client, region: str, entity: Dict[str, Any]) -> Resource:
     name = entity["Name"]
-    tags = []
-    if not ServerState().options.get("disable_tag_queries"):
-      try:
-        tags = response_tags(client.get_bucket_tagging(Bucket=name), "TagSet")
-      except ClientError as ex:
-        if ex.response["Error"]["Code"] != "NoSuchTagSet":
-          raise ex
-
     arn = S3Arn(name, self.account_id, region)
+    tags = self.resource_tags(region, arn.arn, lambda: self.bucket_tags(client, name))
     if ServerState().options.get("log_resource_observations"):
       log.info(f"Observed resource: {arn.arn} in {self.log_sfx(region)}.")
     self._observed_buckets.increment()
@@ -507,10 +765,30 @@ class SqsScanner(ResourceScanner):
     self.entities_key = "QueueUrls"
     self.scan_method = "list_queues"
     self.service = "sqs"
-    super().__init__(account_id, authenticator, CompletionQueue())
+    super().__init__(account_id, authenticator, BoundedCompletionQueue("scanner_queue"))
     self._observed_queues = self.metrics.register(AtomicGauge("observed_queues"))
 
+  def queue_tags(self, client, url: str) -> List[Dict[str, str]]:
+    # SQS tags are in a different format than other resource types.
+    # Empty tag responses omit the `Tags` map key which also differs from other resource APIs.
+    # Convert SQS tag structure before assinging them to the `Resource` class so they can be
+    # processed uniformly during the registration stage.
+    tags = []
+    queue_tags = client.list_queue_tags(QueueUrl=url)
+    if "Tags" in queue_tags.keys():
+      for key, value in queue_tags["Tags"].items():
+        tags.append(
+          {
+            "Key": key,
+            "Value": value,
+          }
+        )
+    return tags
+
   def handler(self, client, region: str, resource_name: str) -> Resource:
+    # queue ARNs are derived from their URL, only the attributes of the
+    # dataset's properties are requested.
+    arn = sqs_queue_arn(resource_name)
     queue = client.get_queue_attributes(
       QueueUrl=resource_name,
       AttributeNames=[
@@ -518,7 +796,6 @@ class SqsScanner(ResourceScanner):
         "KmsMasterKeyId",
         "LastModifiedTimestamp",
         "MessageRetentionPeriod",
-        "QueueArn",
       ],
     )
 
@@ -527,23 +804,7 @@ class SqsScanner(ResourceScanner):
       encryption_status["EncryptionStatus"] = "Enabled"
       encryption_status["EncryptionType"] = "KMS"
 
-    # SQS tags are in a different format than other resource types.
-    # Empty tag responses omit the `Tags` map key which also differs from other resource APIs.
-    # Convert SQS tag structure before assinging them to the `Resource` class so they can be
-    # processed uniformly during the registration stage.
-    tags = []
-    if not ServerState().options.get("disable_tag_queries"):
-      queue_tags = client.list_queue_tags(QueueUrl=resource_name)
-      if "Tags" in queue_tags.keys():
-        for key, value in queue_tags["Tags"].items():
-          tags.append(
-            {
-              "Key": key,
-              "Value": value,
-            }
-          )
-
-    arn = Arn(queue["Attributes"]["QueueArn"])
+    tags = self.resource_tags(region, arn.arn, lambda: self.queue_tags(client, resource_name))
     if ServerState().options.get("log_resource_observations"):
       log.info(f"Observed resource: {arn.arn} in {self.log_sfx(region)}.")
     self._observed_queues.increment()
@@ -580,6 +841,10 @@ def get_all_resources(account_id: str, snk: CompletionQueue, *scanners: Resource
 
       for future in concurrent.futures.as_completed(futures, timeout=FUTURE_TIMEOUTS["scanner"]):
         _ = future.result()
+
+    # the account checkpoint is cleared once every resource has been registered
+    if Stagestore.checkpoints_enabled():
+      snk.put(ScanCheckpoint(account_id))
   except Exception as ex:
     log.exception(f"`get_all_resources` exception: {ex}")
     raise ex
@@ -0,0 +1,52 @@
+from threading import Lock
+from typing import Dict, List
+
+from twitter.common import log
+
+from aws_iam import AwsAuthenticator
+from botocore.exceptions import ClientError
+from server_config import TAGGING_API_PAGE_SIZE
+
+
+class TagPrefetcher:
+  """
+  Fetches the tags of every resource of a type in a region with the Resource Groups Tagging API
+  `GetResources` method, which replaces one `list_tags_*` call per resource with one paginated
+  call per region. The API only returns resources that are or were tagged, callers must fall
+  back to the per-resource API for ARNs missing from the map.
+  """
+
+  def __init__(self, authenticator: AwsAuthenticator, resource_type: str):
+    self.authenticator = authenticator
+    self.resource_type = resource_type
+    self.lock = Lock()
+    self.region_locks = {}
+    self.regions = {}
+
+  def fetch(self, region: str) -> Dict[str, List[Dict[str, str]]]:
+    tags = {}
+    try:
+      client = self.authenticator.new_client("resourcegroupstaggingapi", region)
+      for page in client.get_paginator("get_resources").paginate(
+        ResourceTypeFilters=[self.resource_type], ResourcesPerPage=TAGGING_API_PAGE_SIZE
+      ):
+        for mapping in page.get("ResourceTagMappingList", []):
+          tags[mapping["ResourceARN"]] = mapping.get("Tags", [])
+    except ClientError as ex:
+      # resources missing from a partial map are tagged using the per-resource APIs
+      log.warn(
+        f"unable to prefetch {self.resource_type} tags in region: {region} acct: {self.authenticator.account_id}. err={ex}"
+      )
+    return tags
+
+  def tags(self, region: str) -> Dict[str, List[Dict[str, str]]]:
+    """
+    Return the ARN to tags map of a region, regions are fetched once on first use.
+    """
+    with self.lock:
+      region_lock = self.region_locks.setdefault(region, Lock())
+
+    with region_lock:
+      if region not in self.regions:
+        self.regions[region] = self.fetch(region)
+    return self.regions[region]
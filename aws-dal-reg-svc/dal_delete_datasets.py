@@ -20,7 +20,7 @@ from com.twitter.statebird.v2.thriftpython.ttypes import Environment
 
 from aws_arn import Arn, S3Arn
 from aws_iam import get_authenticator
-from aws_organizations import get_accounts
+from aws_organizations import get_active_accounts
 from dataset_metastore import Metastore
 from dataset_stagestore import Stagestore
 from kite_role import KiteRole
@@ -70,6 +70,12 @@ app.add_option(
   dest="disable_metastore_deletion",
   help="Disable metastore DynamoDB record deletions.",
 )
+app.add_option(
+  "--disk-cache-dir",
+  default=None,
+  dest="disk_cache_dir",
+  help="Directory of the on-disk caches shared across runs.",
+)
 app.add_option(
   "--dry-run",
   action="store_true",
@@ -246,8 +252,9 @@ def main(args, options):
 
   # Account IDs
   active_accounts = None
+  active_accounts_refreshed = False
   if options.deleted_accounts or options.reconcile:
-    active_accounts = get_accounts(get_authenticator(AWS_ORGANIZATION_ACCOUNT_ID), False)
+    active_accounts = get_active_accounts(get_authenticator(AWS_ORGANIZATION_ACCOUNT_ID))
 
   # Query datasets
   if options.env == "staging":
@@ -311,6 +318,12 @@ def main(args, options):
 
     should_process = False
     if options.deleted_accounts:
+      if account_id not in active_accounts and not active_accounts_refreshed:
+        # cached account metadata may predate the account, refresh it before deleting datasets
+        active_accounts = get_active_accounts(
+          get_authenticator(AWS_ORGANIZATION_ACCOUNT_ID), refresh=True
+        )
+        active_accounts_refreshed = True
       if account_id not in active_accounts:
         should_process = ProcessReason.DELETED_ACCOUNT
     if not should_process and options.dataset_filter and pattern.match(name):
@@ -1,5 +1,6 @@
 from base64 import b64decode
 from binascii import Error
+import hashlib
 import json
 from json.decoder import JSONDecodeError
 from threading import Event
@@ -8,7 +9,7 @@ from typing import Any, Dict, List, Optional, Tuple, Type, Union
 
 from twitter.common import log
 from twitter.common.metrics import AtomicGauge, Observable
-from util import CompletionQueue, tag_value
+from util import CompletionQueue, ScanCheckpoint, tag_value
 
 from com.twitter.dal.dataclassification.ttypes import DataClassificationLevel
 from com.twitter.dal.has_personal_data.ttypes import HasPersonalData
@@ -31,6 +32,24 @@ from server_config import REGISTRATION_EXCLUSION_MIN_INTERVAL, SVC_ROLE
 from server_state import ServerState
 
 
+def canonical_value(value: Any) -> Any:
+  """
+  Convert `value` to a JSON serializable value that does not depend on set ordering. Thrift
+  structs and other objects are converted to a map of their attributes.
+  """
+  if isinstance(value, dict):
+    return {
+      json.dumps(canonical_value(k), sort_keys=True): canonical_value(v) for k, v in value.items()
+    }
+  elif isinstance(value, (frozenset, set)):
+    return sorted((canonical_value(v) for v in value), key=lambda v: json.dumps(v, sort_keys=True))
+  elif isinstance(value, (list, tuple)):
+    return [canonical_value(v) for v in value]
+  elif hasattr(value, "__dict__"):
+    return {"type": type(value).__name__, "fields": canonical_value(vars(value))}
+  return value
+
+
 class Dataset:
   def __init__(self, resource: Resource, accesses: List[IamObservedAccess]):
     self.accesses = accesses
@@ -221,6 +240,28 @@ class Dataset:
     if self.resource.arn.account_id in ServerState().meta["account_default_projects"].keys():
       return ServerState().meta["account_default_projects"][self.resource.arn.account_id]
 
+  def fingerprint(self) -> str:
+    """
+    Digest of the payload registered with DAL and Kite for the dataset, including its sorted
+    accesses.
+    """
+    payload = {
+      "accesses": sorted([a.entity_arn, sorted(a.levels)] for a in self.accesses),
+      "annotations": self.annotations(),
+      "classification": self.data_classification_level(),
+      "kite_role": self.kite_role(),
+      "name": self.name(),
+      "owner": self.owner(),
+      "pii": self.contains_pii(),
+      "project": self.project(),
+      "properties": self.properties(),
+      "records_classes": self.records_classes(),
+      "retention": self.retention,
+      "schema": self.schema(),
+    }
+    encoded = json.dumps(canonical_value(payload), sort_keys=True).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
   def kite_role(self) -> Optional[Type[KiteRole]]:
     return build_kite_role(self.resource.arn, self.project())
 
@@ -284,7 +325,20 @@ class DatasetFilter(Observable):
     self._excluded = self.metrics.register(AtomicGauge("excluded"))
 
   def process(self, resource: Resource):
-    record = self.metastore.get_regional_or_global(resource.arn)
+    self.process_record(resource, self.metastore.get_regional_or_global(resource.arn))
+
+  def process_batch(self, resources: List[Union[Resource, ScanCheckpoint]]):
+    records = self.metastore.batch_get_regional_or_global(
+      [r.arn for r in resources if not isinstance(r, ScanCheckpoint)]
+    )
+    for resource in resources:
+      if isinstance(resource, ScanCheckpoint):
+        # checkpoint markers are forwarded in order with the emitted resources
+        self.snk.put(resource)
+        continue
+      self.process_record(resource, records[resource.arn.arn])
+
+  def process_record(self, resource: Resource, record: Optional[Dict[str, Any]]):
     if record and "registered" in record.keys():
       registered = int(record["registered"])
       if not ServerState().options.get("disable_resource_filter"):
@@ -0,0 +1,79 @@
+from hashlib import sha256
+import json
+from time import time
+from typing import Any, Dict, List, Optional
+
+from twitter.common import log
+from util import jitter_ttl
+
+from aws_iam import AwsAuthenticator
+from aws_resource import Resource
+from datastore import Datastore
+from server_config import (
+  DYNAMO_INVENTORY_TABLE_NAME,
+  DYNAMO_INVENTORY_TABLE_TTL,
+  INVENTORY_REFRESH_MAX_AGE,
+)
+from server_state import ServerState
+
+
+def listing_hash(entry: Any) -> str:
+  return sha256(json.dumps(entry, default=str, sort_keys=True).encode()).hexdigest()
+
+
+class Inventorystore(Datastore):
+  """
+  Per-account snapshot of the resources described by the scanners. Records are keyed by resource
+  listing entry and hold a hash of the entry, a hash of the described resource and the resource
+  itself. Scanners emit the snapshot resource for unchanged listing entries instead of calling
+  the describe and tag APIs until the record is due a refresh.
+  """
+
+  def __init__(self, auth: AwsAuthenticator):
+    super().__init__(auth, DYNAMO_INVENTORY_TABLE_NAME)
+
+  @staticmethod
+  def enabled() -> bool:
+    # only enabled by binaries that define the `--disable-inventory-snapshot` option
+    return ServerState().options.get("inventory_snapshot", False)
+
+  def key(self, account_id: str, service: str, region: str, name: str) -> str:
+    return "/".join([account_id, service, region, name])
+
+  def record(self, key: str, entry_hash: str, resource: Resource) -> Dict[str, Any]:
+    payload = resource.to_json()
+    now = int(time())
+    return {
+      "ID": key,
+      "arn": resource.arn.arn,
+      "expire": now + DYNAMO_INVENTORY_TABLE_TTL,
+      "last_seen": now,
+      "listing_hash": entry_hash,
+      "payload_hash": sha256(payload.encode()).hexdigest(),
+      # refreshes are spread out so resources listed together are not all due in the same run
+      "refresh_at": now + jitter_ttl(INVENTORY_REFRESH_MAX_AGE),
+      "resource": payload,
+    }
+
+  def snapshot_resource(
+    self, record: Optional[Dict[str, Any]], entry_hash: str
+  ) -> Optional[Resource]:
+    """
+    Return the snapshot resource when the listing entry is unchanged and the record is not due a
+    refresh.
+    """
+    if (
+      not record
+      or record.get("listing_hash") != entry_hash
+      or int(record.get("refresh_at", 0)) <= time()
+    ):
+      return None
+
+    try:
+      return Resource.from_json(record["resource"])
+    except Exception as ex:
+      log.warn(f"unable to load inventory snapshot for {record['ID']}. err={ex}")
+      return None
+
+  def snapshot(self, keys: List[str]) -> Dict[str, Dict[str, Any]]:
+    return self.batch_get(keys)
@@ -1,15 +1,27 @@
-from time import time
-from typing import Any, Dict, Optional
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic, time
+from typing import Any, Dict, List, Optional, Tuple
+
+from twitter.common.metrics import AtomicGauge
+from twitter.common.metrics.metrics import Metrics
 
 from aws_arn import Arn
 from aws_iam import AwsAuthenticator
+from botocore.exceptions import ClientError
 from datastore import Datastore
-from server_config import DYNAMO_METASTORE_TABLE_NAME, INIT_TS_FIELD_PFX
+from server_config import (
+  DYNAMO_METASTORE_CACHE_SIZE,
+  DYNAMO_METASTORE_CACHE_TTL,
+  DYNAMO_METASTORE_TABLE_NAME,
+  INIT_TS_FIELD_PFX,
+  REGISTRATION_FINGERPRINTS_FIELD,
+)
 from server_state import ServerState
 
 
 def should_set_init_field(field: str, record: Dict[str, Any]) -> bool:
-  if field in ("created_at", "refresh_at"):
+  if field in ("created_at", "refresh_at", REGISTRATION_FINGERPRINTS_FIELD):
     return False
 
   init_field = INIT_TS_FIELD_PFX + field
@@ -24,9 +36,91 @@ def should_set_init_field(field: str, record: Dict[str, Any]) -> bool:
   return True
 
 
+def merge_fingerprints(current: Any, fingerprints: Dict[str, Optional[str]]) -> Dict[str, str]:
+  """
+  Apply fingerprint updates to the fingerprints map of a record, `None` values remove the ARN.
+  Values other than a map, such as timestamps written by older releases, are replaced.
+  """
+  merged = dict(current) if isinstance(current, dict) else {}
+  for arn, fingerprint in fingerprints.items():
+    if fingerprint is None:
+      merged.pop(arn, None)
+    else:
+      merged[arn] = fingerprint
+  return merged
+
+
+class MetastoreCache:
+  """
+  Process-wide LRU cache of metastore records keyed by record ID. Records are cached when read
+  and updated when written by `Metastore`, so pipeline stages processing the same resource
+  share a single read. Missing records are cached as `None`, writes never rely on a cached miss
+  and invalidate it when the record turns out to exist.
+  """
+
+  _INSTANCE = None
+
+  def __new__(cls):
+    if not cls._INSTANCE:
+      cls._INSTANCE = object.__new__(cls)
+      cls._INSTANCE.lock = Lock()
+      cls._INSTANCE.records = OrderedDict()
+      cls._INSTANCE.maxsize = DYNAMO_METASTORE_CACHE_SIZE
+      cls._INSTANCE.ttl = DYNAMO_METASTORE_CACHE_TTL
+      cls._INSTANCE.metrics = {}
+      for m in ("evictions", "expired", "hit", "miss", "write"):
+        cls._INSTANCE.metrics[m] = AtomicGauge(f"metastore_cache_{m}")
+
+    return cls._INSTANCE
+
+  def register_metrics(cls, metrics: Metrics):
+    for _, gauge in cls._INSTANCE.metrics.items():
+      metrics.register(gauge)
+
+  def enabled(self) -> bool:
+    # only enabled by binaries that define the `--disable-metastore-cache` option
+    return ServerState().options.get("metastore_cache", False)
+
+  def get(self, key: str) -> Tuple[bool, Optional[Dict[str, Any]]]:
+    """
+    Return whether `key` is cached and a copy of its record.
+    """
+    with self.lock:
+      entry = self.records.get(key)
+      if entry:
+        expires_at, record = entry
+        if expires_at > monotonic():
+          self.records.move_to_end(key)
+          self.metrics["hit"].increment()
+          return True, dict(record) if record else None
+
+        del self.records[key]
+        self.metrics["expired"].increment()
+
+    self.metrics["miss"].increment()
+    return False, None
+
+  def put(self, key: str, record: Optional[Dict[str, Any]]):
+    with self.lock:
+      self.records[key] = (monotonic() + self.ttl, dict(record) if record else None)
+      self.records.move_to_end(key)
+      while len(self.records) > self.maxsize:
+        self.records.popitem(last=False)
+        self.metrics["evictions"].increment()
+
+  def update(self, key: str, record: Dict[str, Any]):
+    self.put(key, record)
+    self.metrics["write"].increment()
+
+  def invalidate(self, key: str):
+    with self.lock:
+      self.records.pop(key, None)
+
+
 class Metastore(Datastore):
   def __init__(self, auth: AwsAuthenticator):
     super().__init__(auth, DYNAMO_METASTORE_TABLE_NAME)
+    self.cache = MetastoreCache()
     self.supplemental_fields = [
       "annotations",
       "contains_pii",
@@ -35,6 +129,41 @@ class Metastore(Datastore):
       "schema",
     ]
 
+  def get(self, key: str) -> Optional[Dict[str, Any]]:
+    if not self.cache.enabled():
+      return super().get(key)
+
+    cached, record = self.cache.get(key)
+    if not cached:
+      record = super().get(key)
+      self.cache.put(key, record)
+    return record
+
+  def batch_get(self, keys: List[str]) -> Dict[str, Dict[str, Any]]:
+    if not self.cache.enabled():
+      return super().batch_get(keys)
+
+    records = {}
+    uncached_keys = []
+    for key in dict.fromkeys(keys):
+      cached, record = self.cache.get(key)
+      if not cached:
+        uncached_keys.append(key)
+      elif record:
+        records[key] = record
+
+    if len(uncached_keys) > 0:
+      fetched = super().batch_get(uncached_keys)
+      for key in uncached_keys:
+        self.cache.put(key, fetched.get(key))
+      records.update(fetched)
+
+    return records
+
+  def delete(self, key: str) -> Dict[str, Any]:
+    self.cache.invalidate(key)
+    return super().delete(key)
+
   # It is a common use-case to have N resources defined in different regions
   # with the same name to support regional deployments. The registration service
   # will reuse the same dataset metadata for each regional resource by default.
@@ -47,11 +176,44 @@ class Metastore(Datastore):
     k = self.key(arn)
     if arn.region:
       regional_record = self.get("/".join([arn.region, k]))
-      if regional_record and any(f in regional_record for f in self.supplemental_fields):
+      if self.is_regional_override(regional_record):
         return regional_record
 
     return self.get(k)
 
+  def batch_get_regional_or_global(self, arns: List[Arn]) -> Dict[str, Optional[Dict[str, Any]]]:
+    """
+    Batched `get_regional_or_global`, returns records keyed by ARN.
+    """
+    records = self.batch_get(self.regional_and_global_keys(arns))
+    return {arn.arn: self.select_regional_or_global(arn, records) for arn in arns}
+
+  def is_regional_override(self, record: Optional[Dict[str, Any]]) -> bool:
+    return bool(record) and any(f in record for f in self.supplemental_fields)
+
+  def regional_and_global_keys(self, arns: List[Arn]) -> List[str]:
+    keys = []
+    for arn in arns:
+      k = self.key(arn)
+      if arn.region:
+        keys.append("/".join([arn.region, k]))
+      keys.append(k)
+    return keys
+
+  def select_regional_or_global(
+    self, arn: Arn, records: Dict[str, Dict[str, Any]]
+  ) -> Optional[Dict[str, Any]]:
+    """
+    Resolve the record for `arn` from records fetched for `regional_and_global_keys`.
+    """
+    k = self.key(arn)
+    if arn.region:
+      regional_record = records.get("/".join([arn.region, k]))
+      if self.is_regional_override(regional_record):
+        return regional_record
+
+    return records.get(k)
+
   def key(self, arn: Arn, regional: bool = False) -> str:
     if regional:
       return "/".join([arn.region, arn.service, arn.resource])
@@ -66,20 +228,170 @@ class Metastore(Datastore):
     if not value:
       value = int(time())
     record = self.get(key)
-    if record:
-      update_expression = f"SET {field} = :value"
-      if should_set_init_field(field, record):
-        update_expression = update_expression + f", {init_field} = :value"
-      self.table.update_item(
-        Key={"ID": key},
-        ExpressionAttributeValues={":value": value},
-        UpdateExpression=update_expression,
-      )
-    else:
-      record = {"ID": key, field: value}
-      if should_set_init_field(field, record):
-        record[init_field] = value
-      self.table.put_item(Item=record)
+    if not record:
+      # cached misses may be stale, the record is only written if it still does not exist
+      item = {"ID": key, field: value}
+      if should_set_init_field(field, item):
+        item[init_field] = value
+      if self.put_new(key, item):
+        if self.cache.enabled():
+          self.cache.update(key, item)
+        return
+      record = self.get(key) or {"ID": key}
+
+    update_expression = f"SET {field} = :value"
+    if should_set_init_field(field, record):
+      update_expression = update_expression + f", {init_field} = :value"
+      record[init_field] = value
+    self.table.update_item(
+      Key={"ID": key},
+      ExpressionAttributeValues={":value": value},
+      UpdateExpression=update_expression,
+    )
+    record[field] = value
+    if self.cache.enabled():
+      self.cache.update(key, record)
+
+  def set_timestamps(
+    self,
+    updates: Dict[str, Dict[str, Optional[int]]],
+    records: Dict[str, Dict[str, Any]] = None,
+  ):
+    """
+    Coalesced `set_timestamp` for many keys. `updates` maps keys to the timestamp fields to set,
+    in the order they would have been set individually. Existing records are updated with a
+    single `update_item` call each and new records are written with a conditional `put_item`,
+    records created since they were read are updated instead. `records` may contain records
+    that were already fetched for the keys. Timestamp fields without a value are set to the
+    current time. The registration fingerprints field maps ARNs to their
+    new fingerprint, or to `None` to remove it, and only updates the entries of those ARNs.
+    """
+    if ServerState().options.get("dry_run") or len(updates) == 0:
+      return
+
+    if records is None:
+      records = self.batch_get(list(updates.keys()))
+
+    for key, fields in updates.items():
+      if len(fields) == 0:
+        continue
+
+      record = records.get(key)
+      item, values, has_fingerprints = self.timestamp_item(key, record, fields)
+      if not record:
+        if self.put_new(key, item):
+          records[key] = item
+          if self.cache.enabled():
+            self.cache.update(key, item)
+          continue
+        # the record was created since it was read, the update is applied to the current record
+        record = self.get(key) or {"ID": key}
+        item, values, has_fingerprints = self.timestamp_item(key, record, fields)
+
+      fingerprints = fields.get(REGISTRATION_FINGERPRINTS_FIELD) or {}
+      self.update_fields(key, values, fingerprints, has_fingerprints)
+      # keep fetched records current for callers that reuse them
+      records[key] = item
+      if self.cache.enabled():
+        self.cache.update(key, item)
+
+  def timestamp_item(
+    self, key: str, record: Optional[Dict[str, Any]], fields: Dict[str, Optional[int]]
+  ) -> Tuple[Dict[str, Any], Dict[str, int], bool]:
+    """
+    Apply the timestamp `fields` of a `set_timestamps` update to `record`. Return the updated
+    record, the timestamp values to set and whether `record` has a fingerprints map.
+    """
+    item = dict(record) if record else {"ID": key}
+    values = {}
+    for field, value in fields.items():
+      if field == REGISTRATION_FINGERPRINTS_FIELD:
+        continue
+      if value is None:
+        value = int(time())
+      values[field] = value
+      if should_set_init_field(field, item):
+        values[INIT_TS_FIELD_PFX + field] = value
+      item.update(values)
+
+    has_fingerprints = isinstance(item.get(REGISTRATION_FINGERPRINTS_FIELD), dict)
+    fingerprints = fields.get(REGISTRATION_FINGERPRINTS_FIELD) or {}
+    if fingerprints:
+      merged = merge_fingerprints(item.get(REGISTRATION_FINGERPRINTS_FIELD), fingerprints)
+      if merged:
+        item[REGISTRATION_FINGERPRINTS_FIELD] = merged
+      else:
+        item.pop(REGISTRATION_FINGERPRINTS_FIELD, None)
+    return item, values, has_fingerprints
+
+  def put_new(self, key: str, item: Dict[str, Any]) -> bool:
+    """
+    Write `item` unless a record exists for `key`, return whether it was written. Records read as
+    missing may have been created by another process since, they are never overwritten.
+    """
+    try:
+      self.table.put_item(Item=item, ConditionExpression="attribute_not_exists(ID)")
+      return True
+    except ClientError as ex:
+      if ex.response["Error"]["Code"] != "ConditionalCheckFailedException":
+        raise ex
+      self.cache.invalidate(key)
+      return False
+
+  def update_fields(
+    self,
+    key: str,
+    values: Dict[str, Any],
+    fingerprints: Dict[str, Optional[str]],
+    has_fingerprints: bool,
+  ):
+    """
+    Set `values` on the existing record `key` and update its fingerprint entries. Entries are
+    updated in place when the record has a fingerprints map so concurrent updates of other ARNs
+    are kept, records without a map are only given one if no other update created it first.
+    """
+    expressions = [f"{f} = :v{i}" for i, f in enumerate(values.keys())]
+    removals = []
+    kwargs = {"ExpressionAttributeValues": {f":v{i}": v for i, v in enumerate(values.values())}}
+    if fingerprints:
+      kwargs["ExpressionAttributeNames"] = {"#fps": REGISTRATION_FINGERPRINTS_FIELD}
+      if has_fingerprints:
+        for i, (arn, fingerprint) in enumerate(sorted(fingerprints.items())):
+          kwargs["ExpressionAttributeNames"][f"#a{i}"] = arn
+          if fingerprint is None:
+            removals.append(f"#fps.#a{i}")
+          else:
+            expressions.append(f"#fps.#a{i} = :f{i}")
+            kwargs["ExpressionAttributeValues"][f":f{i}"] = fingerprint
+      else:
+        kwargs["ConditionExpression"] = "attribute_not_exists(#fps) OR NOT attribute_type(#fps, :m)"
+        kwargs["ExpressionAttributeValues"][":m"] = "M"
+        merged = merge_fingerprints(None, fingerprints)
+        if merged:
+          expressions.append("#fps = :fps")
+          kwargs["ExpressionAttributeValues"][":fps"] = merged
+        else:
+          removals.append("#fps")
+
+    update = []
+    if expressions:
+      update.append("SET " + ", ".join(expressions))
+    if removals:
+      update.append("REMOVE " + ", ".join(removals))
+    if not update:
+      return
+    if not kwargs["ExpressionAttributeValues"]:
+      del kwargs["ExpressionAttributeValues"]
+
+    try:
+      self.table.update_item(Key={"ID": key}, UpdateExpression=" ".join(update), **kwargs)
+    except ClientError as ex:
+      if not fingerprints or has_fingerprints:
+        raise ex
+      if ex.response["Error"]["Code"] != "ConditionalCheckFailedException":
+        raise ex
+      # another update created the fingerprints map after the record was read
+      self.update_fields(key, values, fingerprints, True)
 
   def set_created_at(self, key: str, ts: int):
     self.set_timestamp(key, "created_at", ts)
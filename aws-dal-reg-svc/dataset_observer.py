@@ -1,5 +1,6 @@
+import concurrent.futures
 from random import shuffle
-from threading import Event
+from threading import Event, local, Lock
 from time import time
 from typing import Any, Dict, Type
 
@@ -8,7 +9,7 @@ from twitter.common.metrics import AtomicGauge, Observable, RootMetrics
 from twitter.common.metrics.metrics import Metrics
 from util import account_stage_key, envoy_proxy_connection_check, terminate_envoy_sidecar
 
-from aws_arn import Arn
+from aws_arn import sqs_queue_arn
 from aws_cloud_watch import (
   account_metric,
   CloudWatchReporter,
@@ -17,6 +18,7 @@ from aws_cloud_watch import (
 )
 from aws_iam import AwsAuthenticator, get_authenticator
 from aws_organizations import get_accounts
+from aws_s3 import S3ApiLatency, S3EnrichmentEngine
 from botocore.exceptions import ClientError
 from dataset_metastore import Metastore
 from dataset_stagestore import Stagestore
@@ -25,7 +27,10 @@ from server_config import (
   AWS_EXCLUDED_REGIONS,
   AWS_ORGANIZATION_ACCOUNT_ID,
   DYNAMO_STAGES_TABLE_ACCOUNT_ID,
+  FUTURE_TIMEOUTS,
   RESOURCE_SCANNER_REQUIRED_ATTRS,
+  SCANNER_ENRICHMENT_CONCURRENCY,
+  SCANNER_REGION_CONCURRENCY,
 )
 from server_state import ServerState
 
@@ -103,8 +108,9 @@ class DatasetObserver(Observable):
     self.account_id = auth.account_id
     self.authenticator = auth
     self.counter = 0
-    self.metastore = Metastore(auth)
+    self.lock = Lock()
     self.scan_incomplete = Event()
+    self._stores = local()
     self._list_resources_errors = self.metrics.register(AtomicGauge("list_resources_errors"))
     self._metastore_set_observed_errors = self.metrics.register(
       AtomicGauge("metastore_set_observed_errors")
@@ -112,6 +118,20 @@ class DatasetObserver(Observable):
     self._regions_scanned = self.metrics.register(AtomicGauge("regions_scanned"))
     self._scan_duration = self.metrics.register(AtomicGauge("scan_duration"))
 
+  @property
+  def metastore(self) -> Metastore:
+    # boto3 resources are not thread safe, every scan thread uses its own metastore.
+    if not hasattr(self._stores, "metastore"):
+      self._stores.metastore = Metastore(self.authenticator)
+    return self._stores.metastore
+
+  def concurrency(self, limits: Dict[str, int]) -> int:
+    return limits.get(self.service, limits["default"])
+
+  def increment_counter(self):
+    with self.lock:
+      self.counter += 1
+
   def log_sfx(self, region: str = None) -> str:
     sfx = f"acct: {self.account_id}"
     if region:
@@ -127,7 +147,7 @@ class DatasetObserver(Observable):
       )
       if ServerState().options.get("log_resource_observations"):
         log.info(f"Observed {self.service} resource: {name} in {self.log_sfx(region)}.")
-      self.counter += 1
+      self.increment_counter()
 
       try:
         self.set_observed(name, region)
@@ -142,9 +162,17 @@ class DatasetObserver(Observable):
     self.validate()
     session = self.authenticator.new_session()
     start_ts = int(time())
-    for region in session.get_available_regions(self.service):
-      self.scan_region(region)
-      self._regions_scanned.increment()
+    with concurrent.futures.ThreadPoolExecutor(
+      max_workers=self.concurrency(SCANNER_REGION_CONCURRENCY),
+      thread_name_prefix=f"{self.service}-observe",
+    ) as executor:
+      futures = [
+        executor.submit(self.scan_region, region)
+        for region in session.get_available_regions(self.service)
+      ]
+      for future in concurrent.futures.as_completed(futures, timeout=FUTURE_TIMEOUTS["scanner"]):
+        _ = future.result()
+        self._regions_scanned.increment()
     self._scan_duration.add(int(time()) - start_ts)
     log.info(
       "{} scan complete ({} resources). {}".format(
@@ -234,50 +262,47 @@ class S3Observer(DatasetObserver):
     self.entities_key = "Buckets"
     self.service = "s3"
     super().__init__(auth)
+    self.engine = S3EnrichmentEngine(
+      auth, self._SCAN_REGION, self.concurrency(SCANNER_ENRICHMENT_CONCURRENCY)
+    )
+    self.metrics.register_observable("enrichment", self.engine)
+
+  def observe_bucket(self, entity: Dict[str, Any]):
+    self.increment_counter()
 
-  def bucket_region(self, client, name: str) -> str:
-    region = client.get_bucket_location(Bucket=name, ExpectedBucketOwner=self.account_id)[
-      "LocationConstraint"
-    ]
-    if region is None:
-      region = "us-east-1"
-    elif region == "EU":
-      region = "eu-west-1"
-    return region
+    # the S3 ListBuckets response data-structure differs
+    # from the expected behaivor within the parent class.
+    name = entity["Name"]
+    if ServerState().options.get("log_resource_observations"):
+      log.info(f"Observed {self.service} resource: {name} in {self.log_sfx()}.")
+
+    try:
+      region, _ = self.engine.region(name)
+      self.set_observed(name, region)
+    except Exception as meta_ex:
+      log.error(
+        f"Unable to set_observed in metastore for {self.service} resource {name} in {self.log_sfx()}. err={meta_ex}"
+      )
+      self._metastore_set_observed_errors.increment()
+      self.scan_incomplete.set()
 
   def scan(self):
     # The S3 API doesn't support regional resource listing or pagination
-    # requiring the parent class `scan` method to be overridden.
+    # requiring the parent class `scan` method to be overridden. Bucket
+    # region lookups are made concurrently by the enrichment engine instead.
     self.validate()
-    client = self.authenticator.new_client(self.service, self._SCAN_REGION)
     start_ts = int(time())
-    resp = client.list_buckets()
-    if self.entities_key in resp.keys():
-      for entity in resp[self.entities_key]:
-        self.counter += 1
-
-        # the S3 ListBuckets response data-structure differs
-        # from the expected behaivor within the parent class.
-        name = entity["Name"]
-        if ServerState().options.get("log_resource_observations"):
-          log.info(f"Observed {self.service} resource: {name} in {self.log_sfx()}.")
-
-        try:
-          self.set_observed(name, self.bucket_region(client, name))
-        except Exception as meta_ex:
-          log.error(
-            f"Unable to set_observed in metastore for {self.service} resource {name} in {self.log_sfx()}. err={meta_ex}"
-          )
-          self._metastore_set_observed_errors.increment()
-          self.scan_incomplete.set()
-
-      self._regions_scanned.increment()
-      self._scan_duration.add(int(time()) - start_ts)
-      log.info(
-        "{} scan complete ({} resources). {}".format(
-          self.__class__.__name__, self.counter, self.log_sfx()
-        )
+    buckets = self.engine.list_buckets()
+    for _, future in self.engine.enrich(buckets, self.observe_bucket):
+      _ = future.result()
+
+    self._regions_scanned.increment()
+    self._scan_duration.add(int(time()) - start_ts)
+    log.info(
+      "{} scan complete ({} resources). {}".format(
+        self.__class__.__name__, self.counter, self.log_sfx()
       )
+    )
 
 
 class SqsObserver(DatasetObserver):
@@ -288,17 +313,14 @@ class SqsObserver(DatasetObserver):
     super().__init__(auth)
 
   def process_response(self, region: str, resp: Dict[str, Any]):
-    client = self.authenticator.new_client(self.service, region)
+    # queue names are derived from their URL without calling `GetQueueAttributes`
     for queue_url in resp[self.entities_key]:
       if ServerState().options.get("log_resource_observations"):
         log.info(f"Observed {self.service} resource: {queue_url} in {self.log_sfx(region)}.")
-      self.counter += 1
+      self.increment_counter()
 
       try:
-        # grab the arn
-        q_attr_resp = client.get_queue_attributes(QueueUrl=queue_url, AttributeNames=["QueueArn"])
-        q_arn = Arn(q_attr_resp["Attributes"]["QueueArn"])  # will throw key error if not exist
-        self.set_observed(q_arn.resource, region)
+        self.set_observed(sqs_queue_arn(queue_url).resource, region)
       except Exception as meta_ex:
         log.error(
           f"Unable to set_observed in metastore for {self.service} resource {queue_url} in {self.log_sfx()}. err={meta_ex}"
@@ -325,6 +347,7 @@ def main(args, options):
   if options.envoy_proxy_url:
     envoy_proxy_connection_check(options.envoy_proxy_url)
 
+  S3ApiLatency().register_metrics(RootMetrics().scope("global"))
   cw_reporter = get_cloud_watch_reporter(options.cloud_watch_namespace)
   scan_intvl = int(options.scan_exclusion_interval)
   stage_store = Stagestore(get_authenticator(DYNAMO_STAGES_TABLE_ACCOUNT_ID))
@@ -1,18 +1,74 @@
 from time import time
-from typing import Dict, Optional, Union
+from typing import Dict, Optional, Set, Union
+
+from util import account_stage_key
 
 from aws_iam import AwsAuthenticator
+from botocore.exceptions import ClientError
 from datastore import Datastore
-from server_config import DYNAMO_STAGES_TABLE_NAME, DYNAMO_STAGES_TABLE_TTL
+from server_config import DYNAMO_STAGES_TABLE_NAME, DYNAMO_STAGES_TABLE_TTL, STAGE_CHECKPOINT_TTL
+from server_state import ServerState
+
+
+# stage of the records listing the scan units completed by an interrupted run
+CHECKPOINT_STAGE = "checkpoint"
 
 
 class Stagestore(Datastore):
   def __init__(self, auth: AwsAuthenticator):
     super().__init__(auth, DYNAMO_STAGES_TABLE_NAME)
 
+  @staticmethod
+  def checkpoints_enabled() -> bool:
+    # only enabled by binaries that define the `--disable-stage-checkpoints` option, dry runs
+    # never register datasets so they must not mark units as completed.
+    options = ServerState().options
+    return bool(
+      options.get("stage_checkpoints", False)
+      and not options.get("dry_run")
+      and ServerState().stage_store
+    )
+
+  def add_checkpoint(self, account_id: str, unit: str):
+    """
+    Add `unit` to the checkpoint of `account_id`. The checkpoint timestamp is the time its first
+    unit was added, the units of a checkpoint older than `STAGE_CHECKPOINT_TTL` are replaced.
+    """
+    key = account_stage_key(account_id, CHECKPOINT_STAGE)
+    record = self.record(key)
+    try:
+      self.table.update_item(
+        Key=self.key(key),
+        UpdateExpression="ADD #units :units SET #ts = if_not_exists(#ts, :ts), #expire = :expire",
+        ConditionExpression="attribute_not_exists(#ts) OR #ts > :stale",
+        ExpressionAttributeNames={"#expire": "expire", "#ts": "ts", "#units": "units"},
+        ExpressionAttributeValues={
+          ":expire": record["expire"],
+          ":stale": record["ts"] - STAGE_CHECKPOINT_TTL,
+          ":ts": record["ts"],
+          ":units": {unit},
+        },
+      )
+    except ClientError as ex:
+      if ex.response["Error"]["Code"] != "ConditionalCheckFailedException":
+        raise ex
+      self.table.put_item(Item={**record, "units": {unit}})
+
+  def checkpoint(self, account_id: str) -> Set[str]:
+    """
+    Return the scan units completed by the last interrupted run of `account_id`.
+    """
+    record = self.get(account_stage_key(account_id, CHECKPOINT_STAGE))
+    if not record or time() - int(record["ts"]) > STAGE_CHECKPOINT_TTL:
+      return set()
+    return set(record.get("units", set()))
+
   def delete(self, key: str):
     raise NotImplementedError
 
+  def delete_checkpoint(self, account_id: str):
+    self.table.delete_item(Key=self.key(account_stage_key(account_id, CHECKPOINT_STAGE)))
+
   def exists(self, key: str):
     raise NotImplementedError
 
@@ -1,7 +1,15 @@
-from typing import Any, Dict, Optional
+from time import sleep
+from typing import Any, Dict, List, Optional
 
 from boto3 import dynamodb
-from server_config import DYNAMO_STAGES_TABLE_NAME, DYNAMO_SVC_TABLE_REGION
+from errors import DatastoreUnprocessedKeys
+from server_config import (
+  DYNAMO_BATCH_GET_MAX_KEYS,
+  DYNAMO_BATCH_RETRIES,
+  DYNAMO_BATCH_RETRY_DELAY,
+  DYNAMO_STAGES_TABLE_NAME,
+  DYNAMO_SVC_TABLE_REGION,
+)
 from server_state import ServerState
 
 
@@ -61,8 +69,43 @@ class Datastore:
       and table_name not in [t.table_name for t in rsrc.tables.all()]
     ):
       create_table(table_name, rsrc)
+    self.resource = rsrc
     self.table = rsrc.Table(table_name)
 
+  def batch_get(self, keys: List[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    Fetch the records for `keys` using `BatchGetItem`. Keys without a record are omitted from the
+    returned map.
+    """
+    records = {}
+    keys = list(dict.fromkeys(keys))
+    for i in range(0, len(keys), DYNAMO_BATCH_GET_MAX_KEYS):
+      batch_keys = keys[i : i + DYNAMO_BATCH_GET_MAX_KEYS]
+      request = {self.table.name: {"Keys": [{"ID": k} for k in batch_keys]}}
+      attempts = 0
+      while request:
+        resp = self.resource.batch_get_item(RequestItems=request)
+        for item in resp.get("Responses", {}).get(self.table.name, []):
+          records[item["ID"]] = item
+
+        # keys are left unprocessed when the request exceeds the response size
+        # limit or the table's provisioned throughput.
+        request = resp.get("UnprocessedKeys")
+        if request:
+          attempts += 1
+          if attempts > DYNAMO_BATCH_RETRIES:
+            raise DatastoreUnprocessedKeys(request[self.table.name]["Keys"])
+          sleep(DYNAMO_BATCH_RETRY_DELAY * 2 ** (attempts - 1))
+
+    return records
+
+  def batch_put(self, items: List[Dict[str, Any]]):
+    # the batch writer buffers `BatchWriteItem` requests of up to 25 items
+    # and resubmits unprocessed items.
+    with self.table.batch_writer(overwrite_by_pkeys=["ID"]) as writer:
+      for item in items:
+        writer.put_item(Item=item)
+
   def delete(self, key: str) -> Dict[str, Any]:
     return self.table.delete_item(Key={"ID": key})
 
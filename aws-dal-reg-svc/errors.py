@@ -19,6 +19,10 @@ class AwsRegionRequired(ExceptionWithValue):
   pass
 
 
+class DatastoreUnprocessedKeys(ExceptionWithValue):
+  pass
+
+
 class MisconfiguredResourceScanner(Exception):
   def __init__(self, attribute: str, class_name: str):
     self.attribute = attribute
@@ -0,0 +1,166 @@
+from threading import Lock
+from time import monotonic, sleep
+from typing import Any, Dict, List, Optional
+
+from twitter.common import log
+from twitter.common.metrics import AtomicGauge, LambdaGauge, Observable, RootMetrics
+
+from botocore.exceptions import ClientError
+from server_config import (
+  RATE_LIMIT_DECREASE,
+  RATE_LIMIT_INCREASE,
+  RATE_LIMIT_MAX_MULTIPLIER,
+  RATE_LIMIT_MIN_MULTIPLIER,
+  RATE_LIMITS,
+)
+
+
+GLOBAL_SCOPE = "global"
+THROTTLING_ERROR_CODES = (
+  "RequestLimitExceeded",
+  "Throttling",
+  "ThrottlingException",
+  "TooManyRequestsException",
+)
+
+
+def is_throttling_error(ex: Exception) -> bool:
+  return isinstance(ex, ClientError) and ex.response["Error"]["Code"] in THROTTLING_ERROR_CODES
+
+
+class TokenBucket(Observable):
+  """
+  Thread-safe token bucket. Callers reserve a token and wait for it to become available, which
+  spaces out concurrent callers at the current rate rather than having them race for refills.
+  """
+
+  def __init__(self, rate: float, min_rate: float = None, max_rate: float = None):
+    self.base_rate = rate
+    self.rate = rate
+    self.min_rate = min_rate or rate
+    self.max_rate = max_rate or rate
+    self.tokens = self.capacity()
+    self.updated = monotonic()
+    self.lock = Lock()
+    self.metrics.register(LambdaGauge("rate", lambda: self.rate))
+    self.metrics.register(LambdaGauge("tokens", lambda: self.tokens))
+    self._requests = self.metrics.register(AtomicGauge("requests"))
+    self._throttles = self.metrics.register(AtomicGauge("throttles"))
+    self._waits = self.metrics.register(AtomicGauge("waits"))
+    self._wait_ms = self.metrics.register(AtomicGauge("wait_ms"))
+
+  def capacity(self) -> float:
+    return max(1.0, self.rate)
+
+  def _refill(self):
+    now = monotonic()
+    self.tokens = min(self.capacity(), self.tokens + (now - self.updated) * self.rate)
+    self.updated = now
+
+  def reserve(self) -> float:
+    """
+    Take a token and return the number of seconds the caller must wait before using it.
+    """
+    with self.lock:
+      self._refill()
+      self.tokens -= 1
+      self._requests.increment()
+      if self.tokens >= 0:
+        return 0.0
+
+      wait = -self.tokens / self.rate
+      self._waits.increment()
+      self._wait_ms.add(int(wait * 1000))
+      return wait
+
+  def decrease(self):
+    with self.lock:
+      self._refill()
+      self.rate = max(self.min_rate, self.rate * RATE_LIMIT_DECREASE)
+      # drop any accumulated burst so callers back off immediately
+      self.tokens = min(self.tokens, 0.0)
+      self._throttles.increment()
+
+  def increase(self):
+    with self.lock:
+      self._refill()
+      self.rate = min(self.max_rate, self.rate + self.base_rate * RATE_LIMIT_INCREASE)
+
+
+class RateLimiter:
+  """
+  Process-wide registry of token buckets keyed by API and scope. Every API can define a global
+  bucket and per-account buckets in `RATE_LIMITS`; callers must acquire a token from each bucket
+  that applies before making a request.
+  """
+
+  _INSTANCE = None
+
+  def __new__(cls, limits: Dict[str, Dict[str, Any]] = None):
+    if not cls._INSTANCE:
+      cls._INSTANCE = object.__new__(cls)
+      cls._INSTANCE.buckets = {}
+      cls._INSTANCE.limits = dict(RATE_LIMITS)
+      cls._INSTANCE.lock = Lock()
+    if limits:
+      cls._INSTANCE.limits = {
+        **cls._INSTANCE.limits,
+        **limits,
+      }
+    return cls._INSTANCE
+
+  def bucket(self, api: str, scope: str) -> Optional[TokenBucket]:
+    key = (api, scope)
+    if key not in self.buckets:
+      limits = self.limits.get(api, {})
+      rate = limits.get(GLOBAL_SCOPE if scope == GLOBAL_SCOPE else "account")
+      if not rate:
+        return None
+
+      with self.lock:
+        if key not in self.buckets:
+          if limits.get("adaptive"):
+            bucket = TokenBucket(
+              rate, rate * RATE_LIMIT_MIN_MULTIPLIER, rate * RATE_LIMIT_MAX_MULTIPLIER
+            )
+          else:
+            bucket = TokenBucket(rate)
+          RootMetrics().scope(scope).register_observable(f"{api}_rate_limiter", bucket)
+          self.buckets[key] = bucket
+
+    return self.buckets[key]
+
+  def scoped_buckets(self, api: str, account_id: str = None) -> List[TokenBucket]:
+    """
+    Buckets that apply to a request, ordered from the most to the least specific scope.
+    """
+    scopes = [GLOBAL_SCOPE]
+    if account_id:
+      scopes.insert(0, account_id)
+
+    buckets = []
+    for scope in scopes:
+      bucket = self.bucket(api, scope)
+      if bucket:
+        buckets.append(bucket)
+    return buckets
+
+  def acquire(self, api: str, account_id: str = None):
+    wait = 0.0
+    for bucket in self.scoped_buckets(api, account_id):
+      wait = max(wait, bucket.reserve())
+
+    if wait > 0:
+      sleep(wait)
+
+  def throttled(self, api: str, account_id: str = None):
+    # only the most specific bucket is slowed down, per-account quotas
+    # should not reduce the rate available to other accounts.
+    buckets = self.scoped_buckets(api, account_id)
+    if buckets:
+      buckets[0].decrease()
+      log.warn(f"{api} request throttled, rate limit decreased to {buckets[0].rate:.3f}/s")
+
+  def succeeded(self, api: str, account_id: str = None):
+    for bucket in self.scoped_buckets(api, account_id):
+      bucket.increase()
@@ -1,13 +1,24 @@
+import concurrent.futures
+from contextlib import contextmanager
 from datetime import datetime
+import queue
+from threading import BoundedSemaphore, local, Lock
 from time import time
-from typing import Dict, List, Optional
+from typing import Any, Dict, Iterator, List, Optional, Union
 
 from com.twitter.dal import DAL
 from twitter.common import log
-from twitter.common.metrics import AtomicGauge, Observable
+from twitter.common.metrics import AtomicGauge, LambdaGauge, Observable
+from twitter.common.metrics.metrics import Metrics
 from twitter.ml.common.thrift_client_connector import ThriftClientConnector
 from twitter.s2s.core import ServiceIdentifier
-from util import current_ms_time, get_krb_principal, jitter_ttl, rate_limit
+from util import (
+  account_stage_key,
+  current_ms_time,
+  get_krb_principal,
+  jitter_ttl,
+  ScanCheckpoint,
+)
 
 from com.twitter.dal.has_personal_data.ttypes import HasPersonalData
 from com.twitter.dal.model.ttypes import (
@@ -30,22 +41,29 @@ from com.twitter.dal.ttypes import RegisterDatasetResponse
 from com.twitter.statebird.v2.thriftpython.ttypes import BatchApp, Environment
 
 from aws_arn import Arn
-from aws_iam import IamObservedAccess
+from aws_iam import AwsAuthenticator, IamObservedAccess
 from aws_resource import Resource
 from dataset import Dataset
 from dataset_metastore import Metastore
+from dataset_stagestore import Stagestore
 from errors import RegistrationError
+from rate_limiter import RateLimiter
 from registration_base_modules.kite_client import KiteClient
 from server_config import (
   DAL_CLIENT_NAME,
-  DAL_RATE_LIMIT,
+  DAL_CLIENT_POOL_SIZE,
+  DAL_REGISTRATION_CONCURRENCY,
   DAL_SERVICE_NAME,
+  FUTURE_TIMEOUTS,
   REGISTRATION_EXCLUSION_MAX_INTERVAL,
   REGISTRATION_EXCLUSION_MIN_INTERVAL,
+  REGISTRATION_FINGERPRINTS_FIELD,
+  REGISTRATION_POST_CONCURRENCY,
   SVC_DOMAIN,
   SVC_NAME,
   SVC_ROLE,
 )
+from server_progress import ProgressTracker
 from server_state import ServerState
 
 
@@ -183,19 +201,19 @@ def location() -> PhysicalLocation:
   return PhysicalLocation(name="global", locationType=PhysicalLocationType(name="global"))
 
 
-def register_dataset(dataset: Dataset) -> RegisterDatasetResponse:
+def register_dataset(dataset: Dataset, dal_client: DAL = None) -> RegisterDatasetResponse:
   """
   If Kite project info is not available, register with the legacy API when using owner team.
   """
   if dataset.project():
-    return register_dataset_v2(dataset)
+    return register_dataset_v2(dataset, dal_client)
   else:
-    return register_dataset_v1(dataset)
+    return register_dataset_v1(dataset, dal_client)
 
 
-def register_dataset_v1(dataset: Dataset) -> RegisterDatasetResponse:
+def register_dataset_v1(dataset: Dataset, dal_client: DAL = None) -> RegisterDatasetResponse:
   owner, owner_type = dataset.owner()
-  return client().registerOrUpdateDataset(
+  return (dal_client or client()).registerOrUpdateDataset(
     clusterName=cluster_name(dataset.resource.arn),
     context=app_context(location()),
     datasetName=dataset.name(),
@@ -212,7 +230,7 @@ def register_dataset_v1(dataset: Dataset) -> RegisterDatasetResponse:
   )
 
 
-def register_dataset_v2(dataset: Dataset) -> RegisterDatasetResponse:
+def register_dataset_v2(dataset: Dataset, dal_client: DAL = None) -> RegisterDatasetResponse:
   """
   Register dataset with V2 registration API using accountable Kite role.
   https://docbird.twitter.biz/dal/dal_dataset_registration_for_storage_owners.html
@@ -242,7 +260,7 @@ def register_dataset_v2(dataset: Dataset) -> RegisterDatasetResponse:
   ) or schema.genericSchema:
     pii_status = None
 
-  response_v2 = client().registerDatasetV2(
+  response_v2 = (dal_client or client()).registerDatasetV2(
     accountableEntity=accountableEntity,
     context=app_context(location()),
     datasetName=dataset.name(),
@@ -264,7 +282,7 @@ def register_dataset_v2(dataset: Dataset) -> RegisterDatasetResponse:
   )
 
 
-def register_dataset_access(dataset: Dataset, dataset_id: int):
+def register_dataset_access(dataset: Dataset, dataset_id: int, dal_client: DAL = None):
   if ServerState().options.get("disable_access_simulation"):
     return
 
@@ -282,21 +300,148 @@ def register_dataset_access(dataset: Dataset, dataset_id: int):
       )
     )
 
-  client().setPhysicalDatasetAccessGroups(
+  (dal_client or client()).setPhysicalDatasetAccessGroups(
     context=app_context(location()), physicalDatasetId=dataset_id, permissions=permissions
   )
 
 
+class DalClientPool:
+  """
+  Bounded pool of connected DAL Thrift clients shared by every account. Thrift clients are not
+  thread-safe, callers check a client out for the duration of their calls and block while `size`
+  clients are checked out. Clients are only connected when no idle client is available, and are
+  dropped after a failed call.
+  """
+
+  def __init__(self, size: int):
+    self.clients = queue.LifoQueue()
+    self.connected = 0
+    self.lock = Lock()
+    # one slot per checked out client, slots are released when a client is returned or dropped
+    self.slots = BoundedSemaphore(size)
+
+  @contextmanager
+  def client(self) -> Iterator[DAL]:
+    with self.slots:
+      try:
+        dal_client = self.clients.get_nowait()
+      except queue.Empty:
+        dal_client = client()
+        with self.lock:
+          self.connected += 1
+
+      try:
+        yield dal_client
+      except Exception as ex:
+        # the connection may be broken, a new client is connected by the next caller
+        with self.lock:
+          self.connected -= 1
+        raise ex
+      self.clients.put(dal_client)
+
+
+class RegistrationEngine:
+  """
+  Process-wide DAL registration executor shared by every account's `Registrar`. DAL calls run on
+  a bounded pool of threads and clients under the global `dal` rate limit. Metastore timestamp
+  updates and Kite role writes run on a separate post-processing pool after the DAL calls of a
+  batch complete.
+  """
+
+  _INSTANCE = None
+
+  def __new__(cls):
+    if not cls._INSTANCE:
+      cls._INSTANCE = object.__new__(cls)
+      cls._INSTANCE.clients = DalClientPool(DAL_CLIENT_POOL_SIZE)
+      cls._INSTANCE.executor = concurrent.futures.ThreadPoolExecutor(
+        max_workers=DAL_REGISTRATION_CONCURRENCY, thread_name_prefix="dal-registration"
+      )
+      cls._INSTANCE.post_executor = concurrent.futures.ThreadPoolExecutor(
+        max_workers=REGISTRATION_POST_CONCURRENCY, thread_name_prefix="registration-post"
+      )
+      cls._INSTANCE.dal_clients = LambdaGauge(
+        "dal_clients_connected", lambda: cls._INSTANCE.clients.connected
+      )
+
+    return cls._INSTANCE
+
+  def register_metrics(cls, metrics: Metrics):
+    metrics.register(cls._INSTANCE.dal_clients)
+
+
 class Registrar(Observable):
-  def __init__(self, metastore: Metastore):
+  def __init__(self, auth: AwsAuthenticator):
     self._dal_errors = self.metrics.register(AtomicGauge("dal_errors"))
     self._datasets_registered = self.metrics.register(AtomicGauge("datasets_registered"))
     self._datasets_registered_late = self.metrics.register(AtomicGauge("datasets_registered_late"))
+    self._datasets_registration_skipped = self.metrics.register(
+      AtomicGauge("datasets_registration_skipped")
+    )
     self._datasets_registered_kite = self.metrics.register(AtomicGauge("datasets_registered_kite"))
     self._dataset_access_registered = self.metrics.register(
       AtomicGauge("datasets_access_registered")
     )
-    self.metastore = metastore
+    self._post_errors = self.metrics.register(AtomicGauge("post_processing_errors"))
+    self._scan_checkpoints = self.metrics.register(AtomicGauge("scan_checkpoints"))
+    self._scan_checkpoint_errors = self.metrics.register(AtomicGauge("scan_checkpoint_errors"))
+    self._scan_checkpoints_dropped = self.metrics.register(
+      AtomicGauge("scan_checkpoints_dropped")
+    )
+    self.auth = auth
+    self.engine = RegistrationEngine()
+    # set once a dataset failed to register, see `checkpoint`
+    self.failed = False
+    self.lock = Lock()
+    self.metastore = Metastore(auth)
+    self.pending = []
+    self._stores = local()
+
+  @property
+  def post_metastore(self) -> Metastore:
+    # boto3 resources are not thread-safe, post-processing threads use their own metastore
+    if not hasattr(self._stores, "metastore"):
+      self._stores.metastore = Metastore(self.auth)
+    return self._stores.metastore
+
+  def checkpoint(self, marker: ScanCheckpoint):
+    """
+    Persist the scan unit of `marker` once the datasets emitted before it are registered, the
+    account checkpoint is deleted by the marker emitted once the account scan completes. Markers
+    received after a dataset failed to register are dropped, the units of failed datasets are
+    not known so the rest of the account is scanned again by the next run.
+    """
+    self.flush()
+    if not Stagestore.checkpoints_enabled():
+      return
+    if self.failed:
+      log.info(f"dropping scan checkpoint after registration failures: {marker}")
+      self._scan_checkpoints_dropped.increment()
+      return
+
+    try:
+      if marker.unit:
+        ServerState().stage_store.add_checkpoint(marker.account_id, marker.unit)
+        self._scan_checkpoints.increment()
+      else:
+        ServerState().stage_store.delete_checkpoint(marker.account_id)
+    except Exception as ex:
+      log.error(f"unable to persist scan checkpoint: {marker}. ex={ex}")
+      self._scan_checkpoint_errors.increment()
+
+  def flush(self):
+    """
+    Wait for the post-processing of every registered batch to complete.
+    """
+    with self.lock:
+      pending, self.pending = self.pending, []
+    for future in concurrent.futures.as_completed(pending, timeout=FUTURE_TIMEOUTS["processor"]):
+      try:
+        future.result()
+      except Exception as ex:
+        log.exception(f"registration post-processing failed. ex={ex}")
+        self._post_errors.increment()
+        self.failed = True
 
   def register_access(self, dataset: Dataset, dataset_id: int):
     if len(dataset.accesses) == 0:
@@ -304,24 +449,29 @@ class Registrar(Observable):
 
     log.info(f"registering dataset access: {dataset.resource.arn} - {dataset.accesses}")
     if not ServerState().options.get("dry_run"):
-      start_time = time()
+      RateLimiter().acquire("dal", dataset.resource.arn.account_id)
       try:
-        register_dataset_access(dataset, dataset_id)
+        with self.engine.clients.client() as dal_client:
+          register_dataset_access(dataset, dataset_id, dal_client)
       except Exception as dal_ex:
         log.exception(f"DAL dataset access registration error: {dal_ex}")
         self._dal_errors.increment()
         raise RegistrationError(dal_ex)
 
       self._dataset_access_registered.increment()
-      rate_limit(DAL_RATE_LIMIT, start_time)
 
-  def register_dataset(self, dataset: Dataset) -> RegisterDatasetResponse:
-    dataset.set_meta(self.metastore.get_regional_or_global(dataset.resource.arn))
-    metastore_key = self.metastore.key(dataset.resource.arn)
+  def register_dataset(
+    self,
+    dataset: Dataset,
+    record: Optional[Dict[str, Any]],
+    timestamps: Dict[str, Optional[int]],
+  ) -> RegisterDatasetResponse:
+    """
+    Register `dataset` with DAL. `record` is the dataset's metastore record, the metastore
+    timestamps to set for the dataset are added to `timestamps`.
+    """
     if dataset.resource.creation_date != datetime.min:
-      self.metastore.set_created_at(metastore_key, int(dataset.resource.creation_date.timestamp()))
-    # Getting the Register record from DynamoDB
-    record = self.metastore.get(metastore_key)
+      timestamps["created_at"] = int(dataset.resource.creation_date.timestamp())
     log.info(
       f"registered details: {record}, project: {dataset.project()}, pii: {dataset.contains_pii()}"
     )
@@ -345,27 +495,26 @@ class Registrar(Observable):
     )
     if not ServerState().options.get("dry_run"):
       start_time = time()
+      RateLimiter().acquire("dal", dataset.resource.arn.account_id)
       try:
-
-        resp = register_dataset(dataset)
+        with self.engine.clients.client() as dal_client:
+          resp = register_dataset(dataset, dal_client)
       except Exception as dal_ex:
         log.exception(f"DAL registration error: {dal_ex}")
         self._dal_errors.increment()
         raise RegistrationError(dal_ex)
 
       self._datasets_registered.increment()
-      self.metastore.set_refresh_at(
-        metastore_key,
-        int(start_time)
-        + jitter_ttl(
-          REGISTRATION_EXCLUSION_MAX_INTERVAL,
-          REGISTRATION_EXCLUSION_MIN_INTERVAL / REGISTRATION_EXCLUSION_MAX_INTERVAL,
-        ),
-      )
-      self.metastore.set_registered(metastore_key)
-      rate_limit(DAL_RATE_LIMIT, start_time)
+      self.set_registered(timestamps, start_time)
       return resp
 
+  def set_registered(self, timestamps: Dict[str, Optional[int]], start_time: float):
+    timestamps["refresh_at"] = int(start_time) + jitter_ttl(
+      REGISTRATION_EXCLUSION_MAX_INTERVAL,
+      REGISTRATION_EXCLUSION_MIN_INTERVAL / REGISTRATION_EXCLUSION_MAX_INTERVAL,
+    )
+    timestamps["registered"] = None
+
   def register_kite_role(self, dataset: Dataset):
     kite_role = dataset.kite_role()
     if kite_role:
@@ -376,27 +525,117 @@ class Registrar(Observable):
     else:
       log.info(f"Kite role not built, skipping creating kite role for {dataset}.")
 
-  def register_datasets(self, datasets: Dict[Resource, List[IamObservedAccess]]):
+  def register(
+    self, dataset: Dataset, record: Optional[Dict[str, Any]], timestamps: Dict[str, Optional[int]]
+  ) -> bool:
+    """
+    Register `dataset` and its accesses with DAL, return whether the dataset was registered.
+    Datasets whose fingerprint matches the fingerprint of their last registration are not
+    registered again, only their timestamps are refreshed.
+    """
+    fingerprint = None
+    fingerprints = (record or {}).get(REGISTRATION_FINGERPRINTS_FIELD)
+    if not isinstance(fingerprints, dict):
+      fingerprints = {}
+    if ServerState().options.get("registration_fingerprints"):
+      fingerprint = dataset.fingerprint()
+      if fingerprints.get(dataset.resource.arn.arn) == fingerprint:
+        log.info(f"skipping registration of unchanged dataset: {dataset}")
+        self._datasets_registration_skipped.increment()
+        self.set_registered(timestamps, time())
+        return False
+
+    try:
+      resp = self.register_dataset(dataset, record, timestamps)
+    except RegistrationError:
+      log.error(f"dataset registration failed for dataset: {dataset}")
+      self.failed = True
+      return False
+
+    try:
+      if resp:
+        self.register_access(dataset, resp.physicalDataset.id)
+    except RegistrationError:
+      log.error(f"access registration failed for dataset: {dataset}")
+      self.failed = True
+      return True
+
+    # only the entries of registered datasets are updated, see `Metastore.set_timestamps`
+    if resp and fingerprint:
+      timestamps.setdefault(REGISTRATION_FINGERPRINTS_FIELD, {})[
+        dataset.resource.arn.arn
+      ] = fingerprint
+    return True
+
+  def register_datasets(
+    self, datasets: Union[Dict[Resource, List[IamObservedAccess]], ScanCheckpoint]
+  ):
+    if isinstance(datasets, ScanCheckpoint):
+      self.checkpoint(datasets)
+      return
+
+    batch = []
     for resource, accesses in datasets.items():
       try:
-        dataset = Dataset(resource, accesses)
+        batch.append(Dataset(resource, accesses))
       except Exception as ex:
         log.error(f"Unable to instantiate Dataset class for resource: {resource}. ex={ex}")
-        continue
-
-      try:
-        resp = self.register_dataset(dataset)
-      except RegistrationError:
-        log.error(f"dataset registration failed for dataset: {dataset}")
-        continue
-
-      try:
-        if resp:
-          self.register_access(dataset, resp.physicalDataset.id)
-      except RegistrationError:
-        log.error(f"access registration failed for dataset: {dataset}")
+        self.failed = True
+
+    # metastore records for the whole batch are read with a single set of
+    # `BatchGetItem` requests, datasets are registered concurrently on the
+    # engine's DAL pool and timestamp updates are written by the post-processing
+    # pool once the batch has been registered.
+    records = self.metastore.batch_get(
+      self.metastore.regional_and_global_keys([d.resource.arn for d in batch])
+    )
+    updates = {}
+    future_to_dataset = {}
+    registered = []
+    try:
+      for dataset in batch:
+        dataset.set_meta(self.metastore.select_regional_or_global(dataset.resource.arn, records))
+        metastore_key = self.metastore.key(dataset.resource.arn)
+        if metastore_key not in updates:
+          updates[metastore_key] = {}
+
+        future = self.engine.executor.submit(
+          self.register, dataset, records.get(metastore_key), updates[metastore_key]
+        )
+        future_to_dataset[future] = dataset
+
+      for future in concurrent.futures.as_completed(
+        future_to_dataset.keys(), timeout=FUTURE_TIMEOUTS["processor"]
+      ):
+        if future.result():
+          registered.append(future_to_dataset[future])
+        ProgressTracker().advance(account_stage_key(self.auth.account_id, "registration"))
+    finally:
+      # outstanding DAL calls complete before their timestamps are written
+      concurrent.futures.wait(future_to_dataset.keys())
+      with self.lock:
+        self.pending.append(
+          self.engine.post_executor.submit(
+            self.post_process, updates, records, registered
+          )
+        )
 
-      try:
-        self.register_kite_role(dataset)
-      except Exception as e:
-        log.debug(f"kite role registration failed for dataset: {dataset}\n{e}")
+  def post_process(
+    self,
+    updates: Dict[str, Dict[str, Optional[int]]],
+    records: Dict[str, Dict[str, Any]],
+    registered: List[Dataset],
+  ):
+    try:
+      for dataset in registered:
+        try:
+          self.register_kite_role(dataset)
+        except Exception as e:
+          log.debug(f"kite role registration failed for dataset: {dataset}\n{e}")
+          self.failed = True
+          # the fingerprint is removed so the dataset is registered again by the next run
+          fields = updates.get(self.metastore.key(dataset.resource.arn), {})
+          if REGISTRATION_FINGERPRINTS_FIELD in fields:
+            fields[REGISTRATION_FINGERPRINTS_FIELD][dataset.resource.arn.arn] = None
+    finally:
+      self.post_metastore.set_timestamps(updates, records)
@@ -0,0 +1,116 @@
+import concurrent.futures
+import heapq
+from itertools import count
+from random import uniform
+from threading import Condition, Thread
+from time import monotonic
+from typing import Any, Callable
+
+from twitter.common import log
+from twitter.common.metrics import AtomicGauge, LambdaGauge
+from twitter.common.metrics.metrics import Metrics
+
+from server_config import RETRY_BASE_DELAY, RETRY_MAX_DELAY
+
+
+def retry_delay(attempt: int) -> float:
+  """
+  Jittered exponential backoff, the delay of the n-th retry is drawn from the upper half of
+  `RETRY_BASE_DELAY * 2 ** (n - 1)` capped at `RETRY_MAX_DELAY`.
+  """
+  delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (attempt - 1))
+  return uniform(delay / 2, delay)
+
+
+class RetryScheduler:
+  """
+  Process-wide scheduler of delayed retries. Failed calls are resubmitted to their executor once
+  their retry deadline passes, so executor threads keep working on other calls instead of
+  sleeping through the backoff. Deadlines are kept in a heap served by a single daemon thread.
+  """
+
+  _INSTANCE = None
+
+  def __new__(cls):
+    if not cls._INSTANCE:
+      cls._INSTANCE = object.__new__(cls)
+      cls._INSTANCE.cond = Condition()
+      cls._INSTANCE.heap = []
+      cls._INSTANCE.seq = count()
+      cls._INSTANCE.pending = LambdaGauge("retries_pending", lambda: len(cls._INSTANCE.heap))
+      cls._INSTANCE.scheduled = AtomicGauge("retries_scheduled")
+      cls._INSTANCE.thread = Thread(target=cls._INSTANCE.run, name="retry-scheduler", daemon=True)
+      cls._INSTANCE.thread.start()
+
+    return cls._INSTANCE
+
+  def register_metrics(cls, metrics: Metrics):
+    metrics.register(cls._INSTANCE.pending)
+    metrics.register(cls._INSTANCE.scheduled)
+
+  def run(self):
+    while True:
+      with self.cond:
+        while len(self.heap) == 0 or self.heap[0][0] > monotonic():
+          self.cond.wait(self.heap[0][0] - monotonic() if self.heap else None)
+        _, _, fn = heapq.heappop(self.heap)
+
+      try:
+        fn()
+      except Exception as ex:
+        log.exception(f"retry scheduler callback failed. ex={ex}")
+
+  def schedule(self, delay: float, fn: Callable[[], Any]):
+    self.scheduled.increment()
+    with self.cond:
+      heapq.heappush(self.heap, (monotonic() + delay, next(self.seq), fn))
+      self.cond.notify()
+
+  def submit(
+    self,
+    executor: concurrent.futures.Executor,
+    retryable: Callable[[Exception], bool],
+    attempts: int,
+    work_gauge: AtomicGauge,
+    wait_gauge: AtomicGauge,
+    fn: Callable,
+    *args,
+  ) -> concurrent.futures.Future:
+    """
+    Submit `fn` to `executor` and return a future resolved with its result. Calls failing with
+    a `retryable` exception are retried up to `attempts` times. Time spent running `fn` is added
+    to `work_gauge` and time spent waiting for a retry to `wait_gauge`, in milliseconds.
+    """
+    result = concurrent.futures.Future()
+
+    def attempt(n: int, failed_at: float = None):
+      if failed_at is not None:
+        wait_gauge.add(int((monotonic() - failed_at) * 1000))
+      try:
+        future = executor.submit(timed_call, work_gauge, fn, *args)
+      except RuntimeError as ex:
+        # the executor was shut down while the retry was pending
+        result.set_exception(ex)
+        return
+      future.add_done_callback(lambda f: done(f, n))
+
+    def done(future: concurrent.futures.Future, n: int):
+      ex = future.exception()
+      if ex is None:
+        result.set_result(future.result())
+      elif retryable(ex) and n < attempts:
+        failed_at = monotonic()
+        self.schedule(retry_delay(n + 1), lambda: attempt(n + 1, failed_at))
+      else:
+        result.set_exception(ex)
+
+    attempt(0)
+    return result
+
+
+def timed_call(gauge: AtomicGauge, fn: Callable, *args) -> Any:
+  start = monotonic()
+  try:
+    return fn(*args)
+  finally:
+    gauge.add(int((monotonic() - start) * 1000))
@@ -1,7 +1,11 @@
+import asyncio
 import concurrent.futures
+import copy
+from multiprocessing.connection import Connection
+import sys
 from threading import Event
 from time import sleep, time
-from typing import Dict, List, Optional
+from typing import Any, Dict, List, Optional
 
 from twitter.common import app, log
 from twitter.common.metrics import AtomicGauge, MetricSampler, RootMetrics
@@ -10,6 +14,7 @@ from twitter.common_internal.log.loglens_handler import LogLensHandler
 from twitter.kite.utils.kerberos import KerberosTicketRefresher
 from util import (
   batch_process_completion_queue_with_snk,
+  BoundedCompletionQueue,
   CompletionQueue,
   envoy_proxy_connection_check,
   fatal,
@@ -27,13 +32,20 @@ from aws_cloud_watch import (
 )
 from aws_iam import (
   AwsAuthenticator,
+  AwsClientCache,
   get_all_entity_batched_resource_accesses,
   get_authenticator,
   get_iam_entity_map,
   IamAccessCacheMetrics,
   IamEntity,
+  IamEntityPrefilter,
+  IamPolicyEvaluatorStore,
+  IamSimulationBatchSizer,
 )
-from aws_organizations import get_account_tag, get_accounts
+from aws_credential_broker import CredentialBroker
+from aws_iam_graph import IamGraph
+from aws_organizations import get_account_tag, get_accounts, load_account_metadata
+from aws_s3 import S3ApiLatency
 from aws_scanners import (
   DAXScanner,
   DynamoDbScanner,
@@ -41,29 +53,43 @@ from aws_scanners import (
   ElastiCacheSnapshotScanner,
   get_all_resources,
   KinesisScanner,
+  ResourceScanner,
   S3Scanner,
   SqsScanner,
 )
 from botocore.exceptions import ClientError
 from dataset import DatasetFilter
-from dataset_metastore import Metastore
+from dataset_metastore import Metastore, MetastoreCache
 from dataset_stagestore import Stagestore
-from registration import Registrar
+from registration import Registrar, RegistrationEngine
+from retry_scheduler import RetryScheduler
+from server_async import AsyncCompletionQueue, AsyncPipelineRunner
 from server_config import (
   AWS_ORGANIZATION_ACCOUNT_ID,
   AWS_ORGANIZATION_ACCOUNT_KITE_TAG,
   DYNAMO_STAGES_TABLE_ACCOUNT_ID,
   FUTURE_TIMEOUTS,
   IAM_RSRC_ACCESS_SIML_BATCH_SIZE,
+  RESOURCE_ACCESS_POLICY_ACTIONS,
   SERVER_MONITOR_INTVL,
+  STAGE_QUEUE_BATCH_SIZE,
   SUPPORTED_IAM_ENTITIES,
   SVC_DOMAIN,
   SVC_NAME,
   SVC_ROLE,
 )
+from server_progress import ProgressTracker
+from server_shards import shard_accounts, ShardSupervisor, worker_shards
 from server_state import ServerState
 
 
+app.add_option(
+  "--async-pipeline",
+  action="store_true",
+  default=False,
+  dest="async_pipeline",
+  help="Run account pipeline stages as coroutines with shared per-API concurrency limits.",
+)
 app.add_option("--aws-access-key", default=None, dest="access_key", help="AWS API access key.")
 app.add_option(
   "--aws-secret-access-key", default=None, dest="secret_key", help="AWS API secret access key."
@@ -76,6 +102,13 @@ app.add_option(
   dest="disable_access_cache",
   help="Disable caching of resource access entities.",
 )
+app.add_option(
+  "--disable-access-prefilter",
+  action="store_false",
+  default=True,
+  dest="access_prefilter",
+  help="Simulate every IAM entity against every resource instead of only entities with policies granting access to the resource's service.",
+)
 app.add_option(
   "--disable-access-simulation",
   action="store_true",
@@ -83,6 +116,20 @@ app.add_option(
   dest="disable_access_simulation",
   help="Disable AWS IAM access simulation API calls.",
 )
+app.add_option(
+  "--disable-iam-graph",
+  action="store_false",
+  default=True,
+  dest="iam_graph",
+  help="List IAM entities every run instead of loading the cached IAM entity and policy graph.",
+)
+app.add_option(
+  "--disable-inventory-snapshot",
+  action="store_false",
+  default=True,
+  dest="inventory_snapshot",
+  help="Describe every listed resource instead of reusing unchanged resources from the inventory snapshot.",
+)
 app.add_option(
   "--disable-kerberos",
   action="store_true",
@@ -97,6 +144,20 @@ app.add_option(
   dest="disable_kite",
   help="Disable Kite registration.",
 )
+app.add_option(
+  "--disable-metastore-cache",
+  action="store_false",
+  default=True,
+  dest="metastore_cache",
+  help="Disable the in-memory cache of dataset metastore records shared by pipeline stages.",
+)
+app.add_option(
+  "--disable-registration-fingerprints",
+  action="store_false",
+  default=True,
+  dest="registration_fingerprints",
+  help="Disable skipping the registration of datasets that are unchanged since their last registration.",
+)
 app.add_option(
   "--disable-resource-filter",
   action="store_true",
@@ -111,6 +172,19 @@ app.add_option(
   dest="disable_retention_processing",
   help="Disable additional API calls related to dataset retention registration.",
 )
+app.add_option(
+  "--disable-stage-checkpoints",
+  action="store_false",
+  default=True,
+  dest="stage_checkpoints",
+  help="Scan every region of partially processed accounts instead of resuming from the checkpoint of the last interrupted run.",
+)
+app.add_option(
+  "--disk-cache-dir",
+  default=None,
+  dest="disk_cache_dir",
+  help="Directory of the on-disk caches shared across runs.",
+)
 app.add_option(
   "--dry-run",
   action="store_true",
@@ -125,6 +199,14 @@ app.add_option(
   help="Envoy Proxy Url. Enable use of envoy proxy for requests to AWS APIs.",
 )
 
+app.add_option(
+  "--enable-policy-evaluator",
+  action="store_true",
+  default=False,
+  dest="enable_policy_evaluator",
+  help="Evaluate IAM policies locally and only spot-check results with access simulation API calls."
+  " Entities missing from the IAM graph or with a permissions boundary are always simulated.",
+)
 app.add_option(
   "--enable-splunk",
   action="store_true",
@@ -188,44 +270,123 @@ app.add_option(
   help="Manually process a single AWS account.",
 )
 
+app.add_option(
+  "--stage-queue-capacity",
+  default=None,
+  dest="stage_queue_capacity",
+  help="Maximum number of values buffered between pipeline stages per account.",
+)
+
 app.add_option(
   "--s2s",
   type="str",
   help="s2s parameters job(name):role:env:cluster, apply to tls client side service authentication. More info: http://go/s2s",
 )
+app.add_option(
+  "--shard-count",
+  default=1,
+  dest="shard_count",
+  type="int",
+  help="Number of shards AWS accounts are distributed to by consistent hashing of account IDs.",
+)
+app.add_option(
+  "--shard-index",
+  default=None,
+  dest="shard_index",
+  type="int",
+  help="Process the AWS accounts of a single shard, required when `--shard-count` is above 1.",
+)
+app.add_option(
+  "--shard-workers",
+  default=0,
+  dest="shard_workers",
+  type="int",
+  help="Fork worker processes each running a sub-shard of the accounts of this shard. Every host must use the same number of workers.",
+)
+
+
+def authenticate_account(
+  account_id: str, reporter: CloudWatchReporter, broker: CredentialBroker
+) -> Optional[AwsAuthenticator]:
+  auth = broker.get(account_id)
+  if not auth:
+    return None
+
+  try:
+    default_project = get_account_default_project(account_id)
+
+    if default_project:
+      ServerState().meta["account_default_projects"][account_id] = default_project
+    else:
+      log.warn(f"Unable to detect default Kite project for account: {account_id}")
+      put_account_metric(account_metric(account_id, "default_project_missing"), reporter)
+  except ClientError as exception:
+    if exception.response["Error"]["Code"] in ("AccessDenied", "AccessDeniedException"):
+      log.error(f"Unable to authenticate to AWS account: {account_id}. ex={exception}")
+      return None
+    else:
+      raise exception
+
+  return auth
 
 
 def get_account_default_project(account_id: str) -> Optional[str]:
   auth = get_authenticator(AWS_ORGANIZATION_ACCOUNT_ID)
 
-  # fetch Kite project from AWS organization account tags
-  return get_account_tag(auth, account_id, AWS_ORGANIZATION_ACCOUNT_KITE_TAG)
+  # fetch Kite project from AWS organization account tags, single account runs skip the bulk load
+  accounts = None
+  if not ServerState().options.get("process_account"):
+    accounts = load_account_metadata(auth)
+  return get_account_tag(auth, account_id, AWS_ORGANIZATION_ACCOUNT_KITE_TAG, accounts)
 
 
-def get_iam_entities(
-  auth: AwsAuthenticator, account_metrics: Metrics
-) -> Dict[str, List[IamEntity]]:
+def get_iam_entity_gauges(account_metrics: Metrics) -> Dict[str, AtomicGauge]:
   entity_gagues = {}
   for entity_type in SUPPORTED_IAM_ENTITIES:
     entity_gagues[entity_type] = account_metrics.register(AtomicGauge(f"{entity_type}s_observed"))
 
-  return get_iam_entity_map(auth, entity_gagues)
+  return entity_gagues
+
+
+def get_iam_entities(
+  auth: AwsAuthenticator, account_metrics: Metrics, graph: IamGraph = None
+) -> Dict[str, List[IamEntity]]:
+  gauges = get_iam_entity_gauges(account_metrics)
+  if graph:
+    # entities without policies granting access to the scanned services are not simulated
+    return graph.entity_map(list(RESOURCE_ACCESS_POLICY_ACTIONS.keys()), gauges)
+  return get_iam_entity_map(auth, gauges)
+
+
+def get_iam_graph(auth: AwsAuthenticator, account_metrics: Metrics) -> Optional[IamGraph]:
+  if not ServerState().options.get("iam_graph"):
+    return None
+
+  graph = IamGraph(auth)
+  account_metrics.register_observable("iam_graph", graph)
+  graph.load()
+  return graph
 
 
 def monitor(
-  accounts: List[int], shutdown_event: Event, reporter: CloudWatchReporter, stage_store: Stagestore
+  accounts: List[int],
+  shutdown_event: Event,
+  reporter: CloudWatchReporter,
+  progress: Connection = None,
 ):
   stage_queue = CompletionQueue()
-  ServerState().set_stage_store(stage_store)
   ServerState().set_stage_queue(stage_queue)
   while not shutdown_event.is_set():
     sleep(SERVER_MONITOR_INTVL)
     try:
       log.info(f"{ServerState()}")
+      log.info(f"{ProgressTracker().snapshot()}")
       process_completion_queue(stage_queue, put_account_metric, {"reporter": reporter}, True)
-      stats = MetricSampler(RootMetrics()).sample()
-      reporter.process(stats)
-      ServerState().monitor(accounts, stats)
+      reporter.process(MetricSampler(RootMetrics()).sample())
+      ServerState().monitor()
+      if progress:
+        # shard workers report their progress to the supervisor
+        progress.send({**ServerState().progress(), "accounts": len(accounts)})
     except Exception as ex:
       log.error(f"Server monitor error: {ex}")
 
@@ -246,38 +407,31 @@ def setup_kerberos():
   refresher.start()
 
 
+def new_scanners(auth: AwsAuthenticator, metrics: Metrics) -> List[ResourceScanner]:
+  scanners = []
+  for name, scanner_cls in (
+    ("dax_scanner", DAXScanner),
+    ("dynamodb_scanner", DynamoDbScanner),
+    ("kinesis_scanner", KinesisScanner),
+    ("s3_scanner", S3Scanner),
+    ("sqs_scanner", SqsScanner),
+    ("elasticachecluster_scanner", ElastiCacheClusterScanner),
+    ("elasticachesnapshot_scanner", ElastiCacheSnapshotScanner),
+  ):
+    scanner = scanner_cls(auth.account_id, auth)
+    metrics.register_observable(name, scanner)
+    scanners.append(scanner)
+
+  return scanners
+
+
 def start_scanner_future(
   auth: AwsAuthenticator,
   executor: concurrent.futures.ThreadPoolExecutor,
   metrics: Metrics,
   snk: CompletionQueue,
 ) -> concurrent.futures.Future:
-  dax_scanner = DAXScanner(auth.account_id, auth)
-  metrics.register_observable("dax_scanner", dax_scanner)
-  dynamodb_scanner = DynamoDbScanner(auth.account_id, auth)
-  metrics.register_observable("dynamodb_scanner", dynamodb_scanner)
-  kinesis_scanner = KinesisScanner(auth.account_id, auth)
-  metrics.register_observable("kinesis_scanner", kinesis_scanner)
-  s3_scanner = S3Scanner(auth.account_id, auth)
-  metrics.register_observable("s3_scanner", s3_scanner)
-  sqs_scanner = SqsScanner(auth.account_id, auth)
-  metrics.register_observable("sqs_scanner", sqs_scanner)
-  elasticachecluster_scanner = ElastiCacheClusterScanner(auth.account_id, auth)
-  metrics.register_observable("elasticachecluster_scanner", elasticachecluster_scanner)
-  elasticachesnapshot_scanner = ElastiCacheSnapshotScanner(auth.account_id, auth)
-  metrics.register_observable("elasticachesnapshot_scanner", elasticachesnapshot_scanner)
-  return executor.submit(
-    get_all_resources,
-    auth.account_id,
-    snk,
-    dax_scanner,
-    dynamodb_scanner,
-    kinesis_scanner,
-    s3_scanner,
-    sqs_scanner,
-    elasticachecluster_scanner,
-    elasticachesnapshot_scanner,
-  )
+  return executor.submit(get_all_resources, auth.account_id, snk, *new_scanners(auth, metrics))
 
 
 def start_filter_future(
@@ -292,20 +446,19 @@ def start_filter_future(
   return executor.submit(
     process_completion_queue,
     src,
-    resource_filter.process,
+    resource_filter.process_batch,
     completion_callback=snk.set_completed,
     stage=f"{auth.account_id}.filter",
+    batch_size=STAGE_QUEUE_BATCH_SIZE,
   )
 
 
-def start_access_simulation_future(
+def access_simulation_args(
   auth: AwsAuthenticator,
-  executor: concurrent.futures.ThreadPoolExecutor,
   iam_entities: Dict[str, List[IamEntity]],
   metrics: Metrics,
-  src: CompletionQueue,
-  snk: CompletionQueue,
-) -> concurrent.futures.Future:
+  graph: IamGraph = None,
+) -> Dict[str, Any]:
   args = {
     "auth": auth,
     "iam_entities": iam_entities,
@@ -322,15 +475,43 @@ def start_access_simulation_future(
       # when this metric reaches the product of the sum of access entities
       # and the sum of emitted dataset resources.
       "resource_access_processed": metrics.register(AtomicGauge("resource_access_processed")),
+      # resources skipped for entities without policies granting access to their service, the
+      # stage completes when the sum of processed and pruned resources reaches the product.
+      "resource_access_pruned": metrics.register(AtomicGauge("resource_access_pruned")),
+      # time spent simulating vs waiting to retry throttled simulation requests
+      "access_simulation_retry_wait_ms": metrics.register(
+        AtomicGauge("access_simulation_retry_wait_ms")
+      ),
+      "access_simulation_work_ms": metrics.register(AtomicGauge("access_simulation_work_ms")),
     },
   }
+  if ServerState().options.get("access_prefilter"):
+    prefilter = IamEntityPrefilter(list(RESOURCE_ACCESS_POLICY_ACTIONS.keys()), graph)
+    metrics.register_observable("access_prefilter", prefilter)
+    args["prefilter"] = prefilter
+  if ServerState().options.get("enable_policy_evaluator"):
+    evaluator_store = IamPolicyEvaluatorStore(list(RESOURCE_ACCESS_POLICY_ACTIONS.keys()), graph)
+    metrics.register_observable("policy_evaluator", evaluator_store)
+    args["evaluator_store"] = evaluator_store
+  return args
+
+
+def start_access_simulation_future(
+  auth: AwsAuthenticator,
+  executor: concurrent.futures.ThreadPoolExecutor,
+  iam_entities: Dict[str, List[IamEntity]],
+  metrics: Metrics,
+  src: CompletionQueue,
+  snk: CompletionQueue,
+  graph: IamGraph = None,
+) -> concurrent.futures.Future:
   return executor.submit(
     batch_process_completion_queue_with_snk,
     IAM_RSRC_ACCESS_SIML_BATCH_SIZE,
     src,
     snk,
     get_all_entity_batched_resource_accesses,
-    args,
+    access_simulation_args(auth, iam_entities, metrics, graph),
     completion_callback=snk.set_completed,
     stage=f"{auth.account_id}.access_simulation",
   )
@@ -342,17 +523,163 @@ def start_registration_future(
   metrics: Metrics,
   src: CompletionQueue,
 ) -> concurrent.futures.Future:
-  registrar = Registrar(Metastore(auth))
+  registrar = Registrar(auth)
   metrics.register_observable("registrar", registrar)
   return executor.submit(
     process_completion_queue,
     src,
     registrar.register_datasets,
+    completion_callback=registrar.flush,
     stage=f"{auth.account_id}.registration",
   )
 
 
+def start_account_pipeline(
+  account_id: str,
+  executor: concurrent.futures.ThreadPoolExecutor,
+  reporter: CloudWatchReporter,
+  broker: CredentialBroker,
+) -> List[concurrent.futures.Future]:
+  """
+  Authenticate `account_id`, list its IAM entities and start its pipeline stages on `executor`.
+  Accounts are set up on the executor so pipelines start as soon as their own setup completes.
+  """
+  account_metrics = RootMetrics().scope(account_id)
+  auth = authenticate_account(account_id, reporter, broker)
+  if not auth:
+    return []
+
+  # fetch IAM entities
+  if not ServerState().options.get("disable_access_cache"):
+    IamAccessCacheMetrics().register_metrics(account_metrics)
+  if ServerState().options.get("metastore_cache"):
+    MetastoreCache().register_metrics(account_metrics)
+  graph = get_iam_graph(auth.clone(), account_metrics)
+  iam_entities = get_iam_entities(auth.clone(), account_metrics, graph)
+  for svc, entities in iam_entities.items():
+    log.info(f"Total {account_id}/{svc} access entities: {len(entities)}")
+
+  futures = []
+  # stage: scan
+  resource_snk = BoundedCompletionQueue("resource_queue")
+  resource_snk.register_metrics(account_metrics)
+  futures.append(start_scanner_future(auth.clone(), executor, account_metrics, resource_snk))
+
+  # stage filter
+  filtered_resource_snk = BoundedCompletionQueue("filtered_resource_queue")
+  filtered_resource_snk.register_metrics(account_metrics)
+  futures.append(
+    start_filter_future(
+      auth.clone(), executor, account_metrics, resource_snk, filtered_resource_snk
+    )
+  )
+
+  # stage: access_simulation
+  resource_access_snk = BoundedCompletionQueue("resource_access_queue")
+  resource_access_snk.register_metrics(account_metrics)
+  futures.append(
+    start_access_simulation_future(
+      auth.clone(),
+      executor,
+      iam_entities,
+      account_metrics,
+      filtered_resource_snk,
+      resource_access_snk,
+      graph,
+    )
+  )
+
+  # stage: registration
+  futures.append(
+    start_registration_future(auth.clone(), executor, account_metrics, resource_access_snk)
+  )
+  return futures
+
+
+async def run_account_pipeline(
+  runner: AsyncPipelineRunner,
+  account_id: str,
+  reporter: CloudWatchReporter,
+  broker: CredentialBroker,
+):
+  account_metrics = RootMetrics().scope(account_id)
+  # pipelines start as soon as their account's credentials resolve
+  if not await asyncio.wrap_future(broker.future(account_id)):
+    return
+  auth = await runner.call("organizations", authenticate_account, account_id, reporter, broker)
+  if not auth:
+    return
+
+  # fetch IAM entities
+  if not ServerState().options.get("disable_access_cache"):
+    IamAccessCacheMetrics().register_metrics(account_metrics)
+  if ServerState().options.get("metastore_cache"):
+    MetastoreCache().register_metrics(account_metrics)
+  graph = await runner.call("iam", get_iam_graph, auth, account_metrics)
+  if graph:
+    iam_entities = await runner.call("iam", get_iam_entities, auth, account_metrics, graph)
+  else:
+    iam_entities = await runner.iam_entity_map(auth, get_iam_entity_gauges(account_metrics))
+  for svc, entities in iam_entities.items():
+    log.info(f"Total {account_id}/{svc} access entities: {len(entities)}")
+
+  queues = []
+  for name in ("resource_queue", "filtered_resource_queue", "resource_access_queue"):
+    queue = AsyncCompletionQueue(name)
+    queue.register_metrics(account_metrics)
+    queues.append(queue)
+  resource_snk, filtered_resource_snk, resource_access_snk = queues
+
+  # scanners, metastores and the registrar create boto3 clients and sessions
+  scanners = await runner.call("scan", lambda: new_scanners(auth.clone(), account_metrics))
+  resource_filter = await runner.call("dynamodb", lambda: DatasetFilter(Metastore(auth), None))
+  account_metrics.register_observable("resource_filter", resource_filter)
+  registrar = await runner.call("dynamodb", lambda: Registrar(auth))
+  account_metrics.register_observable("registrar", registrar)
+
+  await asyncio.gather(
+    runner.scan(account_id, resource_snk, scanners),
+    runner.filter(account_id, resource_filter, resource_snk, filtered_resource_snk),
+    runner.access_simulation(
+      src=filtered_resource_snk,
+      snk=resource_access_snk,
+      **access_simulation_args(auth, iam_entities, account_metrics, graph),
+    ),
+    runner.registration(account_id, registrar, resource_access_snk),
+  )
+
+
 def main(args, options):
+  if options.shard_count > 1 and options.shard_index is None and not options.shard_workers:
+    fatal("option `--shard-index` is required when `--shard-count` is above 1.")
+  if options.shard_index is not None and not 0 <= options.shard_index < options.shard_count:
+    fatal("option `--shard-index` must be between 0 and `--shard-count` - 1.")
+
+  if not options.shard_workers:
+    run_server(options)
+    return
+
+  # the supervisor only forks and waits for workers, every worker runs the
+  # server for its own shard in a separate process and metrics scope.
+  shards, count = worker_shards(
+    options.shard_index or 0, options.shard_count, options.shard_workers
+  )
+
+  def run_shard(shard: int, progress: Connection):
+    shard_options = copy.copy(options)
+    shard_options.shard_count = count
+    shard_options.shard_index = shard
+    shard_options.shard_workers = 0
+    run_server(shard_options, progress)
+
+  supervisor = ShardSupervisor(shards, run_shard)
+  supervisor.start()
+  exit_code = supervisor.wait()
+  if exit_code:
+    sys.exit(exit_code)
+
+
+def run_server(options, progress: Connection = None):
   ServerState({"account_default_projects": {}, "server_start": time()}, options.__dict__)
 
   if options.envoy_proxy_url:
@@ -380,81 +707,67 @@ def main(args, options):
   if options.process_account:
     log.info(f"Processing individual AWS account: {options.process_account}")
 
+  global_metrics = RootMetrics().scope("global")
+  if options.shard_count > 1:
+    global_metrics = RootMetrics().scope(f"global_shard_{options.shard_index}")
+
+  AwsClientCache().register_metrics(global_metrics)
+  IamSimulationBatchSizer().register_metrics(global_metrics)
+  ProgressTracker().register_metrics(global_metrics)
+  RegistrationEngine().register_metrics(global_metrics)
+  RetryScheduler().register_metrics(global_metrics)
+  S3ApiLatency().register_metrics(global_metrics)
   accounts = get_accounts(get_authenticator(AWS_ORGANIZATION_ACCOUNT_ID))
+  if options.shard_count > 1:
+    accounts = shard_accounts(accounts, options.shard_index, options.shard_count)
+    log.info(
+      f"Processing shard {options.shard_index} of {options.shard_count}: {len(accounts)} accounts."
+    )
+  broker = CredentialBroker(accounts)
+  global_metrics.register_observable("credential_broker", broker)
+  broker.start()
   shutdown_event = Event()
-  stage_store = Stagestore(get_authenticator(DYNAMO_STAGES_TABLE_ACCOUNT_ID))
+  # scanners load the checkpoints of interrupted runs before the monitor starts
+  ServerState().set_stage_store(Stagestore(get_authenticator(DYNAMO_STAGES_TABLE_ACCOUNT_ID)))
+  cw_reporter = get_cloud_watch_reporter(SVC_ROLE[options.env])
   with concurrent.futures.ThreadPoolExecutor(max_workers=1) as monitor_ex:
-    # the worker account multiplier should match the number of
-    # futures / pipeline stages defined below.
-    workers = len(accounts) * 4
+    if options.async_pipeline:
+      monitor_future = monitor_ex.submit(monitor, accounts, shutdown_event, cw_reporter, progress)
+      try:
+        AsyncPipelineRunner().run(
+          lambda runner, account_id: run_account_pipeline(
+            runner, account_id, cw_reporter, broker
+          ),
+          accounts,
+        )
+      finally:
+        broker.shutdown()
+        shutdown_event.set()
+
+      log.info("processing complete, shutting down.")
+      terminate_envoy_sidecar(options.envoy_proxy_url)
+      monitor_future.result()
+      return
+
+    # the worker account multiplier should match the number of futures / pipeline stages
+    # started by `start_account_pipeline` plus the account's setup future.
+    workers = len(accounts) * 5
     with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as ex:
+      monitor_future = monitor_ex.submit(monitor, accounts, shutdown_event, cw_reporter, progress)
+      setup_futures = [
+        ex.submit(start_account_pipeline, account_id, ex, cw_reporter, broker)
+        for account_id in broker.ready()
+      ]
       futures = []
-      for account_id in accounts:
-        account_metrics = RootMetrics().scope(account_id)
-        cw_reporter = get_cloud_watch_reporter(SVC_ROLE[options.env])
-
-        try:
-          auth = get_authenticator(account_id)
-          default_project = get_account_default_project(account_id)
-
-          if default_project:
-            ServerState().meta["account_default_projects"][account_id] = default_project
-          else:
-            log.warn(f"Unable to detect default Kite project for account: {account_id}")
-            put_account_metric(account_metric(account_id, "default_project_missing"), cw_reporter)
-        except ClientError as exception:
-          if exception.response["Error"]["Code"] in ("AccessDenied", "AccessDeniedException"):
-            log.error(f"Unable to authenticate to AWS account: {account_id}. ex={exception}")
-            continue
-          else:
-            raise exception
-
-        # fetch IAM entities
-        if not options.disable_access_cache:
-          IamAccessCacheMetrics().register_metrics(account_metrics)
-        iam_entities = get_iam_entities(auth.clone(), account_metrics)
-        for svc, entities in iam_entities.items():
-          log.info(f"Total {account_id}/{svc} access entities: {len(entities)}")
-
-        # stage: scan
-        resource_snk = CompletionQueue()
-        futures.append(start_scanner_future(auth.clone(), ex, account_metrics, resource_snk))
-
-        # stage filter
-        filtered_resource_snk = CompletionQueue()
-        futures.append(
-          start_filter_future(
-            auth.clone(), ex, account_metrics, resource_snk, filtered_resource_snk
-          )
-        )
-
-        # stage: access_simulation
-        resource_access_snk = CompletionQueue()
-        futures.append(
-          start_access_simulation_future(
-            auth.clone(),
-            ex,
-            iam_entities,
-            account_metrics,
-            filtered_resource_snk,
-            resource_access_snk,
-          )
-        )
-
-        # stage: registration
-        futures.append(
-          start_registration_future(auth.clone(), ex, account_metrics, resource_access_snk)
-        )
-
-      monitor_future = monitor_ex.submit(
-        monitor, accounts, shutdown_event, cw_reporter, stage_store
-      )
+      for future in concurrent.futures.as_completed(setup_futures, timeout=FUTURE_TIMEOUTS["main"]):
+        futures += future.result()
       for future in concurrent.futures.as_completed(futures, timeout=FUTURE_TIMEOUTS["main"]):
         _ = future.result()
 
     log.info("processing complete, shutting down.")
     terminate_envoy_sidecar(options.envoy_proxy_url)
 
+    broker.shutdown()
     shutdown_event.set()
     monitor_future.result()
 
@@ -0,0 +1,369 @@
+import asyncio
+from collections import deque
+import concurrent.futures
+from functools import partial
+from time import monotonic
+from typing import Any, Awaitable, Callable, Dict, List
+
+from twitter.common import log
+from twitter.common.metrics.metrics import Metrics
+from util import CompletionQueue, QueueGauges, ScanCheckpoint, stage_queue_capacity
+
+from aws_iam import (
+  AwsAuthenticator,
+  entity_batched_resource_accesses,
+  get_all_access_entities,
+  IamAccessCache,
+  IamEntity,
+  IamEntityPrefilter,
+  IamPolicyEvaluatorStore,
+  is_retryable_simulation_error,
+  merge_entity_accesses,
+  partition_cached_accesses,
+)
+from aws_scanners import ResourceScanner
+from botocore.parsers import ResponseParserError
+from dataset import DatasetFilter
+from dataset_stagestore import Stagestore
+from registration import Registrar
+from retry_scheduler import retry_delay, timed_call
+from server_config import (
+  ASYNC_API_CONCURRENCY,
+  ASYNC_CANCEL_TIMEOUT,
+  FUTURE_TIMEOUTS,
+  GLOBAL_API_REGION,
+  IAM_API_DELAYED_RETRIES,
+  IAM_RSRC_ACCESS_SIML_BATCH_SIZE,
+  STAGE_QUEUE_BATCH_SIZE,
+  SUPPORTED_IAM_ENTITIES,
+)
+from server_progress import ProgressTracker
+from server_state import ServerState
+
+
+class AsyncCompletionQueue:
+  """
+  Bounded completion queue used between pipeline stage coroutines. Instances must be created on
+  the event loop that runs the pipeline.
+  """
+
+  def __init__(self, name: str, maxsize: int = None):
+    self.name = name
+    self.maxsize = maxsize if maxsize is not None else stage_queue_capacity()
+    self.abandoned = False
+    self.completed = False
+    self.loop = asyncio.get_event_loop()
+    self.gauges = QueueGauges(name, self.qsize)
+    self._changed = asyncio.Condition()
+    self._values = deque()
+
+  def qsize(self) -> int:
+    return len(self._values)
+
+  def register_metrics(self, metrics: Metrics):
+    self.gauges.register(metrics)
+
+  async def get_many(self, max_items: int, min_items: int = 1) -> List[Any]:
+    """
+    Wait until `min_items` values are available and return up to `max_items` values. Fewer values
+    are returned once the queue is completed, an empty list once it is also drained.
+    """
+    start_time = monotonic()
+    min_items = min(min_items, self.maxsize) if self.maxsize > 0 else min_items
+    async with self._changed:
+      await self._changed.wait_for(
+        lambda: len(self._values) >= min_items or self.completed or self.abandoned
+      )
+      vals = []
+      while self._values and len(vals) < max_items:
+        vals.append(self._values.popleft())
+      self._changed.notify_all()
+
+    self.gauges.record_wait("get", monotonic() - start_time)
+    return vals
+
+  async def put(self, item: Any):
+    await self.put_many([item])
+
+  async def put_many(self, items: List[Any]):
+    start_time = monotonic()
+    async with self._changed:
+      for item in items:
+        await self._changed.wait_for(
+          lambda: self.maxsize <= 0 or len(self._values) < self.maxsize or self.abandoned
+        )
+        if self.abandoned:
+          return
+        self._values.append(item)
+        self._changed.notify_all()
+
+    self.gauges.record_wait("put", monotonic() - start_time)
+
+  async def set_abandoned(self):
+    async with self._changed:
+      self.abandoned = True
+      self._values.clear()
+      self._changed.notify_all()
+
+  async def set_completed(self):
+    async with self._changed:
+      self.completed = True
+      self._changed.notify_all()
+
+
+class ThreadSafeQueueSink:
+  """
+  `CompletionQueue` producer interface for blocking code running on executor threads. Puts block
+  the calling thread while the `AsyncCompletionQueue` is full. The queue is completed by the
+  stage coroutine that owns it so `set_completed` is a no-op.
+  """
+
+  def __init__(self, queue: AsyncCompletionQueue):
+    self.queue = queue
+
+  def put(self, item: Any):
+    self.put_many([item])
+
+  def put_many(self, items: List[Any]):
+    asyncio.run_coroutine_threadsafe(self.queue.put_many(items), self.queue.loop).result()
+
+  def set_completed(self):
+    pass
+
+
+class AsyncPipelineRunner:
+  """
+  Runs the account pipeline stages as coroutines on a single event loop. Blocking boto3 and DAL
+  calls are executed on one shared thread pool per API family, which bounds concurrency by
+  `ASYNC_API_CONCURRENCY` regardless of the number of accounts processed. Scanners run their
+  region and enrichment requests on their own pools, the `scan` family only bounds the number of
+  scanners running at once.
+  """
+
+  def __init__(self, concurrency: Dict[str, int] = ASYNC_API_CONCURRENCY):
+    self.executors = {
+      family: concurrent.futures.ThreadPoolExecutor(
+        max_workers=workers, thread_name_prefix=f"{family}-api"
+      )
+      for family, workers in concurrency.items()
+    }
+
+  async def call(self, family: str, fn: Callable, *args, **kwargs) -> Any:
+    return await asyncio.get_event_loop().run_in_executor(
+      self.executors[family], partial(fn, *args, **kwargs)
+    )
+
+  async def complete_stage(self, stage: str):
+    # stage completion is persisted to the DynamoDB stages table
+    await self.call("dynamodb", ServerState().complete_stage, stage)
+
+  async def process_queue(
+    self,
+    src: AsyncCompletionQueue,
+    fn: Callable[[List[Any]], Awaitable],
+    stage: str,
+    completion_callback: Callable[[], Awaitable] = None,
+    batch_size: int = STAGE_QUEUE_BATCH_SIZE,
+    fill_batches: bool = False,
+  ):
+    """
+    Coroutine equivalent of `process_completion_queue`. `fn` is awaited with lists of up to
+    `batch_size` values, full batches are awaited when `fill_batches` is set.
+    """
+    try:
+      while True:
+        vals = await src.get_many(batch_size, batch_size if fill_batches else 1)
+        if len(vals) == 0:
+          break
+        if stage not in ServerState().stages:
+          ServerState().start_stage(stage)
+
+        await fn(vals)
+        ProgressTracker().advance(stage, len(vals))
+    except Exception as ex:
+      log.exception(f"`process_queue` exception: {ex}")
+      await src.set_abandoned()
+      raise ex
+    finally:
+      if completion_callback:
+        await completion_callback()
+      await self.complete_stage(stage)
+
+  async def iam_entity_map(
+    self, auth: AwsAuthenticator, gauges: Dict[str, Any]
+  ) -> Dict[str, List[IamEntity]]:
+    def get_entities(entity_type: str) -> List[IamEntity]:
+      client = auth.new_client("iam", region=GLOBAL_API_REGION)
+      return get_all_access_entities(client, entity_type, gauges[entity_type])
+
+    log.info(f"Fetching IAM entities. account: {auth.account_id} types: {SUPPORTED_IAM_ENTITIES}")
+    entities = await asyncio.gather(
+      *[self.call("iam", get_entities, entity_type) for entity_type in SUPPORTED_IAM_ENTITIES]
+    )
+    return dict(zip(SUPPORTED_IAM_ENTITIES, entities))
+
+  async def scan(
+    self, account_id: str, snk: AsyncCompletionQueue, scanners: List[ResourceScanner]
+  ):
+    stage = f"{account_id}.scan"
+    ServerState().start_stage(stage)
+
+    try:
+      for scanner in scanners:
+        scanner.snk = ThreadSafeQueueSink(snk)
+      # each call runs a whole scanner, see `ASYNC_API_CONCURRENCY`
+      await asyncio.gather(*[self.call("scan", scanner.scan) for scanner in scanners])
+      # see `get_all_resources`
+      if Stagestore.checkpoints_enabled():
+        await snk.put(ScanCheckpoint(account_id))
+    except Exception as ex:
+      log.exception(f"`scan` exception: {ex}")
+      raise ex
+    finally:
+      await snk.set_completed()
+      await self.complete_stage(stage)
+
+  async def filter(
+    self,
+    account_id: str,
+    resource_filter: DatasetFilter,
+    src: AsyncCompletionQueue,
+    snk: AsyncCompletionQueue,
+  ):
+    # emitted resources are buffered and forwarded by the stage coroutine so DynamoDB
+    # executor threads never block on a full downstream queue.
+    buffer = CompletionQueue()
+    resource_filter.snk = buffer
+
+    def process(resources: List[Any]) -> List[Any]:
+      resource_filter.process_batch(resources)
+      return buffer.get_many(len(resources), 0)
+
+    async def process_batch(resources: List[Any]):
+      await snk.put_many(await self.call("dynamodb", process, resources))
+
+    await self.process_queue(
+      src, process_batch, f"{account_id}.filter", completion_callback=snk.set_completed
+    )
+
+  async def access_simulation(
+    self,
+    auth: AwsAuthenticator,
+    iam_entities: Dict[str, List[IamEntity]],
+    gauges: Dict[str, Any],
+    src: AsyncCompletionQueue,
+    snk: AsyncCompletionQueue,
+    evaluator_store: IamPolicyEvaluatorStore = None,
+    prefilter: IamEntityPrefilter = None,
+  ):
+    cache = await self.call("dynamodb", lambda: IamAccessCache(auth.clone()))
+    entities = [entity for _, type_entities in iam_entities.items() for entity in type_entities]
+    # see `batch_process_completion_queue_with_snk`
+    skipped = False
+
+    async def simulate_entity(entity: IamEntity, resources: List[Any]):
+      # throttled entities back off on the event loop without holding an `iam` executor thread
+      attempt = 0
+      while True:
+        try:
+          return await self.call(
+            "iam",
+            timed_call,
+            gauges["access_simulation_work_ms"],
+            entity_batched_resource_accesses,
+            auth,
+            entity,
+            resources,
+            gauges,
+            evaluator_store,
+            prefilter,
+          )
+        except Exception as ex:
+          if not is_retryable_simulation_error(ex) or attempt >= IAM_API_DELAYED_RETRIES:
+            raise ex
+          attempt += 1
+          delay = retry_delay(attempt)
+          gauges["access_simulation_retry_wait_ms"].add(int(delay * 1000))
+          await asyncio.sleep(delay)
+
+    async def simulate(resources: List[Any]):
+      nonlocal skipped
+      # checkpoint markers are forwarded after the accesses of the batch and dropped once a batch
+      # is skipped, see `ScanCheckpoint`
+      checkpoints = [] if skipped else [r for r in resources if isinstance(r, ScanCheckpoint)]
+      resources = [r for r in resources if not isinstance(r, ScanCheckpoint)]
+      if len(resources) == 0:
+        await snk.put_many(checkpoints)
+        return
+
+      cached_accesses, processed_accesses = await self.call(
+        "dynamodb", partition_cached_accesses, cache, resources
+      )
+      if len(processed_accesses) > 0:
+        resources = list(processed_accesses.keys())
+        results = await asyncio.gather(
+          *[simulate_entity(entity, resources) for entity in entities],
+          return_exceptions=True,
+        )
+        for result in results:
+          if isinstance(result, ResponseParserError):
+            # see `get_all_entity_batched_resource_accesses`
+            log.error("access simulation failed for resource batch due API response parsing errors.")
+            skipped = True
+            return
+          elif isinstance(result, Exception):
+            raise result
+          merge_entity_accesses(processed_accesses, result, gauges)
+
+        if not ServerState().options.get("disable_access_cache"):
+          await self.call("dynamodb", cache.add_batch, processed_accesses)
+
+      await snk.put_many([{**cached_accesses, **processed_accesses}, *checkpoints])
+
+    await self.process_queue(
+      src,
+      simulate,
+      f"{auth.account_id}.access_simulation",
+      completion_callback=snk.set_completed,
+      batch_size=IAM_RSRC_ACCESS_SIML_BATCH_SIZE,
+      fill_batches=True,
+    )
+
+  async def registration(self, account_id: str, registrar: Registrar, src: AsyncCompletionQueue):
+    async def register(batches: List[Any]):
+      for datasets in batches:
+        await self.call("dal", registrar.register_datasets, datasets)
+
+    async def flush():
+      await self.call("dynamodb", registrar.flush)
+
+    await self.process_queue(src, register, f"{account_id}.registration", completion_callback=flush)
+
+  def run(self, pipeline: Callable[["AsyncPipelineRunner", str], Awaitable], accounts: List[str]):
+    """
+    Run `pipeline` for every account on a new event loop and wait for all pipelines to complete.
+    """
+
+    async def run_pipelines():
+      await asyncio.gather(*[pipeline(self, account_id) for account_id in accounts])
+
+    loop = asyncio.new_event_loop()
+    completed = False
+    try:
+      loop.run_until_complete(asyncio.wait_for(run_pipelines(), FUTURE_TIMEOUTS["main"]))
+      completed = True
+    finally:
+      if not completed:
+        # puts of `ThreadSafeQueueSink`s are tasks of the loop, executor threads blocked on a full
+        # queue are only released once their task is cancelled.
+        tasks = asyncio.all_tasks(loop)
+        for task in tasks:
+          task.cancel()
+        if tasks:
+          loop.run_until_complete(asyncio.wait(tasks, timeout=ASYNC_CANCEL_TIMEOUT))
+      loop.close()
+      for executor in self.executors.values():
+        if completed:
+          executor.shutdown()
+        else:
+          executor.shutdown(wait=False, cancel_futures=True)
@@ -5,7 +5,28 @@ SVC_ROLE = {
   "staging": "aws-dal-reg-svc-staging",
 }
 
+ACCOUNT_METADATA_CACHE_TTL = 21600  # seconds
+
+# max concurrent blocking calls per AWS/DAL API family when running
+# the account pipelines with `--async-pipeline`. limits are shared by
+# all accounts. a `scan` call runs a whole scanner, which makes its own
+# requests on up to `SCANNER_REGION_CONCURRENCY` region threads and
+# `SCANNER_ENRICHMENT_CONCURRENCY` enrichment threads, so the `scan`
+# limit bounds the number of scanners rather than scan requests.
+ASYNC_API_CONCURRENCY = {
+  "dal": 4,
+  "dynamodb": 32,
+  "iam": 24,
+  "organizations": 4,
+  "scan": 16,
+}
+# max wait for cancelled pipeline coroutines when the async pipelines time out
+ASYNC_CANCEL_TIMEOUT = 60  # seconds
+
 AWS_CLIENT_CONNECT_TIMEOUT = 10  # seconds
+# cached clients are shared by all threads, the pool size bounds the
+# concurrent requests made by a client.
+AWS_CLIENT_MAX_POOL_CONNECTIONS = 64
 AWS_CLIENT_READ_TIMEOUT = 120
 AWS_CLIENT_RETRY_CONF = {
   "max_attempts": 3,
@@ -28,8 +49,12 @@ AWS_EXCLUDED_REGIONS = [
 AWS_ORGANIZATION_ACCOUNT_ID = "171959851929"
 AWS_ORGANIZATION_ACCOUNT_KITE_TAG = "kite_project"
 
+CREDENTIAL_BROKER_CONCURRENCY = 16  # concurrent AssumeRole requests
+CREDENTIAL_REFRESH_INTVL = 60  # seconds
+
 DAL_CLIENT_NAME = "dal_client"
-DAL_RATE_LIMIT = 1  # seconds
+DAL_CLIENT_POOL_SIZE = 8  # connected DAL clients shared by all accounts
+DAL_REGISTRATION_CONCURRENCY = 8  # concurrent dataset registrations
 DAL_SERVICE_NAME = {
   "prod": "/cluster/local/dal/prod/dal",
   "staging": "/cluster/local/dal-staging/staging/dal",
@@ -37,12 +62,22 @@ DAL_SERVICE_NAME = {
 
 DEFAULT_OWNER_TEAM = "UNKNOWN"
 
+# local files caching AWS metadata between runs, see `--disk-cache-dir`
+DISK_CACHE_DIR = "/tmp/aws-dal-reg-svc"
+
 DYNAMO_ACCESS_CACHE_TABLE_NAME = "twttr-pdp-access-cache"
 DYNAMO_ACCESS_CACHE_ACCOUNT_TTL = {
   "084876669870": 604800,  # seconds
   "673964658973": 604800,
 }
+DYNAMO_BATCH_GET_MAX_KEYS = 100  # BatchGetItem request limit
+DYNAMO_BATCH_RETRIES = 5  # unprocessed key retries
+DYNAMO_BATCH_RETRY_DELAY = 0.1  # seconds, doubled every retry
 DYNAMO_DEFAULT_ACCESS_CACHE_TTL = 86400  # seconds
+DYNAMO_INVENTORY_TABLE_NAME = "twttr-pdp-inventory"
+DYNAMO_INVENTORY_TABLE_TTL = 604800  # seconds, drops records of deleted resources
+DYNAMO_METASTORE_CACHE_SIZE = 200000  # records
+DYNAMO_METASTORE_CACHE_TTL = 3600  # seconds
 DYNAMO_METASTORE_TABLE_NAME = "twttr-pdp-datasets"
 DYNAMO_STAGES_TABLE_ACCOUNT_ID = "482194395845"
 DYNAMO_STAGES_TABLE_NAME = "twttr-pdp-reg-stages"
@@ -59,25 +94,93 @@ FUTURE_TIMEOUTS = {
 GLOBAL_API_REGION = "us-west-2"  # use when working with global APIs like IAM or orgs.
 
 IAM_ACCESS_SIML_RATE_LIMIT = 15  # seconds
-IAM_API_DELAYED_RETRIES = 5
-IAM_API_RETRY_DELAY_INTERVAL = 120  # seconds
+IAM_API_DELAYED_RETRIES = 5  # retries scheduled by the `RetryScheduler`
+IAM_GRAPH_CACHE_TTL = 604800  # seconds, cached managed policies are reused until expiry
 IAM_MAX_API_FUTURES = 6  # per-iam entity/access scan, per-account
 
+# ratio of local IAM policy evaluations that are verified using the
+# SimulatePrincipalPolicy API when the policy evaluator is enabled.
+IAM_POLICY_EVAL_SPOT_CHECK_RATIO = 0.02
+
 # The SimulatePrincipalPolicy API method only supports
 # inputs less than 1000 vs the length of the product of ActionNames and
-# ResourceArns. These API calls are executed serially by resource to
-# limit the number of actions input. This value will need to be reduced if
-# a resource is added to RESOURCE_ACCESS_POLICY_ACTIONS where the sum of
-# the defined actions is larger than 10.
+# ResourceArns. Resources of each service within a batch are split into
+# sub-batches sized by `IamSimulationBatchSizer`.
 IAM_RSRC_ACCESS_SIML_BATCH_SIZE = 50
 
+# SimulatePrincipalPolicy sub-batches are the largest size where the product
+# of actions and resources fits one `IAM_SIML_MAX_ITEMS` page.
+IAM_SIML_HISTOGRAM_BOUNDS = {
+  "evaluations": [50, 100, 200, 500, 1000],
+  "pages": [1, 2, 3, 5, 10],
+}
+IAM_SIML_MAX_ITEMS = 1000  # SimulatePrincipalPolicy MaxItems limit
+
 INIT_TS_FIELD_PFX = "init_"
 
+# max age of an inventory snapshot record before the resource is described
+# again even if its listing entry is unchanged. listing entries of most
+# services only include the resource name, so this bounds the staleness
+# of tags, retention and encryption properties.
+INVENTORY_REFRESH_MAX_AGE = 86400  # seconds
+
 KITE_PROJECT_NAME_PATTERN = r"^([a-z0-9_-]+)$"
 
+ORGANIZATIONS_TAG_CONCURRENCY = 8  # concurrent account tag requests
+
 PDP_ROLE_ARN_PATTERN = "arn:aws:iam::{}:role/iam-role-pdp-dal-reg-svc-stackset"
 
+PROGRESS_WHEEL_RESOLUTION = 10  # seconds, granularity of stage progress deadlines
+PROGRESS_WHEEL_SLOTS = 512  # deadlines beyond the wheel span wait for later rotations
+
+# token bucket rates (requests/second) shared by all threads. `account`
+# buckets apply per AWS account, `global` buckets to the whole process.
+# `adaptive` rates are halved on throttling errors and recover additively
+# on successful requests up to RATE_LIMIT_MAX_MULTIPLIER times the
+# configured rate.
+RATE_LIMITS = {
+  "dal": {
+    "global": 4.0,
+    "adaptive": False,
+  },
+  "iam_simulation": {
+    "account": IAM_MAX_API_FUTURES / IAM_ACCESS_SIML_RATE_LIMIT,
+    "global": 10.0,
+    "adaptive": True,
+  },
+  "organizations": {
+    "global": 5.0,
+    "adaptive": True,
+  },
+  "sts": {
+    "global": 10.0,
+    "adaptive": True,
+  },
+}
+RATE_LIMIT_DECREASE = 0.5  # multiplier applied on throttling errors
+RATE_LIMIT_INCREASE = 0.02  # ratio of the configured rate added per request
+RATE_LIMIT_MAX_MULTIPLIER = 4
+RATE_LIMIT_MIN_MULTIPLIER = 0.125
+
+S3_API_LATENCY_BOUNDS = [10, 25, 50, 100, 250, 500, 1000, 2500, 5000]  # milliseconds
+S3_BUCKET_REGION_CACHE_TTL = 604800  # seconds
+
+# max concurrent region scans per scanner/observer service and max
+# concurrent describe, tag and retention requests per scanner shared by
+# all of its regions. S3 buckets are listed globally.
+SCANNER_ENRICHMENT_CONCURRENCY = {
+  "default": 8,
+  "s3": 16,
+}
+SCANNER_REGION_CONCURRENCY = {
+  "default": 8,
+}
+
 SERVER_MONITOR_INTVL = 120  # seconds
+SHARD_RING_VNODES = 64  # virtual nodes per shard on the account hash ring
+STAGE_CHECKPOINT_TTL = 21600  # seconds, interrupted runs older than the ttl are not resumed
+STAGE_QUEUE_BATCH_SIZE = 100  # max values dequeued per `get_many` call
+STAGE_QUEUE_CAPACITY = 1000  # max values buffered between pipeline stages
 STAGE_PROGRESS_TIMEOUTS = {
   "default": 1200,
   "registration": 7200,
@@ -89,10 +192,26 @@ SUPPORTED_IAM_ENTITIES = [
   "user",
 ]
 
+TAGGING_API_PAGE_SIZE = 100  # GetResources ResourcesPerPage limit
+
 TSS_PATH = "/".join(["/var/lib/tss/keys", SVC_DOMAIN])
 
+# jittered exponential backoff of retries scheduled by the `RetryScheduler`
+RETRY_BASE_DELAY = 15  # seconds
+RETRY_MAX_DELAY = 120  # seconds
+
 REGISTRATION_EXCLUSION_MAX_INTERVAL = 86400  # 24 hours
 REGISTRATION_EXCLUSION_MIN_INTERVAL = 43200  # 12 hours
+# metastore record field mapping the ARNs of datasets sharing the record to the fingerprint of
+# their last registration, see `Dataset.fingerprint`
+REGISTRATION_FINGERPRINTS_FIELD = "registration_fingerprints"
+REGISTRATION_POST_CONCURRENCY = 4  # concurrent metastore and Kite writes after registration
+
+# bit positions used to encode access levels, new levels must be appended.
+RESOURCE_ACCESS_LEVELS = [
+  "read",
+  "write",
+]
 
 RESOURCE_ACCESS_POLICY_ACTIONS = {
   "dax": {
@@ -0,0 +1,167 @@
+import copy
+from threading import Lock
+from time import monotonic
+from typing import Dict, List
+
+from twitter.common.metrics import AtomicGauge, LambdaGauge
+from twitter.common.metrics.metrics import Metrics
+
+from server_config import PROGRESS_WHEEL_RESOLUTION, PROGRESS_WHEEL_SLOTS
+
+
+class TimerWheel:
+  """
+  Hashed timer wheel of `slots` slots of `resolution` seconds. Keys scheduled beyond the span of
+  the wheel stay in their slot until the cursor reaches it in the rotation of their deadline.
+  Every key is scheduled at most once, scheduling a key again replaces its deadline.
+  """
+
+  def __init__(self, resolution: float, slots: int, now: float = None):
+    self.resolution = resolution
+    self.scheduled = {}
+    self.slots = [{} for _ in range(slots)]
+    self.tick = self.ticks(monotonic() if now is None else now)
+
+  def cancel(self, key: str):
+    if key in self.scheduled:
+      del self.slots[self.scheduled.pop(key)][key]
+
+  def expire(self, now: float) -> List[str]:
+    """
+    Advance the cursor to `now` and return the keys whose deadline has passed. Only the slots
+    passed since the last call are visited.
+    """
+    expired = []
+    target = self.ticks(now)
+    for tick in range(self.tick, self.tick + min(target - self.tick + 1, len(self.slots))):
+      slot = self.slots[tick % len(self.slots)]
+      for key, deadline in list(slot.items()):
+        if deadline <= now:
+          expired.append(key)
+          del slot[key]
+          del self.scheduled[key]
+    self.tick = max(self.tick, target)
+    return expired
+
+  def schedule(self, key: str, deadline: float):
+    # deadlines already passed are expired by the next call to `expire`
+    self.cancel(key)
+    index = max(self.ticks(deadline), self.tick) % len(self.slots)
+    self.slots[index][key] = deadline
+    self.scheduled[key] = index
+
+  def ticks(self, t: float) -> int:
+    return int(t // self.resolution)
+
+
+class StageProgress:
+  """
+  Progress of an active pipeline stage. `count` is a monotonic counter advanced by the stage,
+  `started` and `updated` are `time.monotonic` timestamps.
+  """
+
+  def __init__(self, stage: str, timeout: int, now: float):
+    self.count = 0
+    self.stage = stage
+    self.started = now
+    self.timeout = timeout
+    self.updated = now
+
+  def __repr__(self) -> str:
+    return f"StageProgress(stage={self.stage}, count={self.count}, idle={self.idle():.0f}s)"
+
+  @property
+  def deadline(self) -> float:
+    return self.updated + self.timeout
+
+  def idle(self, now: float = None) -> float:
+    return (monotonic() if now is None else now) - self.updated
+
+
+class ProgressSnapshot:
+  """
+  Point in time copy of the progress of the active stages and the number of completed stages.
+  """
+
+  def __init__(self, stages: List[StageProgress], completed: int):
+    self.completed = completed
+    self.stages = stages
+
+  def __str__(self) -> str:
+    return "{}=(active_stages={} completed_stages={} - {})".format(
+      self.__class__.__name__, len(self.stages), self.completed, self.stages
+    )
+
+  def counters(self) -> Dict[str, int]:
+    return {"active_stages": len(self.stages), "completed_stages": self.completed}
+
+
+class ProgressTracker:
+  """
+  Process-wide progress of the pipeline stages. Stages advance their counter as they process
+  values and every advance pushes the stage deadline back by its timeout. Deadlines are checked
+  with a timer wheel so finding stalled stages only visits the stages whose deadline expired.
+  """
+
+  _INSTANCE = None
+
+  def __new__(cls):
+    if not cls._INSTANCE:
+      cls._INSTANCE = object.__new__(cls)
+      cls._INSTANCE.completed = 0
+      cls._INSTANCE.lock = Lock()
+      cls._INSTANCE.stages = {}
+      cls._INSTANCE.wheel = TimerWheel(PROGRESS_WHEEL_RESOLUTION, PROGRESS_WHEEL_SLOTS)
+      cls._INSTANCE._stalled = AtomicGauge("progress_stalled_stages")
+
+    return cls._INSTANCE
+
+  def advance(self, stage: str, count: int = 1):
+    with self.lock:
+      progress = self.stages.get(stage)
+      if progress:
+        progress.count += count
+        progress.updated = monotonic()
+
+  def complete(self, stage: str):
+    with self.lock:
+      # stages without values are completed without being started
+      self.completed += 1
+      self.stages.pop(stage, None)
+      self.wheel.cancel(stage)
+
+  def register_metrics(cls, metrics: Metrics):
+    metrics.register(LambdaGauge("progress_active_stages", lambda: len(cls._INSTANCE.stages)))
+    metrics.register(LambdaGauge("progress_completed_stages", lambda: cls._INSTANCE.completed))
+    metrics.register(cls._INSTANCE._stalled)
+
+  def snapshot(self) -> ProgressSnapshot:
+    with self.lock:
+      stages = [copy.copy(progress) for progress in self.stages.values()]
+      return ProgressSnapshot(sorted(stages, key=lambda p: p.stage), self.completed)
+
+  def stalled(self, now: float = None) -> List[StageProgress]:
+    """
+    Return the stages that have not advanced within their timeout. Stalled stages are
+    returned again once they stay stalled for another timeout.
+    """
+    now = monotonic() if now is None else now
+    stalled = []
+    with self.lock:
+      for stage in self.wheel.expire(now):
+        progress = self.stages[stage]
+        # deadlines are moved lazily, stages that advanced are scheduled again
+        if progress.deadline > now:
+          self.wheel.schedule(stage, progress.deadline)
+          continue
+
+        self._stalled.increment()
+        stalled.append(copy.copy(progress))
+        self.wheel.schedule(stage, now + progress.timeout)
+    return stalled
+
+  def start(self, stage: str, timeout: int):
+    with self.lock:
+      progress = StageProgress(stage, timeout, monotonic())
+      self.stages[stage] = progress
+      self.wheel.schedule(stage, progress.deadline)
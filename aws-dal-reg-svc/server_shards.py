@@ -0,0 +1,107 @@
+from bisect import bisect
+import hashlib
+import multiprocessing
+from multiprocessing.connection import Connection, wait
+from time import monotonic
+from typing import Callable, List, Tuple
+
+from twitter.common import log
+
+from server_config import SERVER_MONITOR_INTVL, SHARD_RING_VNODES
+
+
+def ring_hash(key: str) -> int:
+  # `hash` is salted per process, every shard must place keys at the same ring position
+  return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+
+
+class HashRing:
+  """
+  Consistent hash ring of `count` shards with `vnodes` virtual nodes per shard. Changing the
+  number of shards only moves the keys of the added or removed shards.
+  """
+
+  def __init__(self, count: int, vnodes: int = SHARD_RING_VNODES):
+    points = sorted((ring_hash(f"shard-{s}-{v}"), s) for s in range(count) for v in range(vnodes))
+    self.hashes = [h for h, _ in points]
+    self.shards = [s for _, s in points]
+
+  def shard(self, key: str) -> int:
+    return self.shards[bisect(self.hashes, ring_hash(key)) % len(self.shards)]
+
+
+def shard_accounts(accounts: List[str], index: int, count: int) -> List[str]:
+  if count <= 1:
+    return accounts
+
+  ring = HashRing(count)
+  return [account_id for account_id in accounts if ring.shard(account_id) == index]
+
+
+def worker_shards(index: int, count: int, workers: int) -> Tuple[List[int], int]:
+  """
+  Return the shards run by the `workers` local processes of host shard `index` of `count`, and
+  the total number of shards. Every host must run the same number of workers.
+  """
+  return [index * workers + w for w in range(workers)], count * workers
+
+
+class ShardSupervisor:
+  """
+  Forks one worker process per shard and waits for every worker to exit. Workers send their
+  progress as a map of counters through a pipe, the supervisor logs the totals of all shards.
+  """
+
+  def __init__(self, shards: List[int], run: Callable[[int, Connection], None]):
+    self.context = multiprocessing.get_context("fork")
+    self.progress = {}
+    self.run = run
+    self.shards = shards
+    self.workers = {}
+
+  def start(self):
+    # workers are forked before the supervisor starts any thread
+    for shard in self.shards:
+      recv, send = self.context.Pipe(duplex=False)
+      process = self.context.Process(target=self.run, args=(shard, send), name=f"shard-{shard}")
+      process.start()
+      send.close()
+      self.workers[shard] = (process, recv)
+      log.info(f"started shard worker: shard={shard} pid={process.pid}")
+
+  def summary(self, running: int) -> str:
+    totals = {}
+    for progress in self.progress.values():
+      for name, value in progress.items():
+        totals[name] = totals.get(name, 0) + value
+
+    counters = " ".join(f"{name}={value}" for name, value in sorted(totals.items()))
+    return f"shard progress: workers={running}/{len(self.workers)} {counters}"
+
+  def wait(self) -> int:
+    """
+    Wait for every worker to exit and return the first non-zero worker exit code.
+    """
+    running = {recv: shard for shard, (_, recv) in self.workers.items()}
+    logged_at = monotonic()
+    while running:
+      exited = False
+      for conn in wait(list(running.keys()), timeout=SERVER_MONITOR_INTVL):
+        try:
+          self.progress[running[conn]] = conn.recv()
+        except EOFError:
+          # the pipe is closed when its worker exits
+          del running[conn]
+          exited = True
+
+      if exited or monotonic() - logged_at >= SERVER_MONITOR_INTVL:
+        log.info(self.summary(len(running)))
+        logged_at = monotonic()
+
+    exit_code = 0
+    for shard, (process, _) in sorted(self.workers.items()):
+      process.join()
+      log.info(f"shard worker exited: shard={shard} exitcode={process.exitcode}")
+      if process.exitcode and not exit_code:
+        exit_code = process.exitcode
+    return exit_code
@@ -1,10 +1,11 @@
 import os
 from time import time
-from typing import Any, Dict, List
+from typing import Any, Dict
 
 from twitter.common import log
 
 from server_config import STAGE_PROGRESS_TIMEOUTS
+from server_progress import ProgressTracker
 
 
 def stage_progress_timeout(stage: str = None) -> int:
@@ -23,7 +24,6 @@ class ServerState:
     if not cls._INSTANCE:
       cls._INSTANCE = object.__new__(cls)
       cls._INSTANCE.meta = {}
-      cls._INSTANCE.observed_stats = {}
       cls._INSTANCE.options = {}
       cls._INSTANCE.stages = set()
       cls._INSTANCE.stage_store = None
@@ -54,16 +54,22 @@ class ServerState:
   def set_stage_queue(cls, q: Any):
     cls._INSTANCE.stage_queue = q
 
+  @classmethod
+  def progress(cls) -> Dict[str, int]:
+    return ProgressTracker().snapshot().counters()
+
   @classmethod
   def start_stage(cls, stage: str):
     cls._INSTANCE.stages.add(stage)
     cls._INSTANCE.meta[f"stage_{stage}_start"] = time()
+    ProgressTracker().start(stage, stage_progress_timeout(stage))
     log.info(f"stage started: {stage}")
 
   @classmethod
   def complete_stage(cls, stage: str):
     if stage in cls._INSTANCE.stages:
       cls._INSTANCE.stages.remove(stage)
+    ProgressTracker().complete(stage)
     if cls._INSTANCE.stage_store:
       cls._INSTANCE.stage_store.put(stage)
     if cls._INSTANCE.stage_queue:
@@ -72,32 +78,11 @@ class ServerState:
     log.info(f"stage completed: {stage}")
 
   @classmethod
-  def monitor(cls, accounts: List[int], stats: Dict[str, int]):
+  def monitor(cls):
     def _exit_server(stage: str):
       log.fatal(f"exiting due to stage progress timeout - stage={stage}")
       os._exit(os.EX_TEMPFAIL)
 
-    def _process(stage: str, metrics: List[str], obsv_stats: Dict[str, int], stats: Dict[str, int]):
-      timeout_statuses = []
-      for metric in metrics:
-        if metric in obsv_stats.keys():
-          obsv_time, val = obsv_stats[metric]
-          if val == stats.get(metric):
-            if (time() - obsv_time) > stage_progress_timeout(stage):
-              log.warn(
-                "stage progress metric timeout observed - {} - {} - {} = {}".format(
-                  stage, metric, obsv_time, val
-                )
-              )
-              timeout_statuses.append(True)
-              continue
-        timeout_statuses.append(False)
-
-      if all(timeout_statuses):
-        _exit_server(stage)
-      if any(timeout_statuses):
-        log.info("stage progress timeout suppressed due to partial progress - {}".format(stage))
-
     # monitor overall progress
     if len(cls._INSTANCE.stages) == 0:
       if "zero_stages_observed" in cls._INSTANCE.meta.keys():
@@ -109,36 +94,7 @@ class ServerState:
       # remove zero_stages_observed value if present
       cls._INSTANCE.meta.pop("zero_stages_observed", None)
 
-    # monitor stage progress
-    for account in accounts:
-      for stage in cls._INSTANCE.stages:
-        if stage == f"{account}.scan":
-          metrics = [
-            f"{account}.dax_scanner.observed_clusters",
-            f"{account}.dynamodb_scanner.observed_tables",
-            f"{account}.kinesis_scanner.observed_streams",
-            f"{account}.s3_scanner.observed_buckets",
-            f"{account}.sqs_scanner.observed_queues",
-          ]
-        elif stage == f"{account}.filter":
-          metrics = [f"{account}.resource_filter.emitted"]
-        elif stage == f"{account}.access_simulation":
-          metrics = [f"{account}.access_simulation_api_calls"]
-        elif stage == f"{account}.registration":
-          metrics = [
-            f"{account}.registrar.datasets_registered",
-            f"{account}.registrar.datasets_registered_late",
-            f"{account}.registrar.datasets_registered_kite",
-          ]
-        else:
-          continue
-
-        _process(stage, metrics, cls._INSTANCE.observed_stats, stats)
-        for metric in metrics:
-          val = stats.get(metric)
-          if val or val == 0:
-            if metric in cls._INSTANCE.observed_stats.keys():
-              _, obsv_val = cls._INSTANCE.observed_stats[metric]
-              if obsv_val == val:
-                continue  # only update obsv time if val changes
-            cls._INSTANCE.observed_stats[metric] = [time(), val]
+    # monitor stage progress, only stages past their progress deadline are visited
+    for progress in ProgressTracker().stalled():
+      log.warn(f"stage progress timeout observed - {progress}")
+      _exit_server(progress.stage)
@@ -1,7 +1,7 @@
 import boto3
 from botocore.stub import Stubber
 import pytest
-from server_config import GLOBAL_API_REGION
+from server_config import DYNAMO_SVC_TABLE_REGION, GLOBAL_API_REGION
 
 
 class MockAuthenticator:
@@ -19,6 +19,39 @@ class MockAuthenticator:
     self.stubber.activate()
 
 
+class MockIamAuthenticator(MockAuthenticator):
+  account_id = "123456789012"
+
+  def __init__(self):
+    super().__init__("iam", GLOBAL_API_REGION)
+    self.resource = boto3.resource("dynamodb", region_name=DYNAMO_SVC_TABLE_REGION)
+
+  def new_resource(self, service: str, region: str):
+    return self.resource
+
+
+class MockGauge:
+  def __init__(self):
+    self.value = 0
+
+  def add(self, value: int):
+    self.value += value
+
+  def increment(self):
+    self.add(1)
+
+
+@pytest.fixture
+def mock_gauge():
+  # factory, tests usually need several gauges
+  return MockGauge
+
+
+@pytest.fixture
+def mock_iam_auth():
+  return MockIamAuthenticator()
+
+
 @pytest.fixture
 def mock_org_auth():
   return MockAuthenticator("organizations", GLOBAL_API_REGION)
@@ -1,4 +1,6 @@
-from aws_arn import Arn, S3Arn
+from aws_arn import Arn, S3Arn, sqs_queue_arn
+from errors import AwsInvalidArn
+import pytest
 
 
 def test_arn():
@@ -70,3 +72,22 @@ def test_dax_arn():
   assert arn.resource == "DAXCluster01"
   assert arn.dal_name() == "aws-123456789012-us-west-2-dax-cache-DAXCluster01"
   assert arn.kite_name() == "123456789012.us-west-2-DAXCluster01"
+
+
+def test_sqs_queue_arn():
+  arn = sqs_queue_arn("https://sqs.us-west-2.amazonaws.com/673964658973/events-dlq")
+  assert arn.arn == "arn:aws:sqs:us-west-2:673964658973:events-dlq"
+  assert arn.resource == "events-dlq"
+  assert (
+    sqs_queue_arn("https://eu-west-1.queue.amazonaws.com/673964658973/q").arn
+    == "arn:aws:sqs:eu-west-1:673964658973:q"
+  )
+  assert (
+    sqs_queue_arn("https://queue.amazonaws.com/673964658973/q.fifo").arn
+    == "arn:aws:sqs:us-east-1:673964658973:q.fifo"
+  )
+  assert (
+    sqs_queue_arn("https://sqs.cn-north-1.amazonaws.com.cn/673964658973/q").partition == "aws-cn"
+  )
+  with pytest.raises(AwsInvalidArn):
+    sqs_queue_arn("https://sqs.us-west-2.amazonaws.com/673964658973")
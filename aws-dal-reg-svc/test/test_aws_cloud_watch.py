@@ -1,4 +1,4 @@
-from aws_cloud_watch import parse_metric
+from aws_cloud_watch import CloudWatchReporter, parse_metric
 
 
 def test_parse_metric():
@@ -9,3 +9,29 @@ def test_parse_metric():
   account_id, name = parse_metric('857487374138.users_observed')
   assert account_id == '857487374138'
   assert name == 'users_observed'
+
+
+class MockClient:
+  def __init__(self):
+    self.submitted = []
+
+  def put_metric_data(self, Namespace: str, MetricData: list):
+    self.submitted.append((MetricData[0]['MetricName'], MetricData[0]['Value']))
+
+
+class MockCloudWatchAuthenticator:
+  def __init__(self):
+    self.client = MockClient()
+
+  def new_client(self, service: str, region: str):
+    return self.client
+
+
+def test_cloud_watch_reporter_process():
+  auth = MockCloudWatchAuthenticator()
+  reporter = CloudWatchReporter(auth, 'test')
+  reporter.process({'1.a': 1, '1.b': 2})
+  reporter.process({'1.a': 1, '1.b': 3})
+
+  # unchanged metrics are only submitted once
+  assert auth.client.submitted == [('a', 1), ('b', 2), ('b', 3)]
@@ -0,0 +1,74 @@
+from threading import Event
+
+from aws_credential_broker import CredentialBroker
+
+
+class MockCredentials:
+  def __init__(self, refresh_needed: bool):
+    self.refreshed = False
+    self._refresh_needed = refresh_needed
+
+  def get_frozen_credentials(self):
+    self.refreshed = True
+
+  def refresh_needed(self) -> bool:
+    return self._refresh_needed
+
+
+class MockAuthenticator:
+  def __init__(self, account_id: str, refresh_needed: bool = False):
+    self.account_id = account_id
+    self.session_creds = MockCredentials(refresh_needed)
+
+
+class MockBroker(CredentialBroker):
+  def __init__(self, accounts, denied):
+    super().__init__(accounts, 2)
+    self.denied = denied
+    self.release = Event()
+
+  def authenticate(self, account_id: str):
+    if account_id == "slow":
+      self.release.wait(5)
+    if account_id in self.denied:
+      return None
+    return MockAuthenticator(account_id)
+
+
+def test_credential_broker():
+  broker = MockBroker(["slow", "denied", "ok"], ["denied"])
+  broker.start()
+  try:
+    ready = broker.ready()
+    # slow accounts don't block accounts resolved before them
+    assert sorted([next(ready), next(ready)]) == ["denied", "ok"]
+    broker.release.set()
+    assert next(ready) == "slow"
+
+    assert broker.get("denied") is None
+    assert broker.get("ok").account_id == "ok"
+  finally:
+    broker.shutdown()
+
+
+def test_credential_broker_timeout():
+  broker = MockBroker(["slow", "ok"], [])
+  broker.start()
+  try:
+    # accounts that never resolve are skipped without failing the resolved accounts
+    assert list(broker.ready(timeout=0.5)) == ["ok"]
+    assert broker._accounts_timed_out.read() == 1
+  finally:
+    broker.release.set()
+    broker.shutdown()
+
+
+def test_credential_broker_refresh():
+  broker = CredentialBroker([])
+  expiring = MockAuthenticator("expiring", True)
+  valid = MockAuthenticator("valid", False)
+  broker.refresh(expiring)
+  broker.refresh(valid)
+  assert expiring.session_creds.refreshed
+  assert not valid.session_creds.refreshed
+  broker.shutdown()
@@ -0,0 +1,242 @@
+from datetime import datetime
+from threading import Thread
+from time import time
+
+from aws_arn import Arn
+from aws_iam import (
+  access_levels_mask,
+  actions_access_levels,
+  AwsClientCache,
+  entity_batched_resource_accesses,
+  IamAccessCache,
+  IamAccessCacheMetrics,
+  IamEntity,
+  IamEntityPrefilter,
+  IamObservedAccess,
+  IamPolicyEvaluatorStore,
+  IamSimulationBatchSizer,
+  mask_access_levels,
+  SERVICE_ACCESS_ACTIONS,
+  ServiceAccessActions,
+)
+from aws_resource import Resource
+from boto3.session import Session
+from botocore.session import get_session
+from botocore.stub import Stubber
+from server_config import DYNAMO_ACCESS_CACHE_TABLE_NAME
+from server_state import ServerState
+
+
+def test_service_access_actions():
+  actions = ServiceAccessActions(
+    {
+      "read": ["s3:GetObject", "s3:ListBucket"],
+      "write": ["s3:PutObject", "s3:ListBucket"],
+    }
+  )
+  assert actions.eval_actions == ("s3:GetObject", "s3:ListBucket", "s3:PutObject")
+  assert actions.action_levels["s3:ListBucket"] == frozenset(["read", "write"])
+  assert actions.mask(["s3:GetObject"]) == access_levels_mask({"read"})
+  assert actions.mask(["s3:Unknown"]) == 0
+
+
+def test_actions_access_levels():
+  assert actions_access_levels("dynamodb", ["dynamodb:GetItem"]) == frozenset(["read"])
+  assert actions_access_levels("sqs", ["sqs:ReceiveMessage", "sqs:SendMessage"]) == frozenset(
+    ["read", "write"]
+  )
+  assert actions_access_levels("kinesis", []) == frozenset()
+  assert SERVICE_ACCESS_ACTIONS["elasticache"].eval_actions == ()
+
+
+def test_access_levels_mask():
+  for levels in (set(), {"read"}, {"write"}, {"read", "write"}):
+    assert mask_access_levels(access_levels_mask(levels)) == frozenset(levels)
+
+
+def test_aws_client_cache():
+  cache = AwsClientCache()
+  created = []
+
+  def factory():
+    created.append(object())
+    return created[-1]
+
+  key = ("key", "role", "client", "iam", "us-west-2", None, None)
+  client = cache.client(key, factory)
+  assert cache.client(key, factory) is client
+  assert len(created) == 1
+
+  # resources are cached per thread
+  resource = cache.resource(key, factory)
+  assert cache.resource(key, factory) is resource
+  thread_resources = []
+  thread = Thread(target=lambda: thread_resources.append(cache.resource(key, factory)))
+  thread.start()
+  thread.join()
+  assert thread_resources[0] is not resource
+  assert len(created) == 3
+
+  # the shared loader's search paths are not extended by every boto3 session
+  loader_session = get_session()
+  loader_session.register_component("data_loader", cache.loader)
+  Session(botocore_session=loader_session)
+  Session(botocore_session=loader_session)
+  assert len(cache.loader.search_paths) == len(set(cache.loader.search_paths))
+
+
+def test_entity_prefilter(mock_gauge, mock_iam_auth):
+  ServerState().options["disable_access_simulation"] = True
+  auth = mock_iam_auth
+  entity = IamEntity(Arn("arn:aws:iam::123456789012:role/reader"))
+  svcs = ["dax", "dynamodb", "elasticache", "kinesis", "s3", "sqs"]
+  response = {
+    "PoliciesGrantingServiceAccess": [
+      {"ServiceNamespace": "dynamodb", "Policies": [{"PolicyName": "p", "PolicyType": "INLINE"}]},
+      {"ServiceNamespace": "s3", "Policies": []},
+    ],
+    "IsTruncated": False,
+  }
+  # services without simulated actions are not requested
+  auth.stubber.add_response(
+    "list_policies_granting_service_access",
+    response,
+    {"Arn": entity.arn.arn, "ServiceNamespaces": ["dax", "dynamodb", "kinesis", "s3", "sqs"]},
+  )
+  auth.stubber.activate()
+
+  prefilter = IamEntityPrefilter(svcs)
+  table_arn = Arn("arn:aws:dynamodb:us-east-1:123456789012:table/t")
+  resources = [
+    Resource("t", table_arn, datetime.min, "ACTIVE", {}),
+    Resource("b", Arn("arn:aws:s3:::b"), datetime.min, "ACTIVE", {}),
+  ]
+  gauges = {
+    "access_simulation": mock_gauge(),
+    "access_simulation_errors": mock_gauge(),
+    "access_simulation_evaluations": mock_gauge(),
+    "resource_access_pruned": mock_gauge(),
+  }
+  accesses = entity_batched_resource_accesses(auth, entity, resources, gauges, None, prefilter)
+  assert list(accesses.keys()) == [resources[0]]
+  assert gauges["resource_access_pruned"].value == 1
+
+  # services are resolved once per entity
+  assert prefilter.services(auth.client, entity.arn) == frozenset(["dynamodb"])
+  assert prefilter._candidates["dynamodb"].read() == 1
+  del ServerState().options["disable_access_simulation"]
+
+
+class MockIamGraph:
+  def __init__(self, entities):
+    self.entities = entities
+
+  def boundary(self, entity_arn: str):
+    return self.entities[entity_arn].get("boundary") if entity_arn in self.entities else None
+
+  def documents(self, entity_arn: str):
+    return self.entities[entity_arn]["documents"] if entity_arn in self.entities else None
+
+
+def test_policy_evaluator_store():
+  document = {
+    "Statement": [{"Effect": "Allow", "Action": "sqs:SendMessage", "Resource": "*"}],
+  }
+  graph = MockIamGraph(
+    {
+      "arn:aws:iam::123456789012:role/sender": {"documents": [document]},
+      "arn:aws:iam::123456789012:role/bounded": {
+        "boundary": "arn:aws:iam::123456789012:policy/boundary",
+        "documents": [document],
+      },
+    }
+  )
+  store = IamPolicyEvaluatorStore(["sqs"], graph)
+  queue_arn = "arn:aws:sqs:us-west-2:123456789012:q"
+  allowed = {queue_arn: ["sqs:SendMessage"]}
+
+  def evaluate(entity_arn: str):
+    return store.evaluate(Arn(entity_arn), ["sqs:SendMessage"], [queue_arn], lambda: allowed)
+
+  assert evaluate("arn:aws:iam::123456789012:role/sender") == allowed
+  assert store._evaluations.read() == 1
+  assert store._fallbacks.read() == 0
+
+  # boundaries are not evaluated locally and entities missing from the graph may have deny-only
+  # policies, both are simulated.
+  assert evaluate("arn:aws:iam::123456789012:role/bounded") == allowed
+  assert evaluate("arn:aws:iam::123456789012:role/unknown") == allowed
+  assert store._evaluations.read() == 1
+  assert store._fallbacks.read() == 2
+  assert store.evaluators["arn:aws:iam::123456789012:role/bounded"] is None
+
+
+def test_access_cache_fetch_batch(mock_iam_auth):
+  IamAccessCacheMetrics()
+  auth = mock_iam_auth
+  cache = IamAccessCache(auth)
+  accesses = [
+    IamObservedAccess("arn:aws:iam::123456789012:role/reader", "arn:aws:s3:::a", {"read"}),
+    IamObservedAccess("arn:aws:iam::210987654321:role/x", "arn:aws:s3:::a", {"read", "write"}),
+  ]
+  expire = str(int(time() + 3600))
+  items = [
+    {
+      "ID": {"S": "arn:aws:s3:::a"},
+      "accesses_z": {"B": cache.encode(accesses)},
+      "expire": {"N": expire},
+    },
+    {
+      "ID": {"S": "arn:aws:s3:::b"},
+      "accesses": {
+        "L": [
+          {
+            "M": {
+              "entity_arn": {"S": "arn:aws:iam::123456789012:user/legacy"},
+              "resource_arn": {"S": "arn:aws:s3:::b"},
+              "levels": {"L": [{"S": "write"}]},
+            }
+          }
+        ]
+      },
+      "expire": {"N": expire},
+    },
+    {"ID": {"S": "arn:aws:s3:::c"}, "accesses_z": {"B": cache.encode([])}, "expire": {"N": "1"}},
+  ]
+  resources = [
+    Resource(name, Arn(f"arn:aws:s3:::{name}"), datetime.min, "ACTIVE", {}) for name in "abcd"
+  ]
+  stubber = Stubber(auth.resource.meta.client)
+  stubber.add_response(
+    "batch_get_item",
+    {"Responses": {DYNAMO_ACCESS_CACHE_TABLE_NAME: items}},
+    {
+      "RequestItems": {
+        DYNAMO_ACCESS_CACHE_TABLE_NAME: {"Keys": [{"ID": r.arn.arn} for r in resources]}
+      }
+    },
+  )
+  stubber.activate()
+
+  # expired and missing records are omitted, legacy records are decoded
+  fetched = cache.fetch_batch(resources)
+  assert {r.name: [(a.entity_arn, a.levels) for a in fetched[r]] for r in fetched.keys()} == {
+    "a": [
+      ("arn:aws:iam::123456789012:role/reader", frozenset(["read"])),
+      ("arn:aws:iam::210987654321:role/x", frozenset(["read", "write"])),
+    ],
+    "b": [("arn:aws:iam::123456789012:user/legacy", frozenset(["write"]))],
+  }
+  assert all(a.resource_arn == r.arn.arn for r in fetched.keys() for a in fetched[r])
+
+
+def test_simulation_batch_sizer():
+  sizer = IamSimulationBatchSizer()
+  # s3 simulates 10 actions, 100 resources fit a 1000 item page
+  assert sizer.size("s3") == 100
+  assert [len(b) for b in sizer.batches("s3", [str(i) for i in range(120)])] == [100, 20]
+  pages, truncated = sizer.pages.count.read(), sizer.truncated.read()
+  sizer.observe(1, 1000)
+  sizer.observe(2, 1000)
+  assert sizer.pages.count.read() == pages + 2
+  assert sizer.truncated.read() == truncated + 1
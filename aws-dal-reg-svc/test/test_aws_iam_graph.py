@@ -0,0 +1,108 @@
+import json
+
+from aws_iam_graph import IamGraph
+from aws_iam_policy import parse_policy_document
+from server_config import SUPPORTED_IAM_ENTITIES
+from server_state import ServerState
+
+
+ACCOUNT_ID = "123456789012"
+BOUNDARY_ARN = f"arn:aws:iam::{ACCOUNT_ID}:policy/boundary"
+POLICY_ARN = f"arn:aws:iam::{ACCOUNT_ID}:policy/dynamodb-read"
+
+
+def document(action: str) -> str:
+  return json.dumps(
+    {
+      "Version": "2012-10-17",
+      "Statement": [{"Effect": "Allow", "Action": action, "Resource": "*"}],
+    }
+  )
+
+
+def add_responses(auth, fetch_policy: bool):
+  details = {
+    "GroupDetailList": [
+      {
+        "GroupName": "readers",
+        "Arn": f"arn:aws:iam::{ACCOUNT_ID}:group/readers",
+        "AttachedManagedPolicies": [{"PolicyName": "dynamodb-read", "PolicyArn": POLICY_ARN}],
+      },
+    ],
+    "RoleDetailList": [
+      {
+        "RoleName": "ec2",
+        "Arn": f"arn:aws:iam::{ACCOUNT_ID}:role/ec2",
+        "PermissionsBoundary": {
+          "PermissionsBoundaryType": "Policy",
+          "PermissionsBoundaryArn": BOUNDARY_ARN,
+        },
+        "RolePolicyList": [
+          {"PolicyName": "ec2", "PolicyDocument": document("ec2:DescribeInstances")}
+        ],
+      },
+    ],
+    "UserDetailList": [
+      {
+        "UserName": "reader",
+        "Arn": f"arn:aws:iam::{ACCOUNT_ID}:user/reader",
+        "GroupList": ["readers"],
+      },
+    ],
+    "IsTruncated": False,
+  }
+  auth.stubber.add_response(
+    "get_account_authorization_details", details, {"Filter": ["Group", "Role", "User"]}
+  )
+  policies = {
+    "Policies": [{"PolicyName": "dynamodb-read", "Arn": POLICY_ARN, "DefaultVersionId": "v2"}],
+    "IsTruncated": False,
+  }
+  auth.stubber.add_response("list_policies", policies, {"OnlyAttached": True})
+  if fetch_policy:
+    auth.stubber.add_response(
+      "get_policy_version",
+      {"PolicyVersion": {"Document": document("dynamodb:GetItem"), "VersionId": "v2"}},
+      {"PolicyArn": POLICY_ARN, "VersionId": "v2"},
+    )
+
+
+def test_iam_graph(tmp_path, mock_gauge, mock_iam_auth):
+  ServerState().options["disk_cache_dir"] = str(tmp_path)
+  gauges = {entity_type: mock_gauge() for entity_type in SUPPORTED_IAM_ENTITIES}
+
+  auth = mock_iam_auth
+  add_responses(auth, True)
+  auth.stubber.activate()
+  graph = IamGraph(auth)
+  graph.load()
+
+  # users inherit the policies of their groups, the ec2 role grants no access to datasets
+  reader = graph.documents(f"arn:aws:iam::{ACCOUNT_ID}:user/reader")
+  assert [parse_policy_document(d) for d in reader] == [
+    parse_policy_document(document("dynamodb:GetItem"))
+  ]
+  entities = graph.entity_map(["dynamodb", "s3"], gauges)
+  assert {t: [e.arn.arn for e in es] for t, es in entities.items()} == {
+    "group": [f"arn:aws:iam::{ACCOUNT_ID}:group/readers"],
+    "role": [],
+    "user": [f"arn:aws:iam::{ACCOUNT_ID}:user/reader"],
+  }
+  assert gauges["role"].value == 1
+  assert graph.boundary(f"arn:aws:iam::{ACCOUNT_ID}:role/ec2") == BOUNDARY_ARN
+  assert graph.boundary(f"arn:aws:iam::{ACCOUNT_ID}:user/reader") is None
+  assert graph._entities_without_access.read() == 1
+  assert graph._policies_fetched.read() == 1
+
+  # unchanged managed policies are loaded from the disk cache
+  add_responses(auth, False)
+  graph = IamGraph(auth)
+  graph.load()
+  auth.stubber.assert_no_pending_responses()
+  assert graph._policies_fetched.read() == 0
+  assert graph._policies_reused.read() == 1
+  readers = graph.documents(f"arn:aws:iam::{ACCOUNT_ID}:group/readers")
+  assert [parse_policy_document(d) for d in readers] == [
+    parse_policy_document(document("dynamodb:GetItem"))
+  ]
+  del ServerState().options["disk_cache_dir"]
@@ -0,0 +1,80 @@
+from aws_iam_policy import (
+  compile_pattern,
+  IamPolicyEvaluator,
+  missing_context_condition,
+  UnsupportedPolicyElement,
+)
+import pytest
+
+
+def test_compile_pattern():
+  assert compile_pattern("s3:Get*", True).match("s3:getobject")
+  assert not compile_pattern("s3:Get*").match("s3:getobject")
+  assert compile_pattern("arn:aws:sqs:*:123456789012:queue-?").match(
+    "arn:aws:sqs:us-west-2:123456789012:queue-a"
+  )
+  assert not compile_pattern("arn:aws:s3:::bucket.name").match("arn:aws:s3:::bucketxname")
+
+  with pytest.raises(UnsupportedPolicyElement):
+    compile_pattern("arn:aws:s3:::${aws:username}-bucket")
+
+
+def test_missing_context_condition():
+  assert missing_context_condition("StringEqualsIfExists", "value")
+  assert missing_context_condition("Null", "true")
+  assert missing_context_condition("ForAllValues:StringEquals", ["a"])
+  assert not missing_context_condition("Null", "false")
+  assert not missing_context_condition("StringEquals", "value")
+  assert not missing_context_condition("ForAnyValue:StringEquals", ["a"])
+  assert missing_context_condition("StringNotEquals", "value")
+  assert missing_context_condition("StringNotEqualsIgnoreCase", "value")
+  assert missing_context_condition("StringNotLike", "value*")
+  assert missing_context_condition("ArnNotEquals", "arn:aws:iam::123456789012:root")
+  assert missing_context_condition("ArnNotLike", "arn:aws:iam::*:root")
+  assert missing_context_condition("NumericNotEquals", "1")
+  assert missing_context_condition("DateNotEquals", "2020-01-01T00:00:00Z")
+  assert not missing_context_condition("ForAnyValue:StringNotEquals", ["a"])
+
+
+def test_policy_evaluator_allowed_actions():
+  evaluator = IamPolicyEvaluator(
+    "arn:aws:iam::123456789012:role/test",
+    [
+      {
+        "Version": "2012-10-17",
+        "Statement": [
+          {
+            "Effect": "Allow",
+            "Action": ["dynamodb:Get*", "dynamodb:PutItem"],
+            "Resource": "arn:aws:dynamodb:*:123456789012:table/*",
+          },
+          {
+            "Effect": "Deny",
+            "Action": "dynamodb:PutItem",
+            "Resource": "arn:aws:dynamodb:us-west-2:123456789012:table/locked",
+          },
+          {
+            "Effect": "Allow",
+            "Action": "dynamodb:Scan",
+            "Resource": "*",
+            "Condition": {"StringEquals": {"aws:SourceVpc": "vpc-1111"}},
+          },
+        ],
+      },
+      '{"Statement": {"Effect": "Allow", "NotAction": "dynamodb:Delete*", "NotResource": "arn:aws:dynamodb:*:*:table/locked"}}',
+    ],
+  )
+
+  open_table = "arn:aws:dynamodb:us-west-2:123456789012:table/open"
+  locked_table = "arn:aws:dynamodb:us-west-2:123456789012:table/locked"
+  actions = ["dynamodb:GetItem", "dynamodb:PutItem", "dynamodb:Scan", "dynamodb:DeleteItem"]
+
+  assert evaluator.allowed_actions(actions, [open_table, locked_table]) == {
+    open_table: ["dynamodb:GetItem", "dynamodb:PutItem", "dynamodb:Scan"],
+    locked_table: ["dynamodb:GetItem"],
+  }
+
+
+def test_policy_evaluator_no_policies():
+  evaluator = IamPolicyEvaluator("arn:aws:iam::123456789012:user/test", [])
+  assert evaluator.allowed_actions(["sqs:SendMessage"], ["arn:aws:sqs:us-west-2:1:q"]) == {}
@@ -1,3 +1,7 @@
+from datetime import datetime, timezone
+
+from aws_arn import Arn, S3Arn
+from aws_resource import Resource
 from dataset_attribution import resource_owner
 
 
@@ -33,3 +37,29 @@ def test_resource_owner():
       ]
     })
   assert expected == actual
+
+
+def test_resource_json():
+  created = datetime(2021, 6, 11, 9, 11, 47, tzinfo=timezone.utc)
+  resource = Resource(
+    "queue",
+    Arn("arn:aws:sqs:us-west-2:123456789012:queue"),
+    created,
+    "ACTIVE",
+    {
+      "LastModified": datetime(2021, 6, 12),
+      "Retention": {"RetentionInDays": 4},
+      "Tags": [{"Key": "pdp_team", "Value": "tag"}],
+    },
+  )
+  actual = Resource.from_json(resource.to_json())
+  assert actual.name == "queue"
+  assert actual.arn.arn == resource.arn.arn
+  assert actual.creation_date == created
+  assert actual.properties == resource.properties
+
+  # S3 ARNs don't include the account and region
+  bucket = Resource("bucket", S3Arn("bucket", "123456789012", "us-east-1"), created, "ACTIVE", {})
+  actual = Resource.from_json(bucket.to_json())
+  assert actual.arn.account_id == "123456789012"
+  assert actual.arn.region == "us-east-1"
@@ -0,0 +1,88 @@
+from datetime import datetime
+
+from aws_s3 import location_region, S3ApiLatency, S3EnrichmentEngine
+import boto3
+from botocore.stub import Stubber
+from server_state import ServerState
+
+
+ACCOUNT_ID = "123456789012"
+
+
+class MockS3Authenticator:
+  account_id = ACCOUNT_ID
+
+  def __init__(self):
+    self.clients = {}
+    self.stubbers = {}
+
+  def new_client(self, service: str, region: str):
+    if region not in self.clients:
+      self.clients[region] = boto3.client(service, region_name=region)
+      self.stubbers[region] = Stubber(self.clients[region])
+      self.stubbers[region].activate()
+    return self.clients[region]
+
+  def stubber(self, region: str) -> Stubber:
+    self.new_client("s3", region)
+    return self.stubbers[region]
+
+
+def add_location(auth: MockS3Authenticator, name: str, location: str = None):
+  # buckets in us-east-1 have no location constraint
+  auth.stubber("us-west-2").add_response(
+    "get_bucket_location",
+    {"LocationConstraint": location} if location else {},
+    {"Bucket": name, "ExpectedBucketOwner": ACCOUNT_ID},
+  )
+
+
+def test_location_region():
+  assert location_region(None) == "us-east-1"
+  assert location_region("EU") == "eu-west-1"
+  assert location_region("ap-south-1") == "ap-south-1"
+
+
+def test_enrichment_engine(tmp_path):
+  ServerState().options["disk_cache_dir"] = str(tmp_path)
+  S3ApiLatency()
+  buckets = [{"Name": name, "CreationDate": datetime.min} for name in ("a", "b")]
+
+  auth = MockS3Authenticator()
+  add_location(auth, "a", "eu-west-2")
+  add_location(auth, "b")
+  engine = S3EnrichmentEngine(auth, "us-west-2", 2)
+  regions = {
+    bucket["Name"]: future.result()
+    for bucket, future in engine.enrich(buckets, lambda b: engine.region(b["Name"])[0])
+  }
+  assert regions == {"a": "eu-west-2", "b": "us-east-1"}
+  assert engine._region_cache_misses.read() == 2
+
+  # regions are cached between runs, stale regions are resolved again
+  auth = MockS3Authenticator()
+  add_location(auth, "a", "eu-central-1")
+  auth.stubber("eu-west-2").add_client_error(
+    "get_bucket_tagging", "PermanentRedirect", "redirect", 301, {"Bucket": "a"}
+  )
+  auth.stubber("eu-central-1").add_response("get_bucket_tagging", {"TagSet": []}, {"Bucket": "a"})
+  engine = S3EnrichmentEngine(auth, "us-west-2", 2)
+
+  def tags(bucket):
+    return engine.bucket_call(
+      bucket["Name"],
+      lambda client, region: (region, engine.call(client, "get_bucket_tagging", Bucket="a")),
+    )
+
+  results = [f.result() for _, f in engine.enrich(buckets[:1], tags)]
+  assert [(region, resp["TagSet"]) for region, resp in results] == [("eu-central-1", [])]
+  assert engine._region_cache_stale.read() == 1
+  for stubber in auth.stubbers.values():
+    stubber.assert_no_pending_responses()
+  assert S3ApiLatency().histograms["get_bucket_tagging"].count.read() >= 2
+
+  # buckets that are no longer listed are dropped from the cache
+  engine = S3EnrichmentEngine(auth, "us-west-2", 2)
+  assert [f.result() for _, f in engine.enrich(buckets[:1], lambda b: b["Name"])] == ["a"]
+  assert list(S3EnrichmentEngine(auth, "us-west-2", 2).enrich([], lambda b: b)) == []
+  del ServerState().options["disk_cache_dir"]
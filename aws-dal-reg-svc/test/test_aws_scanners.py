@@ -0,0 +1,113 @@
+from datetime import datetime
+
+from util import CompletionQueue, ScanCheckpoint
+
+from aws_arn import Arn
+from aws_resource import Resource
+from aws_scanners import ResourceScanner
+from server_state import ServerState
+
+
+class MockMetastore:
+  observed = []
+
+  def key(self, arn: Arn) -> str:
+    return arn.arn
+
+  def set_observed(self, key: str):
+    self.observed.append(key)
+
+
+class MockClient:
+  def __init__(self, region: str):
+    self.region = region
+
+  def get_paginator(self, method: str):
+    return self
+
+  def paginate(self):
+    return [
+      {"TableNames": [f"{self.region}-a", f"{self.region}-b"]},
+      {"TableNames": [f"{self.region}-c"]},
+    ]
+
+
+class MockScanAuthenticator:
+  account_id = "123456789012"
+
+  def get_available_regions(self, service: str):
+    return ["af-south-1", "us-east-1", "us-west-2"]
+
+  def new_client(self, service: str, region: str):
+    return MockClient(region)
+
+  def new_session(self):
+    return self
+
+
+class MockStagestore:
+  def checkpoint(self, account_id: str):
+    return {"dynamodb/us-east-1", "s3/us-west-2"}
+
+
+class MockScanner(ResourceScanner):
+  def __init__(self, auth: MockScanAuthenticator):
+    self.entities_key = "TableNames"
+    self.scan_method = "list_tables"
+    self.service = "dynamodb"
+    super().__init__(auth.account_id, auth, CompletionQueue())
+
+  @property
+  def metastore(self) -> MockMetastore:
+    return MockMetastore()
+
+  def handler(self, client, region: str, resource_name: str) -> Resource:
+    arn = Arn(f"arn:aws:dynamodb:{region}:123456789012:table/{resource_name}")
+    return Resource(resource_name, arn, datetime.min, "ACTIVE", {})
+
+
+def test_resource_scanner_parallel_regions():
+  ServerState()
+  scanner = MockScanner(MockScanAuthenticator())
+  scanner.scan()
+
+  names = []
+  while True:
+    vals = scanner.snk.get_many(10)
+    if len(vals) == 0:
+      break
+    names.extend(r.arn.resource for r in vals)
+
+  # excluded regions are skipped and pages are emitted in listing order
+  assert sorted(names) == [
+    "us-east-1-a",
+    "us-east-1-b",
+    "us-east-1-c",
+    "us-west-2-a",
+    "us-west-2-b",
+    "us-west-2-c",
+  ]
+  assert names.index("us-east-1-a") < names.index("us-east-1-b") < names.index("us-east-1-c")
+  assert scanner.counter == 6
+  assert len(MockMetastore.observed) == 6
+  assert scanner.enrichment is None
+
+
+def test_resource_scanner_resumes_from_checkpoint():
+  ServerState(options={"stage_checkpoints": True}).set_stage_store(MockStagestore())
+  try:
+    scanner = MockScanner(MockScanAuthenticator())
+    scanner.scan()
+  finally:
+    ServerState().options["stage_checkpoints"] = False
+    ServerState().set_stage_store(None)
+
+  vals = scanner.snk.get_many(10)
+  names = [v.arn.resource for v in vals if not isinstance(v, ScanCheckpoint)]
+  units = [v.unit for v in vals if isinstance(v, ScanCheckpoint)]
+
+  # regions completed by the interrupted run are skipped, scanned regions are checkpointed
+  assert names == ["us-west-2-a", "us-west-2-b", "us-west-2-c"]
+  assert units == ["dynamodb/us-west-2"]
+  assert isinstance(vals[-1], ScanCheckpoint)
+  assert scanner._regions_resumed.read() == 1
@@ -0,0 +1,35 @@
+from aws_tagging import TagPrefetcher
+from conftest import MockAuthenticator
+from server_config import TAGGING_API_PAGE_SIZE
+
+
+def test_tag_prefetcher():
+  auth = MockAuthenticator("resourcegroupstaggingapi", "us-west-2")
+  params = {"ResourceTypeFilters": ["dynamodb:table"], "ResourcesPerPage": TAGGING_API_PAGE_SIZE}
+  table_arn = "arn:aws:dynamodb:us-west-2:123456789012:table/{}"
+  auth.add_response(
+    "get_resources",
+    {
+      "PaginationToken": "next",
+      "ResourceTagMappingList": [
+        {"ResourceARN": table_arn.format("a"), "Tags": [{"Key": "pdp_team", "Value": "a"}]},
+      ],
+    },
+    params,
+  )
+  auth.add_response(
+    "get_resources",
+    {"ResourceTagMappingList": [{"ResourceARN": table_arn.format("b"), "Tags": []}]},
+    {**params, "PaginationToken": "next"},
+  )
+  auth.activate()
+
+  prefetcher = TagPrefetcher(auth, "dynamodb:table")
+  tags = prefetcher.tags("us-west-2")
+  assert tags[table_arn.format("a")] == [{"Key": "pdp_team", "Value": "a"}]
+  assert tags[table_arn.format("b")] == []
+  assert table_arn.format("c") not in tags
+
+  # regions are only fetched once
+  assert prefetcher.tags("us-west-2") is tags
+  auth.stubber.assert_no_pending_responses()
@@ -3,6 +3,7 @@ from datetime import datetime
 import json
 
 from aws_arn import S3Arn
+from aws_iam import IamObservedAccess
 from aws_resource import Resource
 from com.twitter.dal.has_personal_data.ttypes import HasPersonalData
 from com.twitter.dal.model.ttypes import StorageType, URL
@@ -64,3 +65,24 @@ def test_dataset_has_personal_data():
 def test_dataset_project():
   experimental = Dataset(resource=experimental_resource, accesses=[])
   assert experimental.project() == "test"
+
+
+def test_dataset_fingerprint():
+  entity_arn = "arn:aws:iam::11111111:role/reader"
+  resource_arn = experimental_resource.arn.arn
+  experimental = Dataset(
+    resource=experimental_resource,
+    accesses=[IamObservedAccess(entity_arn, resource_arn, {"read", "write"})],
+  )
+  # fingerprints do not depend on the order of access levels
+  reordered = Dataset(
+    resource=experimental_resource,
+    accesses=[IamObservedAccess(entity_arn, resource_arn, frozenset(["write", "read"]))],
+  )
+  assert experimental.fingerprint() == reordered.fingerprint()
+
+  without_accesses = Dataset(resource=experimental_resource, accesses=[])
+  assert experimental.fingerprint() != without_accesses.fingerprint()
+
+  without_accesses.set_meta({"contains_pii": False})
+  assert without_accesses.fingerprint() != Dataset(experimental_resource, []).fingerprint()
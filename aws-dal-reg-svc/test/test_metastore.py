@@ -1,6 +1,22 @@
 from decimal import Decimal
 
-from dataset_metastore import should_set_init_field
+from datetime import datetime
+from time import time
+
+from aws_arn import Arn
+from aws_resource import Resource
+import boto3
+from botocore.stub import ANY, Stubber
+from dataset_inventory import Inventorystore, listing_hash
+from dataset_metastore import Metastore, MetastoreCache, should_set_init_field
+from dataset_stagestore import Stagestore
+from server_config import (
+  DYNAMO_METASTORE_TABLE_NAME,
+  DYNAMO_STAGES_TABLE_NAME,
+  DYNAMO_SVC_TABLE_REGION,
+  STAGE_CHECKPOINT_TTL,
+)
+from server_state import ServerState
 
 
 def test_should_set_init_field():
@@ -47,3 +63,390 @@ def test_should_set_init_field():
       'observed': Decimal('1623402707')
     })
   assert expected == actual
+
+
+class MockDynamoAuthenticator:
+  def __init__(self):
+    self.resource = boto3.resource("dynamodb", region_name=DYNAMO_SVC_TABLE_REGION)
+    self.stubber = Stubber(self.resource.meta.client)
+
+  def new_resource(self, service: str, region: str):
+    return self.resource
+
+
+def test_batch_get_regional_or_global():
+  auth = MockDynamoAuthenticator()
+  metastore = Metastore(auth)
+  table = DYNAMO_METASTORE_TABLE_NAME
+  keys = [
+    {"ID": "us-west-2/sqs/regional"},
+    {"ID": "sqs/regional"},
+    {"ID": "us-west-2/sqs/global"},
+    {"ID": "sqs/global"},
+  ]
+  auth.stubber.add_response(
+    "batch_get_item",
+    {
+      "Responses": {
+        table: [
+          {"ID": {"S": "us-west-2/sqs/regional"}, "project": {"S": "regional"}},
+          {"ID": {"S": "sqs/regional"}, "project": {"S": "global"}},
+        ]
+      },
+      "UnprocessedKeys": {table: {"Keys": [{"ID": {"S": "sqs/global"}}]}},
+    },
+    {"RequestItems": {table: {"Keys": keys}}},
+  )
+  auth.stubber.add_response(
+    "batch_get_item",
+    {"Responses": {table: [{"ID": {"S": "sqs/global"}, "registered": {"N": "1623402710"}}]}},
+    {"RequestItems": {table: {"Keys": [{"ID": "sqs/global"}]}}},
+  )
+  auth.stubber.activate()
+
+  regional = Arn("arn:aws:sqs:us-west-2:123456789012:regional")
+  global_ = Arn("arn:aws:sqs:us-west-2:123456789012:global")
+  records = metastore.batch_get_regional_or_global([regional, global_])
+  assert records[regional.arn]["project"] == "regional"
+  assert records[global_.arn]["registered"] == Decimal("1623402710")
+  auth.stubber.assert_no_pending_responses()
+
+
+def test_set_timestamps():
+  auth = MockDynamoAuthenticator()
+  metastore = Metastore(auth)
+  table = DYNAMO_METASTORE_TABLE_NAME
+  auth.stubber.add_response(
+    "update_item",
+    {},
+    {
+      "TableName": table,
+      "Key": {"ID": "sqs/existing"},
+      "ExpressionAttributeValues": {":v0": 100, ":v1": 200, ":v2": 200},
+      "UpdateExpression": "SET created_at = :v0, registered = :v1, init_registered = :v2",
+    },
+  )
+  auth.stubber.add_response(
+    "put_item",
+    {},
+    {
+      "TableName": table,
+      "Item": {"ID": "sqs/new", "created_at": 100, "registered": 200, "init_registered": 200},
+      "ConditionExpression": "attribute_not_exists(ID)",
+    },
+  )
+  auth.stubber.activate()
+
+  records = {"sqs/existing": {"ID": "sqs/existing", "observed": Decimal("50")}}
+  metastore.set_timestamps(
+    {
+      "sqs/existing": {"created_at": 100, "registered": 200},
+      "sqs/new": {"created_at": 100, "registered": 200},
+      "sqs/skipped": {},
+    },
+    records,
+  )
+  assert records["sqs/new"]["init_registered"] == 200
+  auth.stubber.assert_no_pending_responses()
+
+
+def test_set_timestamps_created_after_read():
+  auth = MockDynamoAuthenticator()
+  metastore = Metastore(auth)
+  table = DYNAMO_METASTORE_TABLE_NAME
+  # the record was created by another process after it was read as missing
+  auth.stubber.add_client_error(
+    "put_item",
+    "ConditionalCheckFailedException",
+    expected_params={
+      "TableName": table,
+      "Item": {"ID": "sqs/raced", "registered": 200, "init_registered": 200},
+      "ConditionExpression": "attribute_not_exists(ID)",
+    },
+  )
+  auth.stubber.add_response(
+    "get_item",
+    {
+      "Item": {
+        "ID": {"S": "sqs/raced"},
+        "annotations": {"L": [{"S": "UserId"}]},
+        "init_registered": {"N": "150"},
+      }
+    },
+    {"TableName": table, "Key": {"ID": "sqs/raced"}},
+  )
+  auth.stubber.add_response(
+    "update_item",
+    {},
+    {
+      "TableName": table,
+      "Key": {"ID": "sqs/raced"},
+      "ExpressionAttributeValues": {":v0": 200},
+      "UpdateExpression": "SET registered = :v0",
+    },
+  )
+  auth.stubber.activate()
+
+  records = {}
+  metastore.set_timestamps({"sqs/raced": {"registered": 200}}, records)
+  assert records["sqs/raced"] == {
+    "ID": "sqs/raced",
+    "annotations": ["UserId"],
+    "init_registered": Decimal("150"),
+    "registered": 200,
+  }
+  auth.stubber.assert_no_pending_responses()
+
+
+def test_set_timestamps_fingerprints():
+  auth = MockDynamoAuthenticator()
+  metastore = Metastore(auth)
+  table = DYNAMO_METASTORE_TABLE_NAME
+  # entries of an existing fingerprints map are updated in place
+  auth.stubber.add_response(
+    "update_item",
+    {},
+    {
+      "TableName": table,
+      "Key": {"ID": "sqs/mapped"},
+      "ExpressionAttributeNames": {"#fps": "registration_fingerprints", "#a0": "a", "#a1": "b"},
+      "ExpressionAttributeValues": {":v0": 200, ":f1": "fp-b"},
+      "UpdateExpression": "SET registered = :v0, #fps.#a1 = :f1 REMOVE #fps.#a0",
+    },
+  )
+  # a value that is not a map is replaced only if no other update created a map
+  auth.stubber.add_client_error(
+    "update_item",
+    "ConditionalCheckFailedException",
+    expected_params={
+      "TableName": table,
+      "Key": {"ID": "sqs/unmapped"},
+      "ConditionExpression": "attribute_not_exists(#fps) OR NOT attribute_type(#fps, :m)",
+      "ExpressionAttributeNames": {"#fps": "registration_fingerprints"},
+      "ExpressionAttributeValues": {":v0": 200, ":m": "M", ":fps": {"c": "fp-c"}},
+      "UpdateExpression": "SET registered = :v0, #fps = :fps",
+    },
+  )
+  auth.stubber.add_response(
+    "update_item",
+    {},
+    {
+      "TableName": table,
+      "Key": {"ID": "sqs/unmapped"},
+      "ExpressionAttributeNames": {"#fps": "registration_fingerprints", "#a0": "c"},
+      "ExpressionAttributeValues": {":v0": 200, ":f0": "fp-c"},
+      "UpdateExpression": "SET registered = :v0, #fps.#a0 = :f0",
+    },
+  )
+  auth.stubber.activate()
+
+  records = {
+    "sqs/mapped": {
+      "ID": "sqs/mapped",
+      "registered": 100,
+      "registration_fingerprints": {"a": "fp-a"},
+    },
+    "sqs/unmapped": {"ID": "sqs/unmapped", "registered": 100, "registration_fingerprints": 100},
+  }
+  metastore.set_timestamps(
+    {
+      "sqs/mapped": {"registered": 200, "registration_fingerprints": {"a": None, "b": "fp-b"}},
+      "sqs/unmapped": {"registered": 200, "registration_fingerprints": {"c": "fp-c"}},
+    },
+    records,
+  )
+  assert records["sqs/mapped"]["registration_fingerprints"] == {"b": "fp-b"}
+  assert records["sqs/unmapped"]["registration_fingerprints"] == {"c": "fp-c"}
+  auth.stubber.assert_no_pending_responses()
+
+
+def test_metastore_cache():
+  cache = MetastoreCache()
+  maxsize = cache.maxsize
+  cache.maxsize = 2
+  try:
+    cache.put("sqs/a", {"ID": "sqs/a"})
+    cache.put("sqs/b", None)
+    assert cache.get("sqs/a") == (True, {"ID": "sqs/a"})
+
+    # `sqs/a` was used more recently than `sqs/b`
+    cache.put("sqs/c", None)
+    assert cache.get("sqs/b") == (False, None)
+    assert cache.get("sqs/a")[0]
+    assert cache.get("sqs/c") == (True, None)
+  finally:
+    cache.maxsize = maxsize
+    cache.records.clear()
+
+
+def test_metastore_read_through_cache():
+  ServerState().options["metastore_cache"] = True
+  auth = MockDynamoAuthenticator()
+  metastore = Metastore(auth)
+  auth.stubber.add_response(
+    "get_item",
+    {"Item": {"ID": {"S": "sqs/cached"}, "observed": {"N": "50"}}},
+    {"TableName": DYNAMO_METASTORE_TABLE_NAME, "Key": {"ID": "sqs/cached"}},
+  )
+  auth.stubber.add_response(
+    "update_item",
+    {},
+    {
+      "TableName": DYNAMO_METASTORE_TABLE_NAME,
+      "Key": {"ID": "sqs/cached"},
+      "ExpressionAttributeValues": {":value": 100},
+      "UpdateExpression": "SET registered = :value, init_registered = :value",
+    },
+  )
+  auth.stubber.activate()
+
+  try:
+    assert metastore.get("sqs/cached") == {"ID": "sqs/cached", "observed": Decimal("50")}
+    metastore.set_timestamp("sqs/cached", "registered", 100)
+    assert metastore.batch_get(["sqs/cached"])["sqs/cached"]["init_registered"] == 100
+    auth.stubber.assert_no_pending_responses()
+  finally:
+    del ServerState().options["metastore_cache"]
+    MetastoreCache().records.clear()
+
+
+def test_metastore_cached_miss():
+  ServerState().options["metastore_cache"] = True
+  auth = MockDynamoAuthenticator()
+  metastore = Metastore(auth)
+  table = DYNAMO_METASTORE_TABLE_NAME
+  auth.stubber.add_client_error(
+    "put_item",
+    "ConditionalCheckFailedException",
+    expected_params={
+      "TableName": table,
+      "Item": {"ID": "sqs/stale", "observed": 100},
+      "ConditionExpression": "attribute_not_exists(ID)",
+    },
+  )
+  auth.stubber.add_response(
+    "get_item",
+    {"Item": {"ID": {"S": "sqs/stale"}, "schema": {"S": "s"}, "registered": {"N": "50"}}},
+    {"TableName": table, "Key": {"ID": "sqs/stale"}},
+  )
+  auth.stubber.add_response(
+    "update_item",
+    {},
+    {
+      "TableName": table,
+      "Key": {"ID": "sqs/stale"},
+      "ExpressionAttributeValues": {":value": 100},
+      "UpdateExpression": "SET observed = :value",
+    },
+  )
+  auth.stubber.activate()
+
+  try:
+    # the record was created by another process after its miss was cached
+    MetastoreCache().put("sqs/stale", None)
+    metastore.set_timestamp("sqs/stale", "observed", 100)
+    assert metastore.get("sqs/stale") == {
+      "ID": "sqs/stale",
+      "observed": 100,
+      "registered": Decimal("50"),
+      "schema": "s",
+    }
+    auth.stubber.assert_no_pending_responses()
+  finally:
+    del ServerState().options["metastore_cache"]
+    MetastoreCache().records.clear()
+
+
+def test_inventory_snapshot_resource():
+  inventory = Inventorystore(MockDynamoAuthenticator())
+  entry = {"Name": "bucket", "CreationDate": datetime(2021, 6, 11)}
+  resource = Resource(
+    "table",
+    Arn("arn:aws:dynamodb:us-west-2:123456789012:table/table"),
+    datetime(2021, 6, 11),
+    "ACTIVE",
+    {"Tags": []},
+  )
+  key = inventory.key("123456789012", "dynamodb", "us-west-2", "table")
+  record = inventory.record(key, listing_hash(entry), resource)
+  assert record["ID"] == "123456789012/dynamodb/us-west-2/table"
+  assert record["refresh_at"] > time()
+
+  assert inventory.snapshot_resource(record, listing_hash(entry)).arn.arn == resource.arn.arn
+  # changed listing entry
+  assert inventory.snapshot_resource(record, listing_hash({**entry, "Name": "other"})) is None
+  # missing and expired records
+  assert inventory.snapshot_resource(None, listing_hash(entry)) is None
+  assert inventory.snapshot_resource({**record, "refresh_at": int(time()) - 1}, listing_hash(entry)) is None
+
+
+def test_stagestore_checkpoint():
+  auth = MockDynamoAuthenticator()
+  stage_store = Stagestore(auth)
+  key = {"stage": "checkpoint", "account_id": "123456789012"}
+  auth.stubber.add_response(
+    "get_item",
+    {
+      "Item": {
+        "stage": {"S": "checkpoint"},
+        "account_id": {"S": "123456789012"},
+        "ts": {"N": str(int(time()))},
+        "units": {"SS": ["s3/us-west-2", "sqs/us-east-1"]},
+      }
+    },
+    {"TableName": DYNAMO_STAGES_TABLE_NAME, "Key": key},
+  )
+  # checkpoints older than the ttl belong to an earlier run
+  auth.stubber.add_response(
+    "get_item",
+    {
+      "Item": {
+        "stage": {"S": "checkpoint"},
+        "account_id": {"S": "123456789012"},
+        "ts": {"N": str(int(time()) - STAGE_CHECKPOINT_TTL - 60)},
+        "units": {"SS": ["s3/us-west-2"]},
+      }
+    },
+    {"TableName": DYNAMO_STAGES_TABLE_NAME, "Key": key},
+  )
+  auth.stubber.add_response("get_item", {}, {"TableName": DYNAMO_STAGES_TABLE_NAME, "Key": key})
+  auth.stubber.add_response("delete_item", {}, {"TableName": DYNAMO_STAGES_TABLE_NAME, "Key": key})
+  auth.stubber.activate()
+
+  assert stage_store.checkpoint("123456789012") == {"s3/us-west-2", "sqs/us-east-1"}
+  assert stage_store.checkpoint("123456789012") == set()
+  assert stage_store.checkpoint("123456789012") == set()
+  stage_store.delete_checkpoint("123456789012")
+  auth.stubber.assert_no_pending_responses()
+
+
+def test_stagestore_add_checkpoint():
+  auth = MockDynamoAuthenticator()
+  stage_store = Stagestore(auth)
+  key = {"stage": "checkpoint", "account_id": "123456789012"}
+  update = {
+    "TableName": DYNAMO_STAGES_TABLE_NAME,
+    "Key": key,
+    "UpdateExpression": "ADD #units :units SET #ts = if_not_exists(#ts, :ts), #expire = :expire",
+    "ConditionExpression": "attribute_not_exists(#ts) OR #ts > :stale",
+    "ExpressionAttributeNames": {"#expire": "expire", "#ts": "ts", "#units": "units"},
+    "ExpressionAttributeValues": {":expire": ANY, ":stale": ANY, ":ts": ANY, ":units": ANY},
+  }
+  auth.stubber.add_response("update_item", {}, update)
+  # the units of a stale checkpoint are replaced
+  auth.stubber.add_client_error(
+    "update_item", "ConditionalCheckFailedException", expected_params=update
+  )
+  auth.stubber.add_response(
+    "put_item",
+    {},
+    {
+      "TableName": DYNAMO_STAGES_TABLE_NAME,
+      "Item": {**key, "expire": ANY, "ts": ANY, "units": {"sqs/us-east-1"}},
+    },
+  )
+  auth.stubber.activate()
+
+  stage_store.add_checkpoint("123456789012", "s3/us-west-2")
+  stage_store.add_checkpoint("123456789012", "sqs/us-east-1")
+  auth.stubber.assert_no_pending_responses()
@@ -6,9 +6,11 @@ from aws_organizations import (
   get_account_tag,
   get_account_tags,
   get_accounts,
+  get_active_accounts,
   list_org_accounts,
   list_ou_accounts,
   list_policies_for_target,
+  load_account_metadata,
 )
 from server_state import ServerState
 
@@ -68,6 +70,52 @@ def test_get_account_tag(mock_org_auth):
   assert get_account_tag(mock_org_auth, "12345678910", "test_tag") == "test_string"
 
 
+def test_load_account_metadata(mock_org_auth, tmp_path):
+  response = {
+    "Accounts": [
+      {
+        "Id": "12345678910",
+        "Arn": "string",
+        "Email": "string",
+        "Name": "active account",
+        "Status": "ACTIVE",
+        "JoinedMethod": "CREATED",
+        "JoinedTimestamp": datetime(2015, 1, 1),
+      },
+      {
+        "Id": "34567891234",
+        "Arn": "testing-bad",
+        "Email": "testing-bad@testing.com",
+        "Name": "suspended account",
+        "Status": "SUSPENDED",
+        "JoinedMethod": "CREATED",
+        "JoinedTimestamp": datetime(2015, 1, 1),
+      },
+    ],
+  }
+  tags = {"Tags": [{"Key": "test_tag", "Value": "test_string"}]}
+  mock_org_auth.account_id = "171959851929"
+  mock_org_auth.add_response("list_accounts", response, {})
+  mock_org_auth.add_response("list_tags_for_resource", tags, {"ResourceId": "12345678910"})
+  mock_org_auth.activate()
+  ServerState().options["disk_cache_dir"] = str(tmp_path)
+
+  # tags are only fetched for active accounts
+  accounts = load_account_metadata(mock_org_auth)
+  assert accounts == {
+    "12345678910": {
+      "Name": "active account",
+      "Status": "ACTIVE",
+      "Tags": [{"Key": "test_tag", "Value": "test_string"}],
+    },
+    "34567891234": {"Name": "suspended account", "Status": "SUSPENDED", "Tags": []},
+  }
+  assert get_active_accounts(mock_org_auth) == ["12345678910"]
+  assert get_account_tag(mock_org_auth, "12345678910", "test_tag", accounts) == "test_string"
+  assert (tmp_path / "account_metadata_171959851929.json").exists()
+  del ServerState().options["disk_cache_dir"]
+
+
 def test_list_ou_accounts(mock_org_auth):
   response = {
     "Children": [
@@ -0,0 +1,42 @@
+from rate_limiter import GLOBAL_SCOPE, RateLimiter, TokenBucket
+from server_config import RATE_LIMIT_MAX_MULTIPLIER, RATE_LIMIT_MIN_MULTIPLIER
+
+
+def test_token_bucket_reserve():
+  bucket = TokenBucket(2.0)
+  assert bucket.reserve() == 0.0
+  assert bucket.reserve() == 0.0
+
+  # the bucket is empty, following reservations are spaced at the bucket rate
+  assert 0.4 < bucket.reserve() <= 0.5
+  assert 0.9 < bucket.reserve() <= 1.0
+
+
+def test_token_bucket_aimd():
+  bucket = TokenBucket(1.0, 0.25, 2.0)
+  bucket.decrease()
+  assert bucket.rate == 0.5
+  bucket.decrease()
+  bucket.decrease()
+  assert bucket.rate == 0.25
+
+  for _ in range(200):
+    bucket.increase()
+  assert bucket.rate == 2.0
+
+
+def test_rate_limiter_scopes():
+  limiter = RateLimiter({"test_api": {"account": 1.0, "global": 10.0, "adaptive": True}})
+  account_bucket, global_bucket = limiter.scoped_buckets("test_api", "123456789012")
+  assert account_bucket is limiter.bucket("test_api", "123456789012")
+  assert global_bucket is limiter.bucket("test_api", GLOBAL_SCOPE)
+  assert account_bucket.min_rate == RATE_LIMIT_MIN_MULTIPLIER
+  assert global_bucket.max_rate == 10.0 * RATE_LIMIT_MAX_MULTIPLIER
+
+  limiter.acquire("test_api", "123456789012")
+  limiter.throttled("test_api", "123456789012")
+  assert account_bucket.rate == 0.5
+  assert global_bucket.rate == 10.0
+
+  assert limiter.scoped_buckets("undefined_api", "123456789012") == []
+  limiter.acquire("undefined_api")
@@ -1,14 +1,30 @@
 from base64 import b64encode
 from datetime import datetime
+from threading import current_thread, Thread
+
+from util import ScanCheckpoint
 
 from aws_arn import Arn, S3Arn
 from aws_iam import IamObservedAccess
 from aws_resource import Resource
+import boto3
 from com.twitter.dal.properties.ttypes import LogicalDatasetPropertyKey
 from com.twitter.statebird.v2.thriftpython.ttypes import BatchApp, Environment
 from dataset import Dataset
 from dateutil.tz import tzutc
-from registration import annotations, app, cluster_name, has_annotations, records_classes
+import pytest
+import registration
+from registration import (
+  annotations,
+  app,
+  cluster_name,
+  DalClientPool,
+  has_annotations,
+  records_classes,
+  Registrar,
+  RegistrationEngine,
+)
+from server_config import DYNAMO_SVC_TABLE_REGION
 from server_state import ServerState
 
 
@@ -258,3 +274,166 @@ def test_cluster_name():
 
   s3_arn = S3Arn("archive.vine.co", "496113600437", "us-east-1")
   assert cluster_name(s3_arn) == "aws:us-east-1"
+
+
+class MockDynamoAuthenticator:
+  account_id = "123456789012"
+
+  def new_resource(self, service: str, region: str):
+    return boto3.resource(service, region_name=DYNAMO_SVC_TABLE_REGION)
+
+
+class MockStagestore:
+  def __init__(self):
+    self.deleted = []
+    self.units = []
+
+  def add_checkpoint(self, account_id: str, unit: str):
+    self.units.append((account_id, unit))
+
+  def delete_checkpoint(self, account_id: str):
+    self.deleted.append(account_id)
+
+
+def test_registrar_checkpoint():
+  stage_store = MockStagestore()
+  ServerState(options={"stage_checkpoints": True}).set_stage_store(stage_store)
+  try:
+    registrar = Registrar(MockDynamoAuthenticator())
+    registrar.register_datasets(ScanCheckpoint("123456789012", "s3/us-west-2"))
+    registrar.register_datasets(ScanCheckpoint("123456789012"))
+    assert stage_store.units == [("123456789012", "s3/us-west-2")]
+    assert stage_store.deleted == ["123456789012"]
+
+    # markers received after a dataset failed to register are dropped
+    registrar.register_datasets({None: []})
+    assert registrar.failed
+    registrar.register_datasets(ScanCheckpoint("123456789012", "sqs/us-east-1"))
+    registrar.register_datasets(ScanCheckpoint("123456789012"))
+    assert stage_store.units == [("123456789012", "s3/us-west-2")]
+    assert stage_store.deleted == ["123456789012"]
+  finally:
+    ServerState().options["stage_checkpoints"] = False
+    ServerState().set_stage_store(None)
+
+
+def test_dal_client_pool(monkeypatch):
+  connected = []
+
+  def connect():
+    connected.append(object())
+    return connected[-1]
+
+  monkeypatch.setattr(registration, "client", connect)
+  pool = DalClientPool(1)
+
+  # idle clients are reused
+  with pool.client() as first:
+    pass
+  with pool.client() as second:
+    pass
+  assert first is second
+  assert pool.connected == 1
+
+  # callers waiting for a client are woken when a failed client is dropped
+  waiter_clients = []
+
+  def waiter():
+    with pool.client() as dal_client:
+      waiter_clients.append(dal_client)
+
+  with pytest.raises(ValueError):
+    with pool.client():
+      thread = Thread(target=waiter, daemon=True)
+      thread.start()
+      thread.join(0.1)
+      assert thread.is_alive()
+      raise ValueError("broken connection")
+  thread.join(5)
+  assert not thread.is_alive()
+  assert waiter_clients == [connected[1]]
+  assert pool.connected == 1
+
+  # failed connection attempts release their slot
+  def connect_error():
+    raise ConnectionError()
+
+  pool = DalClientPool(1)
+  monkeypatch.setattr(registration, "client", connect_error)
+  with pytest.raises(ConnectionError):
+    with pool.client():
+      pass
+  monkeypatch.setattr(registration, "client", lambda: connected[0])
+  with pool.client() as dal_client:
+    assert dal_client is connected[0]
+  assert pool.connected == 1
+
+
+def test_registration_engine():
+  engine = RegistrationEngine()
+  assert engine is RegistrationEngine()
+  assert engine.dal_clients.read() == engine.clients.connected
+
+
+class MockMetastore:
+  timestamps = []
+
+  def __init__(self, auth):
+    pass
+
+  def batch_get(self, keys):
+    return {}
+
+  def key(self, arn: Arn) -> str:
+    return arn.arn
+
+  def regional_and_global_keys(self, arns):
+    return [a.arn for a in arns]
+
+  def select_regional_or_global(self, arn: Arn, records):
+    return {"ID": f"sqs/{arn.resource}", "project": "test"}
+
+  def set_timestamps(self, updates, records):
+    self.timestamps.append((current_thread().name, updates))
+
+
+class MockRegisterDatasetResponse:
+  class physicalDataset:
+    id = 1
+
+
+def test_registrar_register_datasets(monkeypatch):
+  dal_threads = []
+
+  def register_dataset(dataset: Dataset, dal_client):
+    dal_threads.append(current_thread().name)
+    if dataset.resource.name == "failed":
+      raise ConnectionError()
+    return MockRegisterDatasetResponse()
+
+  monkeypatch.setattr(registration, "client", object)
+  monkeypatch.setattr(registration, "register_dataset", register_dataset)
+  monkeypatch.setattr(registration, "Metastore", MockMetastore)
+  ServerState().options["dry_run"] = False
+  try:
+    registrar = Registrar(MockDynamoAuthenticator())
+    kite_roles = []
+    registrar.register_kite_role = lambda dataset: kite_roles.append(dataset.resource.name)
+    resources = {}
+    for name in ["a", "b", "failed"]:
+      arn = Arn(f"arn:aws:sqs:us-west-2:123456789012:{name}")
+      resources[Resource(name, arn, datetime.min, "ACTIVE", {})] = []
+    registrar.register_datasets(resources)
+    registrar.flush()
+  finally:
+    del ServerState().options["dry_run"]
+
+  # DAL calls run on the engine pool, timestamps and Kite roles are written after the batch
+  assert len(dal_threads) == 3
+  assert all(name.startswith("dal-registration") for name in dal_threads)
+  assert sorted(kite_roles) == ["a", "b"]
+  assert registrar.failed
+  assert len(MockMetastore.timestamps) == 1
+  thread_name, updates = MockMetastore.timestamps[0]
+  assert thread_name.startswith("registration-post")
+  assert {arn.split(":")[-1] for arn, ts in updates.items() if "refresh_at" in ts} == {"a", "b"}
@@ -0,0 +1,41 @@
+import concurrent.futures
+
+import pytest
+import retry_scheduler
+from retry_scheduler import RetryScheduler
+
+
+class Throttled(Exception):
+  pass
+
+
+def test_retry_scheduler(monkeypatch, mock_gauge):
+  monkeypatch.setattr(retry_scheduler, "retry_delay", lambda attempt: 0.05)
+  work_gauge = mock_gauge()
+  wait_gauge = mock_gauge()
+  calls = []
+
+  def fn(name: str, failures: int):
+    calls.append(name)
+    if calls.count(name) <= failures:
+      raise Throttled(name)
+    return name
+
+  def retryable(ex: Exception) -> bool:
+    return isinstance(ex, Throttled)
+
+  with concurrent.futures.ThreadPoolExecutor(max_workers=1) as ex:
+    args = (ex, retryable, 2, work_gauge, wait_gauge, fn)
+    throttled = RetryScheduler().submit(*args, "throttled", 2)
+    ok = RetryScheduler().submit(*args, "ok", 0)
+    failed = RetryScheduler().submit(*args, "failed", 3)
+
+    assert ok.result(5) == "ok"
+    assert throttled.result(5) == "throttled"
+    with pytest.raises(Throttled):
+      failed.result(5)
+
+  # the worker runs other calls while throttled calls wait for their retry
+  assert calls.index("ok") < calls.index("throttled", 1)
+  assert calls.count("failed") == 3
+  assert wait_gauge.value >= 4 * 50
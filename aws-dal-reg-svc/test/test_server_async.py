@@ -0,0 +1,99 @@
+import asyncio
+from threading import current_thread, Thread
+
+import server_async
+from server_async import AsyncCompletionQueue, AsyncPipelineRunner, ThreadSafeQueueSink
+from server_state import ServerState
+
+
+def test_async_completion_queue_get_many():
+  async def run():
+    q = AsyncCompletionQueue("test_queue", 10)
+    await q.put_many([1, 2, 3])
+    assert await q.get_many(2) == [1, 2]
+
+    await q.put(4)
+    await q.set_completed()
+    assert await q.get_many(10, 10) == [3, 4]
+    assert await q.get_many(10) == []
+
+  asyncio.run(run())
+
+
+def test_async_completion_queue_thread_safe_sink():
+  async def run():
+    q = AsyncCompletionQueue("test_queue", 2)
+    sink = ThreadSafeQueueSink(q)
+    producer = Thread(target=sink.put_many, args=([1, 2, 3, 4],))
+    producer.start()
+
+    vals = []
+    while len(vals) < 4:
+      vals.extend(await q.get_many(10))
+    await asyncio.get_event_loop().run_in_executor(None, producer.join)
+    return vals
+
+  assert asyncio.run(run()) == [1, 2, 3, 4]
+
+
+def test_async_pipeline_runner_stages():
+  ServerState()
+  processed = []
+
+  async def pipeline(runner: AsyncPipelineRunner, account_id: str):
+    src = AsyncCompletionQueue("test_queue")
+    snk = AsyncCompletionQueue("test_queue")
+
+    async def produce():
+      await src.put_many(list(range(5)))
+      await src.set_completed()
+
+    async def process(vals):
+      doubled = await runner.call("dynamodb", lambda: [v * 2 for v in vals])
+      await snk.put_many(doubled)
+
+    async def consume(vals):
+      processed.extend(vals)
+
+    await asyncio.gather(
+      produce(),
+      runner.process_queue(src, process, f"{account_id}.filter", snk.set_completed),
+      runner.process_queue(snk, consume, f"{account_id}.registration"),
+    )
+
+  AsyncPipelineRunner({"dynamodb": 2}).run(pipeline, ["123456789012"])
+
+  assert sorted(processed) == [0, 2, 4, 6, 8]
+  assert "123456789012.filter" not in ServerState().stages
+  assert "stage_123456789012.registration_completed" in ServerState().meta
+
+
+def test_async_pipeline_runner_timeout(monkeypatch):
+  monkeypatch.setitem(server_async.FUTURE_TIMEOUTS, "main", 0.2)
+  producers = []
+  errors = []
+
+  async def pipeline(runner: AsyncPipelineRunner, account_id: str):
+    # nothing consumes the queue, the producer thread blocks once it is full
+    sink = ThreadSafeQueueSink(AsyncCompletionQueue("test_queue", 1))
+
+    def produce():
+      producers.append(current_thread())
+      sink.put_many([1, 2, 3])
+
+    await runner.call("scan", produce)
+
+  def run():
+    try:
+      AsyncPipelineRunner({"scan": 1}).run(pipeline, ["123456789012"])
+    except BaseException as ex:
+      errors.append(ex)
+
+  runner_thread = Thread(target=run, daemon=True)
+  runner_thread.start()
+  runner_thread.join(10)
+  assert not runner_thread.is_alive()
+  assert isinstance(errors[0], asyncio.TimeoutError)
+  # blocked sink puts are cancelled with the pipelines
+  producers[0].join(10)
+  assert not producers[0].is_alive()
@@ -0,0 +1,48 @@
+from time import monotonic
+
+from server_progress import ProgressTracker, TimerWheel
+
+
+def test_timer_wheel_expire():
+  wheel = TimerWheel(10, 4, now=0)
+  wheel.schedule("a", 15)
+  wheel.schedule("b", 25)
+  # deadlines beyond the span of the wheel wait for the rotation of their deadline
+  wheel.schedule("c", 55)
+  assert wheel.expire(12) == []
+  assert wheel.expire(20) == ["a"]
+
+  # scheduling a key again replaces its deadline
+  wheel.schedule("b", 35)
+  assert wheel.expire(30) == []
+  assert wheel.expire(48) == ["b"]
+  assert wheel.expire(100) == ["c"]
+
+  wheel.schedule("d", 50)
+  wheel.cancel("d")
+  assert wheel.expire(200) == []
+  assert wheel.scheduled == {}
+
+
+def test_progress_tracker():
+  tracker = ProgressTracker()
+  completed = tracker.snapshot().completed
+  tracker.start("111111111111.scan", 30)
+  tracker.start("111111111111.filter", 60)
+  tracker.advance("111111111111.scan", 5)
+  tracker.advance("111111111111.unknown")
+
+  snapshot = tracker.snapshot()
+  stages = {p.stage: p for p in snapshot.stages}
+  assert stages["111111111111.scan"].count == 5
+  assert stages["111111111111.filter"].count == 0
+
+  # only stages past their deadline are stalled, and reported again after another timeout
+  assert tracker.stalled(monotonic() + 10) == []
+  assert [p.stage for p in tracker.stalled(monotonic() + 40)] == ["111111111111.scan"]
+  assert tracker.stalled(monotonic() + 45) == []
+
+  tracker.complete("111111111111.scan")
+  tracker.complete("111111111111.filter")
+  assert tracker.stalled(monotonic() + 1000) == []
+  assert tracker.snapshot().counters()["completed_stages"] == completed + 2
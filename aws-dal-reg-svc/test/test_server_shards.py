@@ -0,0 +1,38 @@
+from multiprocessing.connection import Connection
+import os
+
+from server_shards import HashRing, shard_accounts, ShardSupervisor, worker_shards
+
+
+ACCOUNTS = [str(100000000000 + i * 7919) for i in range(400)]
+
+
+def test_shard_accounts():
+  shards = [shard_accounts(ACCOUNTS, i, 4) for i in range(4)]
+  # every account is processed by exactly one shard
+  assert sorted(a for accounts in shards for a in accounts) == sorted(ACCOUNTS)
+  assert all(len(accounts) > 50 for accounts in shards)
+  assert shard_accounts(ACCOUNTS, 0, 1) == ACCOUNTS
+
+  # adding a shard only moves accounts to the new shard
+  ring, grown = HashRing(4), HashRing(5)
+  moved = [a for a in ACCOUNTS if ring.shard(a) != grown.shard(a)]
+  assert all(grown.shard(a) == 4 for a in moved)
+  assert len(moved) < len(ACCOUNTS) / 3
+
+
+def test_worker_shards():
+  assert worker_shards(0, 1, 4) == ([0, 1, 2, 3], 4)
+  assert worker_shards(2, 3, 2) == ([4, 5], 6)
+
+
+def test_shard_supervisor():
+  def run(shard: int, progress: Connection):
+    progress.send({"active_stages": 0, "completed_stages": shard + 1})
+    if shard == 2:
+      os._exit(75)
+
+  supervisor = ShardSupervisor([0, 1, 2], run)
+  supervisor.start()
+  assert supervisor.wait() == 75
+  assert supervisor.summary(0) == "shard progress: workers=0/3 active_stages=0 completed_stages=6"
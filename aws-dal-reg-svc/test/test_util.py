@@ -1,4 +1,20 @@
-from util import jitter_ttl, response_tags, tag_value
+import os
+from threading import Thread
+from time import time
+
+from util import (
+  batch_process_completion_queue_with_snk,
+  BoundedCompletionQueue,
+  CompletionQueue,
+  GaugeHistogram,
+  jitter_ttl,
+  process_completion_queue,
+  read_json_cache,
+  response_tags,
+  ScanCheckpoint,
+  tag_value,
+  write_json_cache,
+)
 
 
 def test_jitter_ttl():
@@ -7,6 +23,27 @@ def test_jitter_ttl():
   assert jitter_ttl(ttl, 0.25) >= 64800
 
 
+def test_gauge_histogram():
+  histogram = GaugeHistogram("pages", [1, 2, 5])
+  for value in (1, 2, 2, 7):
+    histogram.observe(value)
+  assert [b.read() for b in histogram.buckets] == [1, 3, 3]
+  assert histogram.count.read() == 4
+  assert histogram.sum.read() == 12
+
+
+def test_json_cache(tmp_path):
+  path = str(tmp_path / "cache" / "value.json")
+  assert read_json_cache(path, 60) is None
+
+  write_json_cache(path, {"a": [1, 2]})
+  assert read_json_cache(path, 60) == {"a": [1, 2]}
+
+  # expired entries are ignored
+  os.utime(path, (time() - 120, time() - 120))
+  assert read_json_cache(path, 60) is None
+
+
 def test_response_tags():
   response = {
     "Tags": [
@@ -49,3 +86,78 @@ def test_tag_value():
   expected = None
   actual = tag_value([], "")
   assert expected == actual
+
+
+def test_completion_queue_get_many():
+  q = CompletionQueue()
+  q.put_many([1, 2, 3])
+  assert q.get_many(2) == [1, 2]
+  assert q.get_many(2) == [3]
+  assert q.get_many(2, timeout=0) == []
+
+  q.put(4)
+  q.set_completed()
+  assert q.get_many(10) == [4]
+  assert q.get_many(10) == []
+
+
+def test_completion_queue_wakes_consumer_on_completion():
+  q = CompletionQueue()
+  processed = []
+  consumer = Thread(target=process_completion_queue, args=(q, processed.append))
+  consumer.start()
+  q.put_many(["a", "b"])
+  q.set_completed()
+  consumer.join(timeout=5)
+
+  assert not consumer.is_alive()
+  assert processed == ["a", "b"]
+
+
+def test_bounded_completion_queue_backpressure():
+  q = BoundedCompletionQueue("test_queue", 2)
+  producer = Thread(target=q.put_many, args=([1, 2, 3, 4],))
+  producer.start()
+  producer.join(timeout=0.2)
+  assert producer.is_alive()
+  assert q.qsize() == 2
+
+  assert q.get_many(10) == [1, 2]
+  producer.join(timeout=5)
+  assert not producer.is_alive()
+  assert q.get_many(10) == [3, 4]
+
+
+def test_bounded_completion_queue_abandoned():
+  q = BoundedCompletionQueue("test_queue", 1)
+  producer = Thread(target=q.put_many, args=([1, 2, 3],))
+  producer.start()
+  q.set_abandoned()
+  producer.join(timeout=5)
+
+  assert not producer.is_alive()
+  assert q.get_many(10) == []
+
+
+def test_batch_process_forwards_checkpoints_after_batches():
+  src = CompletionQueue()
+  snk = CompletionQueue()
+  first, second = ScanCheckpoint("1", "s3/us-west-2"), ScanCheckpoint("1")
+  src.put_many([1, 2, first, 3, second])
+  src.set_completed()
+  batch_process_completion_queue_with_snk(2, src, snk, sum)
+
+  # markers follow the batches of every value received before them
+  assert snk.get_many(10, timeout=0) == [3, 3, first, second]
+
+
+def test_batch_process_drops_checkpoints_after_skipped_batch():
+  src = CompletionQueue()
+  snk = CompletionQueue()
+  src.put_many([1, 2, 0, ScanCheckpoint("1", "sqs/us-east-1"), 3, ScanCheckpoint("1")])
+  src.set_completed()
+  # batches with a zero value are skipped
+  batch_process_completion_queue_with_snk(2, src, snk, lambda b: sum(b) if all(b) else None)
+
+  # markers held with the skipped batch and received after it are dropped
+  assert snk.get_many(10, timeout=0) == [3]
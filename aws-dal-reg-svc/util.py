@@ -6,27 +6,182 @@ import queue
 from random import randrange, uniform
 from subprocess import run
 from threading import Event
-from time import sleep, time
+from time import monotonic, sleep, time
 from typing import Any, Callable, Dict, List, Optional
 
 from twitter.common import log
+from twitter.common.metrics import AtomicGauge, LambdaGauge
+from twitter.common.metrics.metrics import Metrics
 
-from server_config import TSS_PATH
+from server_config import DISK_CACHE_DIR, STAGE_QUEUE_BATCH_SIZE, STAGE_QUEUE_CAPACITY, TSS_PATH
+from server_progress import ProgressTracker
 from server_state import ServerState
 from urllib3 import ProxyManager
 
 
 class CompletionQueue(queue.Queue):
   def __init__(self, maxsize=0):
+    self.abandoned = Event()
     self.completed = Event()
     super().__init__(maxsize)
 
+  def set_abandoned(self):
+    # called by consumers that stop processing before the queue completes. queued and
+    # future values are dropped so producers blocked on a full queue are released.
+    self.abandoned.set()
+    with self.mutex:
+      self.queue.clear()
+      self.not_full.notify_all()
+      self.not_empty.notify_all()
+
   def set_completed(self):
     self.completed.set()
+    with self.mutex:
+      self.not_empty.notify_all()
+
+  def get_many(self, max_items: int, timeout: float = None) -> List[Any]:
+    """
+    Block until at least one value is available and return up to `max_items` values. An empty
+    list is returned once the queue is completed and drained, or when the timeout expires.
+    """
+    start_time = monotonic()
+    with self.not_empty:
+      while not self._qsize():
+        if self.completed.is_set() or self.abandoned.is_set():
+          return []
+        remaining = None
+        if timeout is not None:
+          remaining = timeout - (monotonic() - start_time)
+          if remaining <= 0:
+            return []
+        self.not_empty.wait(remaining)
+
+      vals = []
+      while self._qsize() and len(vals) < max_items:
+        vals.append(self._get())
+      self.not_full.notify_all()
+
+    self.record_wait("get", monotonic() - start_time)
+    return vals
+
+  def put(self, item: Any, block: bool = True, timeout: float = None):
+    self.put_many([item], block, timeout)
+
+  def put_many(self, items: List[Any], block: bool = True, timeout: float = None):
+    start_time = monotonic()
+    with self.not_full:
+      for item in items:
+        if self.abandoned.is_set():
+          return
+        if self.maxsize > 0:
+          while self._qsize() >= self.maxsize and not self.abandoned.is_set():
+            if not block:
+              raise queue.Full
+            remaining = None
+            if timeout is not None:
+              remaining = timeout - (monotonic() - start_time)
+              if remaining <= 0:
+                raise queue.Full
+            self.not_full.wait(remaining)
+          if self.abandoned.is_set():
+            return
+        self._put(item)
+        self.unfinished_tasks += 1
+        self.not_empty.notify()
+
+    self.record_wait("put", monotonic() - start_time)
+
+  def record_wait(self, op: str, seconds: float):
+    pass
+
+
+class GaugeHistogram:
+  """
+  Histogram published as cumulative `AtomicGauge` bucket counts, `{name}_le_{bound}` counts the
+  observed values less than or equal to `bound`, plus count and sum gauges.
+  """
+
+  def __init__(self, name: str, bounds: List[int]):
+    self.bounds = bounds
+    self.buckets = [AtomicGauge(f"{name}_le_{b}") for b in bounds]
+    self.count = AtomicGauge(f"{name}_count")
+    self.sum = AtomicGauge(f"{name}_sum")
+
+  def observe(self, value: int):
+    for bound, bucket in zip(self.bounds, self.buckets):
+      if value <= bound:
+        bucket.increment()
+    self.count.increment()
+    self.sum.add(value)
+
+  def register(self, metrics: Metrics):
+    for gauge in self.buckets + [self.count, self.sum]:
+      metrics.register(gauge)
+
+
+class QueueGauges:
+  """
+  Depth and wait time gauges for a queue between pipeline stages.
+  """
+
+  def __init__(self, name: str, depth: Callable[[], int]):
+    self.depth = LambdaGauge(f"{name}_depth", depth)
+    self.get_wait_ms = AtomicGauge(f"{name}_get_wait_ms")
+    self.put_wait_ms = AtomicGauge(f"{name}_put_wait_ms")
+
+  def record_wait(self, op: str, seconds: float):
+    ms = int(seconds * 1000)
+    if ms > 0:
+      if op == "get":
+        self.get_wait_ms.add(ms)
+      else:
+        self.put_wait_ms.add(ms)
+
+  def register(self, metrics: Metrics):
+    for gauge in (self.depth, self.get_wait_ms, self.put_wait_ms):
+      metrics.register(gauge)
+
+
+class ScanCheckpoint:
+  """
+  Marker emitted by a scanner once every resource of a scan `unit` has been emitted. Markers are
+  forwarded by every stage after the values that preceded them so the registration stage only
+  persists a unit once its datasets have been registered. A marker without a unit is emitted once
+  the account scan completes.
+  """
+
+  def __init__(self, account_id: str, unit: str = None):
+    self.account_id = account_id
+    self.unit = unit
+
+  def __repr__(self) -> str:
+    return f"ScanCheckpoint(account_id={self.account_id}, unit={self.unit})"
+
+
+def stage_queue_capacity() -> int:
+  return int(ServerState().options.get("stage_queue_capacity") or STAGE_QUEUE_CAPACITY)
+
+
+class BoundedCompletionQueue(CompletionQueue):
+  """
+  Completion queue with a fixed capacity used between pipeline stages. Producers block when the
+  queue is full which applies backpressure to upstream stages.
+  """
+
+  def __init__(self, name: str, maxsize: int = None):
+    super().__init__(maxsize if maxsize is not None else stage_queue_capacity())
+    self.name = name
+    self.gauges = QueueGauges(name, self.qsize)
+
+  def record_wait(self, op: str, seconds: float):
+    self.gauges.record_wait(op, seconds)
+
+  def register_metrics(self, metrics: Metrics):
+    self.gauges.register(metrics)
 
 
 def copy_completion_queue(src: CompletionQueue, snk: CompletionQueue, stage: str = None):
-  process_completion_queue(src, snk.put, stage=stage)
+  process_completion_queue(src, snk.put_many, stage=stage, batch_size=STAGE_QUEUE_BATCH_SIZE)
 
 
 def process_completion_queue(
@@ -36,19 +191,30 @@ def process_completion_queue(
   break_on_empty: bool = False,
   completion_callback: Callable = None,
   stage: str = None,
+  batch_size: int = None,
 ):
+  """
+  Apply `fn` to every value in `src` until the queue is completed and drained. When
+  `batch_size` is set `fn` is called with lists of up to `batch_size` values.
+  """
   try:
-    while not ((break_on_empty or src.completed.is_set()) and src.empty()):
-      try:
-        val = src.get(timeout=0.1)
-        if stage and stage not in ServerState().stages:
-          ServerState().start_stage(stage)
+    while True:
+      vals = src.get_many(batch_size or STAGE_QUEUE_BATCH_SIZE, 0 if break_on_empty else None)
+      if len(vals) == 0:
+        break
+      if stage and stage not in ServerState().stages:
+        ServerState().start_stage(stage)
 
-        fn(val, **args)
-      except queue.Empty:
-        pass
+      if batch_size:
+        fn(vals, **args)
+      else:
+        for val in vals:
+          fn(val, **args)
+      if stage:
+        ProgressTracker().advance(stage, len(vals))
   except Exception as ex:
     log.exception(f"`process_completion_queue` exception: {ex}")
+    src.set_abandoned()
     raise ex
   finally:
     if completion_callback:
@@ -70,26 +236,51 @@ def batch_process_completion_queue_with_snk(
   completion_callback: Callable = None,
   stage: str = None,
 ):
+  """
+  Apply `fn` to batches of up to `batch_size` values of `src` and put the results to `snk`. `fn`
+  returns `None` for batches it skipped, their results are not put to `snk`.
+  """
   batch = []
+  # checkpoint markers are held until the values received before them have been processed and
+  # are dropped once a batch is skipped, the units of its values are not checkpointed.
+  checkpoints = []
+  skipped = False
+
+  def process(batch: List[Any]):
+    nonlocal skipped
+    result = fn(batch, **args)
+    if result is None:
+      skipped = True
+    else:
+      snk.put(result)
+    if stage:
+      ProgressTracker().advance(stage, len(batch))
+
   try:
-    while not (src.completed.is_set() and src.empty()):
-      if batch_size > len(batch):
-        try:
-          val = src.get(timeout=0.1)
-          if stage and stage not in ServerState().stages:
-            ServerState().start_stage(stage)
-
-          batch.append(val)
-        except queue.Empty:
-          pass
-      else:
-        snk.put(fn(batch, **args))
+    while True:
+      vals = src.get_many(batch_size - len(batch))
+      if len(vals) == 0:
+        break
+      if stage and stage not in ServerState().stages:
+        ServerState().start_stage(stage)
+
+      for val in vals:
+        (checkpoints if isinstance(val, ScanCheckpoint) else batch).append(val)
+      if len(batch) >= batch_size:
+        process(batch)
         batch = []
+      if len(batch) == 0 and len(checkpoints) > 0:
+        if not skipped:
+          snk.put_many(checkpoints)
+        checkpoints = []
 
     if len(batch) > 0:
-      snk.put(fn(batch, **args))
+      process(batch)
+    if len(checkpoints) > 0 and not skipped:
+      snk.put_many(checkpoints)
   except Exception as ex:
     log.exception(f"`batch_process_completion_queue_with_snk` exception: {ex}")
+    src.set_abandoned()
     raise ex
   finally:
     if completion_callback:
@@ -102,6 +293,10 @@ def current_ms_time() -> int:
   return int(round(time() * 1000))
 
 
+def disk_cache_path(name: str) -> str:
+  return os.path.join(ServerState().options.get("disk_cache_dir") or DISK_CACHE_DIR, name)
+
+
 def fatal(msg: str):
   log.fatal(msg)
   raise Exception(msg)
@@ -131,10 +326,20 @@ def jitter_ttl(ttl: int, ratio: float = 0.25) -> int:
   return randrange(min_val, ttl)
 
 
-def rate_limit(limit_intvl: float, start_time: float):
-  elapsed_time = time() - start_time
-  if limit_intvl > elapsed_time:
-    sleep(limit_intvl - elapsed_time)
+def read_json_cache(path: str, ttl: int) -> Optional[Any]:
+  """
+  Return the value cached in `path` if it was written less than `ttl` seconds ago.
+  """
+  if not os.path.exists(path):
+    return None
+
+  try:
+    if time() - os.path.getmtime(path) < ttl:
+      with open(path) as f:
+        return json.loads(f.read())
+  except (OSError, ValueError) as ex:
+    log.warn(f"unable to read cache file: {path}. err={ex}")
+  return None
 
 
 def relative_time_range_hours_ago(n):
@@ -181,3 +386,15 @@ def terminate_envoy_sidecar(proxy_url):
       "kill $(ps -eo user:50,pid,cmd | grep 'aws-dal-registration-svc.*[.]/envoy' | awk '{ print $2 }')",
       shell=True,
     )
+
+
+def write_json_cache(path: str, value: Any):
+  try:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # the file is replaced atomically so concurrent readers never load a partial write
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+      f.write(json.dumps(value))
+    os.replace(tmp_path, path)
+  except OSError as ex:
+    log.warn(f"unable to write cache file: {path}. err={ex}")